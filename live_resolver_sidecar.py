@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+live_resolver_sidecar.py
+Processo long-lived per vavoo_resolver.py e tvtap_resolver.py.
+
+addon.ts lanciava un interprete per ogni stream live (import di requests,
+import chiave RSA TVTap, handshake TLS nuovi). Con --serve questo processo
+resta vivo su un unix socket, importa i due resolver una volta sola e ne
+riusa cache e connessioni. Protocollo: una riga JSON per richiesta, una riga
+JSON per risposta.
+
+Richiesta:  {"op": "cli", "provider": "vavoo"|"tvtap", "argv": [...]}
+            {"op": "vavoo_resolve", "input": "<nome o link>"}
+            {"op": "vavoo_lookup", "name": "..."}     -> link vavoo non risolto
+            {"op": "vavoo_dump"}                      -> come --dump-channels
+            {"op": "vavoo_prewarm"}                   -> come --prewarm
+            {"op": "vavoo_mirrors"}                   -> come --mirrors
+            {"op": "tvtap_resolve", "input": "<nome o tvtap_id:N>"}
+            {"op": "tvtap_lookup", "name": "..."}     -> come --find-channel
+            {"op": "tvtap_stream", "id": "..."}       -> come --resolve-stream
+            {"op": "tvtap_dump"}                      -> come --dump-channels
+            {"op": "ping"}
+Risposta:   {"ok": exit_code == 0, "code": N, "stdout": "...", "stderr": "..."}
+            stdout/stderr/code sono quelli che avrebbe prodotto la CLI.
+Streaming:  {"op": "cli", ..., "stream": true} -> prima zero o piu' righe
+            {"line": "..."} (es. --dump-channels --ndjson), poi la risposta
+            finale come sopra (riconoscibile dalla chiave "code").
+
+Le CLI restano utilizzabili: se il socket risponde fanno da client sottile
+(cli_via_sidecar), altrimenti eseguono tutto in locale come prima.
+
+Con --serve gira anche il pre-warm Vavoo degli eventi di Live.py
+(vavoo_resolver.prewarm_loop), disattivabile con VAVOO_PREWARM=0.
+
+Uso: python3 live_resolver_sidecar.py --serve [socket]
+Env: LIVE_RESOLVER_SOCKET (default /tmp/live_resolver.sock),
+     LIVE_RESOLVER_SIDECAR=0 per disattivare il client nelle CLI,
+     VAVOO_PREWARM=0 per disattivare il pre-warm.
+"""
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+SOCKET_PATH = os.environ.get('LIVE_RESOLVER_SOCKET', '/tmp/live_resolver.sock')
+CLIENT_TIMEOUT = float(os.environ.get('LIVE_RESOLVER_CLIENT_TIMEOUT', '60'))
+# Exit code di --serve quando il socket e' gia' servito da un altro sidecar
+# (es. orfano di un processo Node precedente): il chiamante non deve riavviare.
+ALREADY_RUNNING_EXIT = 3
+# Flag che girano solo in locale (scrivono file / sono gia' processi figli).
+_LOCAL_ONLY_FLAGS = ('--build-cache', '--refresh-sig')
+_PROVIDER_MODULES = {'vavoo': 'vavoo_resolver', 'tvtap': 'tvtap_resolver'}
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Client (usato dalle CLI)
+# ---------------------------------------------------------------------------
+
+def call(req, timeout=CLIENT_TIMEOUT, on_line=None):
+    """Una richiesta al sidecar. None = sidecar non raggiungibile.
+    Con on_line le righe {"line": ...} in streaming vengono passate a
+    on_line(str) e si ritorna la risposta finale."""
+    if not os.path.exists(SOCKET_PATH):
+        return None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        return None
+    try:
+        sock.sendall((json.dumps(req) + '\n').encode('utf-8'))
+        buf = b''
+        while True:
+            while b'\n' not in buf:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return None
+                buf += chunk
+            raw, buf = buf.split(b'\n', 1)
+            msg = json.loads(raw.decode('utf-8'))
+            if on_line is not None and 'line' in msg and 'code' not in msg:
+                on_line(msg['line'])
+                continue
+            return msg
+    except Exception:
+        return None
+    finally:
+        sock.close()
+
+
+def cli_via_sidecar(provider, argv):
+    """Se il sidecar risponde stampa il suo output ed esce; altrimenti ritorna."""
+    if os.environ.get('LIVE_RESOLVER_SIDECAR') == '0':
+        return
+    if any(flag in argv for flag in _LOCAL_ONLY_FLAGS):
+        return
+    req = {'op': 'cli', 'provider': provider, 'argv': list(argv)}
+    if '--ndjson' in argv:
+        # Righe stampate man mano: se il sidecar cade a meta' non si puo'
+        # ripartire in locale senza duplicarle, quindi si esce con errore.
+        req['stream'] = True
+        streamed = []
+
+        def _print_line(line):
+            streamed.append(1)
+            print(line, flush=True)
+        out = call(req, on_line=_print_line)
+        if (not out or 'code' not in out) and streamed:
+            sys.exit(1)
+    else:
+        out = call(req)
+    if not out or 'code' not in out:
+        return
+    if out.get('stdout'):
+        print(out['stdout'])
+    if out.get('stderr'):
+        print(out['stderr'], file=sys.stderr)
+    sys.exit(int(out['code']))
+
+
+# ---------------------------------------------------------------------------
+# Server (--serve)
+# ---------------------------------------------------------------------------
+
+def _provider(name):
+    mod_name = _PROVIDER_MODULES.get(name)
+    if not mod_name:
+        raise ValueError(f'unknown provider: {name}')
+    with _modules_lock:
+        if name not in _modules:
+            _modules[name] = importlib.import_module(mod_name)
+        return _modules[name]
+
+
+def _run_cli(provider, argv, emit=None):
+    mod = _provider(provider)
+    argv = [str(a) for a in argv]
+    if emit is not None:
+        code, out, err = mod.cli_main(argv, emit=emit)
+    else:
+        code, out, err = mod.cli_main(argv)
+    return {'ok': code == 0, 'code': code, 'stdout': out or '', 'stderr': err or ''}
+
+
+def _dispatch(req, emit=None):
+    op = req.get('op')
+    if op == 'ping':
+        return {'ok': True, 'pid': os.getpid()}
+    if op == 'cli':
+        return _run_cli(str(req.get('provider') or ''), req.get('argv') or [],
+                        emit=emit if req.get('stream') else None)
+    if op == 'vavoo_resolve':
+        return _run_cli('vavoo', [req.get('input') or ''])
+    if op == 'vavoo_lookup':
+        return _run_cli('vavoo', [req.get('name') or '', '--original-link'])
+    if op == 'vavoo_dump':
+        return _run_cli('vavoo', ['--dump-channels'])
+    if op == 'vavoo_prewarm':
+        return _run_cli('vavoo', ['--prewarm'])
+    if op == 'vavoo_mirrors':
+        return _run_cli('vavoo', ['--mirrors'])
+    if op == 'tvtap_resolve':
+        return _run_cli('tvtap', [req.get('input') or ''])
+    if op == 'tvtap_lookup':
+        return _run_cli('tvtap', ['--find-channel', req.get('name') or ''])
+    if op == 'tvtap_stream':
+        return _run_cli('tvtap', ['--resolve-stream', str(req.get('id') or '')])
+    if op == 'tvtap_dump':
+        return _run_cli('tvtap', ['--dump-channels'])
+    return {'ok': False, 'error': f'unknown op: {op}'}
+
+
+class _ServeHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out = _dispatch(json.loads(line), emit=self._emit_line)
+            except Exception as e:
+                out = {'ok': False, 'error': f'exception: {e}'}
+            try:
+                self._write(out)
+            except Exception:
+                return
+
+    def _write(self, msg):
+        self.wfile.write((json.dumps(msg, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def _emit_line(self, line):
+        # Un client sparito interrompe il crawl (eccezione -> risposta d'errore).
+        self._write({'line': line})
+
+
+class _ServeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(sock_path):
+    # Socket rimasto da un'istanza precedente: se nessuno risponde lo
+    # rimuoviamo, altrimenti non rubiamo il path a un sidecar vivo.
+    if os.path.exists(sock_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(sock_path)
+            probe.close()
+            print(f'[sidecar] another sidecar is listening on {sock_path}', file=sys.stderr, flush=True)
+            sys.exit(ALREADY_RUNNING_EXIT)
+        except OSError:
+            os.unlink(sock_path)
+    # Import anticipato: il primo stream non paga import requests/RSA.
+    for name in _PROVIDER_MODULES:
+        try:
+            _provider(name)
+        except Exception as e:
+            print(f'[sidecar] import {name} failed: {e}', file=sys.stderr, flush=True)
+    if os.environ.get('VAVOO_PREWARM') != '0' and 'vavoo' in _modules:
+        threading.Thread(target=_modules['vavoo'].prewarm_loop, name='vavoo-prewarm', daemon=True).start()
+    server = _ServeServer(sock_path, _ServeHandler)
+    try:
+        os.chmod(sock_path, 0o600)
+    except Exception:
+        pass
+    print(f'[sidecar] listening on {sock_path} pid={os.getpid()}', file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(sock_path)
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == '--serve':
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        serve(sys.argv[2] if len(sys.argv) > 2 else SOCKET_PATH)
+    else:
+        print("Usage: python3 live_resolver_sidecar.py --serve [socket]", file=sys.stderr)
+        sys.exit(1)
@@ -16,12 +16,37 @@ Modes:
                       playable URL. If the page still shows a captcha, exit
                       with {"ok": false, "error": "captcha_required"} — the
                       caller should trigger a background warmup and skip
-                      this stream.
-  --warmup <url>      Full captcha solve via Tesseract OCR with spaced retries.
+                      this stream. Successful results are cached per URL
+                      (sqlite, shared across processes) until the link's
+                      expiry parameter or UPROT_RESOLVE_CACHE_TTL.
+  --resolve-batch <url> [<url> ...]
+                      Resolve many links concurrently (capped per proxy
+                      egress); /msfld/ folders are expanded to their episodes.
+                      Prints one JSON result per line (NDJSON) as each
+                      finishes; '-' reads URLs from stdin.
+  --invalidate <url>  Drop <url> from the resolve cache (playback failed).
+  --warmup <url>      Full captcha solve (learned digit templates, Tesseract
+                      OCR as fallback) with spaced retries.
                       Use this on a periodic timer (every ~2h) on a known
                       seed URL to refresh the IP whitelist.
+  --warmup-all <url>  Same as --warmup, run concurrently on every configured
+                      proxy slot (PROXY, PROXY_BACKUP, DIRECT). Saves per-slot
+                      state and whitelist status so failover is instant.
+  --schedule          Print the learned warmup schedule (per domain/slot
+                      whitelist lifetime estimate and next warmup time).
+  --slots             Print rolling per-slot health (latency, 403/429/503
+                      rates, whitelist) and the slot each domain would use.
+  --stats             Aggregate the resolve/warmup telemetry log
+                      (UPROT_TELEMETRY_PATH): success rate and latency
+                      percentiles per op/domain/slot, status codes per host.
   --folder <url>      Parse a /msfld/ folder page (no captcha) and return its
-                      episode list.
+                      episode list (cached UPROT_FOLDER_CACHE_TTL). With
+                      --season/--episode return only that entry.
+  --serve <socket>    Daemon mode. Listens on a unix socket for newline-
+                      delimited JSON requests ({"op": "resolve"|"folder"|
+                      "warmup"|"prepare_manual"|"submit_manual"|"ping", ...})
+                      and answers one JSON line per request. Imports, curl_cffi
+                      sessions and TLS connections stay warm between calls.
 
 Output: JSON to stdout on a single line.
 
@@ -34,19 +59,30 @@ Network modes (env vars):
 
 from __future__ import annotations
 import argparse
+import atexit
 import base64
+import contextlib
+import fcntl
 import io
 import json
 import os
+import queue
+import random
 import re
+import socket
+import socketserver
+import sqlite3
 import sys
+import tempfile
+import threading
 import time
 import urllib.parse
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from typing import Any
 
 import requests as _requests_legacy  # only for STREAMVIX_DEBUG_BASE fallback
-from PIL import Image, ImageFilter  # type: ignore
+from PIL import Image, ImageChops, ImageFilter  # type: ignore
 
 try:
     import pytesseract  # type: ignore
@@ -80,31 +116,79 @@ UPROT_FULL_HEADERS = {
     'Priority': 'u=0, i',
 }
 
-# Sessione curl_cffi persistente in-process (cookies condivisi tra le call).
-_cffi_session = _cffi_requests.Session()
+# Pool di sessioni curl_cffi persistenti, una lista per proxy (chiave = URL
+# proxy, '' per DIRECT). In modalita' --serve le sessioni restano vive tra
+# una richiesta e l'altra: niente nuovo handshake TLS verso uprot/maxstream
+# attraverso il proxy a ogni resolve. Una Session curl_cffi non e' thread-safe,
+# quindi ogni richiesta ne prende una in esclusiva e la restituisce a fine call.
+SESSION_POOL_MAX = int(os.environ.get('UPROT_SESSION_POOL_MAX', '4'))
+_session_pool: dict[str, list] = {}
+_session_pool_lock = threading.Lock()
+
+
+def _session_acquire(key: str):
+    with _session_pool_lock:
+        idle = _session_pool.get(key)
+        if idle:
+            return idle.pop()
+    return _cffi_requests.Session()
+
+
+def _session_release(key: str, sess) -> None:
+    with _session_pool_lock:
+        idle = _session_pool.setdefault(key, [])
+        if len(idle) < SESSION_POOL_MAX:
+            idle.append(sess)
+            return
+    try:
+        sess.close()
+    except Exception:
+        pass
 
 # Stato condiviso uprot — MammaMia-style. Salva cookies + POST data ottenuti
 # dopo la prima risoluzione del captcha, per riusarli su tutti i link successivi.
 UPROT_STATE_PATH = os.environ.get('UPROT_STATE_PATH', '/tmp/uprot_state.json')
 
 
-def _uprot_state_load():
-    try:
-        with open(UPROT_STATE_PATH, 'r') as f:
-            j = json.load(f)
-        if isinstance(j, dict) and isinstance(j.get('cookies'), dict) and isinstance(j.get('data'), dict):
-            return j
-    except Exception:
-        pass
+def _slot_state_path(base, slot):
+    """Copia per-slot di un file di state: /tmp/uprot_state.json -> /tmp/uprot_state.PROXY.json."""
+    root, ext = os.path.splitext(base)
+    return f'{root}.{slot}{ext or ".json"}'
+
+
+def _state_load(base, domain):
+    # Prima lo state dello slot corrente (cookies/POST data sono legati all'IP),
+    # poi il file condiviso scritto per lo slot attivo.
+    for p in (_slot_state_path(base, _domain_slot(domain)), base):
+        try:
+            with open(p, 'r') as f:
+                j = json.load(f)
+            if isinstance(j, dict) and isinstance(j.get('cookies'), dict) and isinstance(j.get('data'), dict):
+                return j
+        except Exception:
+            pass
     return None
 
 
+def _state_save(base, domain, cookies, data):
+    # Sempre la copia per-slot; il file condiviso (marker mtime per Node e UI
+    # /chapta) solo se lo slot coincide con quello attivo del dominio, cosi'
+    # un warmup di uno slot di riserva non lo sovrascrive.
+    slot = _domain_slot(domain)
+    payload = {'cookies': dict(cookies or {}), 'data': dict(data or {})}
+    paths = [_slot_state_path(base, slot)]
+    if slot == _effective_slot(domain):
+        paths.append(base)
+    for p in paths:
+        _write_json_atomic(p, payload)
+
+
+def _uprot_state_load():
+    return _state_load(UPROT_STATE_PATH, 'uprot')
+
+
 def _uprot_state_save(cookies, data):
-    try:
-        with open(UPROT_STATE_PATH, 'w') as f:
-            json.dump({'cookies': dict(cookies or {}), 'data': dict(data or {})}, f)
-    except Exception:
-        pass
+    _state_save(UPROT_STATE_PATH, 'uprot', cookies, data)
 
 
 # Stato condiviso clicka/safego — stesso pattern di uprot. Salva i cookies e
@@ -114,22 +198,11 @@ CLICKA_STATE_PATH = os.environ.get('CLICKA_STATE_PATH', '/tmp/clicka_state.json'
 
 
 def _clicka_state_load():
-    try:
-        with open(CLICKA_STATE_PATH, 'r') as f:
-            j = json.load(f)
-        if isinstance(j, dict) and isinstance(j.get('cookies'), dict) and isinstance(j.get('data'), dict):
-            return j
-    except Exception:
-        pass
-    return None
+    return _state_load(CLICKA_STATE_PATH, 'clicka')
 
 
 def _clicka_state_save(cookies, data):
-    try:
-        with open(CLICKA_STATE_PATH, 'w') as f:
-            json.dump({'cookies': dict(cookies or {}), 'data': dict(data or {})}, f)
-    except Exception:
-        pass
+    _state_save(CLICKA_STATE_PATH, 'clicka', cookies, data)
 
 DEBUG_BASE = os.environ.get('STREAMVIX_DEBUG_BASE', '').rstrip('/')
 DEBUG_TOKEN = os.environ.get('STREAMVIX_DEBUG_TOKEN', '')
@@ -152,6 +225,12 @@ DEBUG_TOKEN = os.environ.get('STREAMVIX_DEBUG_TOKEN', '')
 UPROT_ACTIVE_SLOT_PATH = os.environ.get('UPROT_ACTIVE_SLOT_PATH', '/tmp/uprot_active_proxy_slot.txt')
 CLICKA_ACTIVE_SLOT_PATH = os.environ.get('CLICKA_ACTIVE_SLOT_PATH', '/tmp/clicka_active_proxy_slot.txt')
 _VALID_SLOTS = ('PROXY', 'PROXY_BACKUP', 'DIRECT')
+_ACTIVE_SLOT_PATHS = {'uprot': UPROT_ACTIVE_SLOT_PATH, 'clicka': CLICKA_ACTIVE_SLOT_PATH}
+
+# Slot forzato per-thread: in modalita' --serve piu' richieste girano in
+# parallelo nello stesso processo, quindi submit_manual non puo' piu' forzare
+# lo slot via os.environ (lo vedrebbero anche le altre richieste).
+_tls = threading.local()
 
 
 def _read_slot(path: str) -> str:
@@ -165,25 +244,50 @@ def _read_slot(path: str) -> str:
     return 'PROXY'
 
 
+def _forced_slot() -> str:
+    forced = getattr(_tls, 'forced_slot', None) or os.environ.get('_FORCE_PROXY_SLOT', '').strip()
+    return forced if forced in _VALID_SLOTS else ''
+
+
+def _domain_for(url: str) -> str:
+    """'clicka' per la chain clicka/safego/deltabit, 'uprot' per tutto il resto
+    (uprot.net, maxstream.video, e qualsiasi altro host della chain uprot)."""
+    host = ''
+    try:
+        host = (urllib.parse.urlparse(url).hostname or '').lower()
+    except Exception:
+        pass
+    if 'clicka' in host or 'safego' in host or 'deltabit' in host:
+        return 'clicka'
+    return 'uprot'
+
+
+def _effective_slot(domain: str) -> str:
+    """Slot del dominio senza override per-thread: pin manuale > auto-selezione
+    (se attiva) > slot file scritto da Node."""
+    pinned = _read_pin(domain)
+    if pinned:
+        return pinned
+    preferred = _read_slot(_ACTIVE_SLOT_PATHS[domain])
+    if AUTO_SLOT and not os.environ.get('STREAMVIX_HTTP_PROXY', '').strip():
+        return _auto_slot(domain, preferred)
+    return preferred
+
+
+def _domain_slot(domain: str) -> str:
+    return _forced_slot() or _effective_slot(domain)
+
+
 def _proxy_for(url: str) -> str:
     """Ritorna l'URL del proxy da usare per `url` in base allo slot attivo.
     Override (in ordine): _FORCE_PROXY_SLOT > STREAMVIX_HTTP_PROXY > slot file."""
-    forced = os.environ.get('_FORCE_PROXY_SLOT', '').strip()
-    if forced in _VALID_SLOTS:
+    forced = _forced_slot()
+    if forced:
         return os.environ.get(forced, '').strip()
     explicit = os.environ.get('STREAMVIX_HTTP_PROXY', '').strip()
     if explicit:
         return explicit
-    host = ''
-    try:
-        host = (urllib.parse.urlparse(url).hostname or '').lower()
-    except Exception:
-        pass
-    if 'clicka' in host or 'safego' in host or 'deltabit' in host:
-        slot = _read_slot(CLICKA_ACTIVE_SLOT_PATH)
-    else:
-        # uprot.net, maxstream.video, e qualsiasi altro host della chain uprot
-        slot = _read_slot(UPROT_ACTIVE_SLOT_PATH)
+    slot = _domain_slot(_domain_for(url))
     if slot == 'DIRECT':
         # Bypass proxy: usa l'egress diretto del container (WARP).
         return ''
@@ -234,13 +338,20 @@ COOKIE_JAR_PATH = os.environ.get('UPROT_COOKIE_JAR', '/tmp/uprot_cookies.json')
 
 
 def _domain_key(url: str) -> str:
+    """Chiave cookie jar: dominio semplificato + slot egress. I cookies
+    (cf_clearance, PHPSESSID whitelistato) sono legati all'IP che li ha
+    ottenuti, quindi ogni slot ha il suo jar."""
+    try:
+        slot = _domain_slot(_domain_for(url))
+    except Exception:
+        slot = 'PROXY'
     try:
         h = urllib.parse.urlparse(url).hostname or ''
         # raggruppa per "etld" semplificata: usa gli ultimi due token
         parts = h.split('.')
         if len(parts) >= 2:
-            return '.'.join(parts[-2:]).lower()
-        return h.lower()
+            return '.'.join(parts[-2:]).lower() + '@' + slot
+        return h.lower() + '@' + slot
     except Exception:
         return ''
 
@@ -255,11 +366,49 @@ def _cookie_jar_load() -> dict:
 
 
 def _cookie_jar_save(jar: dict) -> None:
+    _write_json_atomic(COOKIE_JAR_PATH, jar)
+
+
+def _write_json_atomic(path, data):
+    # Temp con nome unico nella stessa directory: due processi che scrivono
+    # lo stesso file non si mescolano nel temp prima di os.replace.
+    tmp = None
     try:
-        with open(COOKIE_JAR_PATH, 'w') as f:
-            json.dump(jar, f)
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
     except Exception:
-        pass
+        if tmp:
+            try:
+                os.unlink(tmp)
+            except Exception:
+                pass
+
+
+_json_locks: dict[str, threading.Lock] = {}
+_json_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def _json_file_lock(path):
+    """Serializza un read-modify-write di `path` tra thread (lock di processo)
+    e tra processi (flock su path + '.lock')."""
+    with _json_locks_guard:
+        plock = _json_locks.setdefault(path, threading.Lock())
+    with plock:
+        try:
+            lock = open(path + '.lock', 'a')
+        except Exception:
+            lock = None
+        try:
+            if lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+        finally:
+            if lock:
+                lock.close()
 
 
 def _cookies_for(url: str) -> dict:
@@ -273,13 +422,311 @@ def _cookies_update(url: str, new_cookies: dict) -> None:
     key = _domain_key(url)
     if not key:
         return
-    jar = _cookie_jar_load()
-    cur = jar.get(key, {})
-    if not isinstance(cur, dict):
-        cur = {}
-    cur.update({k: v for k, v in new_cookies.items() if k and v})
-    jar[key] = cur
-    _cookie_jar_save(jar)
+    fresh = {k: v for k, v in new_cookies.items() if k and v}
+    # Il jar e' condiviso dai thread del daemon e dai processi CLI.
+    with _json_file_lock(COOKIE_JAR_PATH):
+        jar = _cookie_jar_load()
+        cur = jar.get(key, {})
+        if not isinstance(cur, dict):
+            cur = {}
+        if all(cur.get(k) == v for k, v in fresh.items()):
+            return
+        cur.update(fresh)
+        jar[key] = cur
+        _cookie_jar_save(jar)
+
+
+# ---------------------------------------------------------------------------
+# Slot health & auto-selection
+# ---------------------------------------------------------------------------
+# Ogni richiesta HTTP registra (latenza, status) per dominio+slot in una
+# finestra mobile su SLOT_STATS_PATH, condivisa tra processi. I campioni
+# restano in memoria e un thread li accoda al file ogni SLOT_STATS_FLUSH_S
+# (sotto flock; flush finale all'uscita), cosi' il resolve non scrive su
+# disco ad ogni hop e i processi non si perdono i campioni. Con AUTO_SLOT
+# attivo lo slot scritto da Node resta il preferito finche' e' sano; se non
+# lo e' (whitelist persa o troppi 403/429/503/timeout) si passa allo slot
+# whitelistato con il miglior p50 pesato per tasso d'errore. La scelta e'
+# memorizzata per AUTO_SLOT_MEMO_S cosi' una chain non cambia IP a meta'.
+# Il pin manuale (/chapta ?set_<dominio>=SLOT, file *_pinned_proxy_slot.txt)
+# disattiva l'auto-selezione per quel dominio.
+SLOT_STATS_PATH = os.environ.get('UPROT_SLOT_STATS_PATH', '/tmp/uprot_slot_stats.json')
+SLOT_STATS_WINDOW = int(os.environ.get('UPROT_SLOT_STATS_WINDOW', '50'))
+SLOT_STATS_FLUSH_S = float(os.environ.get('UPROT_SLOT_STATS_FLUSH_S', '2'))
+AUTO_SLOT = os.environ.get('UPROT_AUTO_SLOT', '1') != '0'
+AUTO_SLOT_MAX_ERR = float(os.environ.get('UPROT_AUTO_SLOT_MAX_ERR', '0.5'))
+AUTO_SLOT_MIN_SAMPLES = 5
+AUTO_SLOT_MEMO_S = 30
+_PIN_SLOT_PATHS = {
+    'uprot': os.environ.get('UPROT_PIN_SLOT_PATH', '/tmp/uprot_pinned_proxy_slot.txt'),
+    'clicka': os.environ.get('CLICKA_PIN_SLOT_PATH', '/tmp/clicka_pinned_proxy_slot.txt'),
+}
+_slot_stats_lock = threading.Lock()
+_slot_stats_pending: dict[str, dict[str, list]] = {}
+_slot_stats_flusher = None
+_auto_memo: dict[str, tuple] = {}
+_auto_memo_lock = threading.Lock()
+
+
+def _read_pin(domain: str) -> str:
+    try:
+        with open(_PIN_SLOT_PATHS[domain], 'r') as f:
+            v = f.read().strip()
+        return v if v in _VALID_SLOTS else ''
+    except Exception:
+        return ''
+
+
+def _slot_stats_file_load() -> dict:
+    try:
+        with open(SLOT_STATS_PATH, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _slot_stats_merge(data, pending):
+    for domain, slots in pending.items():
+        for slot, samples in slots.items():
+            cur = data.setdefault(domain, {}).setdefault(slot, [])
+            cur.extend(samples)
+            del cur[:-SLOT_STATS_WINDOW]
+    return data
+
+
+def _slot_stats_load() -> dict:
+    """Finestra su file + campioni di questo processo non ancora scritti."""
+    data = _slot_stats_file_load()
+    with _slot_stats_lock:
+        return _slot_stats_merge(data, _slot_stats_pending)
+
+
+def _slot_stats_flush():
+    global _slot_stats_pending
+    with _slot_stats_lock:
+        pending, _slot_stats_pending = _slot_stats_pending, {}
+    if not pending:
+        return
+    with _json_file_lock(SLOT_STATS_PATH):
+        _write_json_atomic(SLOT_STATS_PATH, _slot_stats_merge(_slot_stats_file_load(), pending))
+
+
+def _slot_stats_flush_loop():
+    while True:
+        time.sleep(SLOT_STATS_FLUSH_S)
+        try:
+            _slot_stats_flush()
+        except Exception as e:
+            print(f'[slots] stats flush failed: {e}', file=sys.stderr, flush=True)
+
+
+def _slot_stats_record(domain, slot, ms, status):
+    """status 0 = eccezione (timeout, proxy giu')."""
+    global _slot_stats_flusher
+    with _slot_stats_lock:
+        samples = _slot_stats_pending.setdefault(domain, {}).setdefault(slot, [])
+        samples.append([int(time.time()), int(ms), int(status)])
+        del samples[:-SLOT_STATS_WINDOW]
+        if _slot_stats_flusher is None:
+            _slot_stats_flusher = threading.Thread(target=_slot_stats_flush_loop,
+                                                   name='slot-stats-flush', daemon=True)
+            _slot_stats_flusher.start()
+            atexit.register(_slot_stats_flush)
+
+
+def _slot_health(domain, slot, stats=None, hist=None, wl=None):
+    stats = _slot_stats_load() if stats is None else stats
+    hist = _wl_history_load() if hist is None else hist
+    wl = _slot_whitelist_load() if wl is None else wl
+    samples = (stats.get(domain) or {}).get(slot) or []
+    n = len(samples)
+    lat = [ms for _ts, ms, st in samples if st]
+    codes = Counter(st for _ts, _ms, st in samples)
+    errors = codes[403] + codes[429] + codes[503] + codes[0]
+    h = (hist.get(domain) or {}).get(slot)
+    if h and h.get('gained_ms'):
+        whitelisted = not h.get('lost_ms')
+    else:
+        w = (wl.get(domain) or {}).get(slot)
+        whitelisted = bool(w.get('ok')) if w else None
+    return {
+        'samples': n,
+        'p50_ms': _quantile(lat, 0.5), 'p95_ms': _quantile(lat, 0.95),
+        'rate_403': codes[403] / n if n else 0.0,
+        'rate_429': codes[429] / n if n else 0.0,
+        'rate_503': codes[503] / n if n else 0.0,
+        'rate_fail': codes[0] / n if n else 0.0,
+        'err_rate': errors / n if n else 0.0,
+        'whitelisted': whitelisted,
+    }
+
+
+def _slot_healthy(h):
+    if h['whitelisted'] is False:
+        return False
+    return h['samples'] < AUTO_SLOT_MIN_SAMPLES or h['err_rate'] <= AUTO_SLOT_MAX_ERR
+
+
+def _auto_slot(domain, preferred):
+    with _auto_memo_lock:
+        memo = _auto_memo.get(domain)
+    if memo and memo[0] == preferred and time.time() - memo[2] < AUTO_SLOT_MEMO_S:
+        return memo[1]
+    stats, hist, wl = _slot_stats_load(), _wl_history_load(), _slot_whitelist_load()
+    cands = _configured_slots()
+    health = {sl: _slot_health(domain, sl, stats, hist, wl) for sl in cands}
+    choice = preferred
+    if preferred not in health or not _slot_healthy(health[preferred]):
+        good = [sl for sl in cands if health[sl]['whitelisted'] and _slot_healthy(health[sl])]
+        if good:
+            choice = min(good, key=lambda sl: (health[sl]['p50_ms'] or float(HTTP_TIMEOUT * 1000))
+                         * (1 + health[sl]['err_rate']))
+    if choice != preferred and (not memo or memo[1] != choice):
+        print(f'[proxy] {domain}: slot {preferred} unhealthy -> auto-selected {choice}',
+              file=sys.stderr, flush=True)
+    with _auto_memo_lock:
+        _auto_memo[domain] = (preferred, choice, time.time())
+    return choice
+
+
+def slots_health():
+    stats, hist, wl = _slot_stats_load(), _wl_history_load(), _slot_whitelist_load()
+    out = {'ok': True, 'kind': 'slots_health', 'domains': {}}
+    for domain in ('uprot', 'clicka'):
+        out['domains'][domain] = {
+            'preferred_slot': _read_slot(_ACTIVE_SLOT_PATHS[domain]),
+            'pinned_slot': _read_pin(domain) or None,
+            'effective_slot': _effective_slot(domain),
+            'slots': {sl: _slot_health(domain, sl, stats, hist, wl) for sl in _configured_slots()},
+        }
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Telemetry (--stats)
+# ---------------------------------------------------------------------------
+# Una riga NDJSON per ogni resolve/warmup in TELEMETRY_PATH: tipo di URL,
+# dominio, slot, esito, durata, cache hit, hop HTTP (host, status, ms) e
+# tentativi OCR. Append-only; oltre TELEMETRY_MAX_BYTES il file ruota su
+# <path>.1 (una sola generazione). --stats / {"op": "stats"} aggrega
+# percentili e success rate per op/dominio/slot e latenze per host. Le
+# resolve lanciate dal prefetch sono marcate "prefetch": true e restano
+# fuori dagli aggregati (solo contate).
+TELEMETRY_PATH = os.environ.get('UPROT_TELEMETRY_PATH', '/tmp/uprot_telemetry.ndjson')
+TELEMETRY_MAX_BYTES = int(os.environ.get('UPROT_TELEMETRY_MAX_BYTES', str(4 * 1024 * 1024)))
+_telemetry_lock = threading.Lock()
+_URL_KIND_RE = re.compile(r'/(msfld|msfi|msf|msei|msdi|mse|uprots|adelta|delta)/', re.I)
+
+
+def _url_kind(url):
+    m = _URL_KIND_RE.search(url or '')
+    return m.group(1).lower() if m else 'other'
+
+
+def _telemetry_hop(url, ms, status):
+    ev = getattr(_tls, 'telemetry', None)
+    if ev is not None:
+        ev['hops'].append([urllib.parse.urlparse(url).hostname or '', int(status), int(ms)])
+
+
+def _telemetry_ocr_attempt():
+    ev = getattr(_tls, 'telemetry', None)
+    if ev is not None:
+        ev['ocr_attempts'] += 1
+
+
+def _telemetry_write(ev):
+    line = json.dumps(ev, separators=(',', ':')) + '\n'
+    with _telemetry_lock:
+        try:
+            if os.path.getsize(TELEMETRY_PATH) > TELEMETRY_MAX_BYTES:
+                os.replace(TELEMETRY_PATH, TELEMETRY_PATH + '.1')
+        except OSError:
+            pass
+        try:
+            with open(TELEMETRY_PATH, 'a') as f:
+                f.write(line)
+        except Exception:
+            pass
+
+
+def _telemetry_run(op, url, fn):
+    """Esegue fn() raccogliendo hop/OCR del thread corrente e scrive l'evento."""
+    domain = _domain_for(url)
+    ev = {'ts': int(time.time()), 'op': op, 'kind': _url_kind(url), 'domain': domain,
+          'slot': _domain_slot(domain), 'hops': [], 'ocr_attempts': 0}
+    if getattr(_tls, 'prefetch', False):
+        ev['prefetch'] = True
+    prev = getattr(_tls, 'telemetry', None)
+    _tls.telemetry = ev
+    t0 = time.time()
+    out: dict = {'ok': False, 'error': 'exception'}
+    try:
+        out = fn()
+        return out
+    finally:
+        _tls.telemetry = prev
+        ev['ms'] = int((time.time() - t0) * 1000)
+        ev['ok'] = bool(out.get('ok'))
+        ev['cached'] = bool(out.get('cached'))
+        if not ev['ok']:
+            ev['error'] = str(out.get('error') or '')[:200]
+        _telemetry_write(ev)
+
+
+def _telemetry_events():
+    events = []
+    for path in (TELEMETRY_PATH + '.1', TELEMETRY_PATH):
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except Exception:
+                        continue
+        except OSError:
+            continue
+    return events
+
+
+def telemetry_stats():
+    events = _telemetry_events()
+    prefetch = sum(1 for ev in events if ev.get('prefetch'))
+    groups: dict[str, list] = {}
+    hosts: dict[str, list] = {}
+    for ev in events:
+        if ev.get('prefetch'):
+            continue
+        groups.setdefault(f"{ev.get('op')} {ev.get('domain')} {ev.get('slot')}", []).append(ev)
+        for host, status, ms in ev.get('hops') or []:
+            hosts.setdefault(host, []).append((status, ms))
+    out_groups = {}
+    for key, evs in sorted(groups.items()):
+        live = [e for e in evs if not e.get('cached')]
+        ms = [e['ms'] for e in live if e.get('ok')]
+        ocr = [e.get('ocr_attempts', 0) for e in live]
+        errors = Counter(e.get('error') for e in evs if not e.get('ok'))
+        out_groups[key] = {
+            'n': len(evs),
+            'ok_rate': sum(1 for e in evs if e.get('ok')) / len(evs),
+            'cache_hit_rate': (len(evs) - len(live)) / len(evs),
+            'p50_ms': _quantile(ms, 0.5), 'p95_ms': _quantile(ms, 0.95), 'p99_ms': _quantile(ms, 0.99),
+            'hops_avg': (sum(len(e.get('hops') or []) for e in live) / len(live)) if live else None,
+            'ocr_attempts_avg': (sum(ocr) / len(ocr)) if any(ocr) else None,
+            'top_errors': errors.most_common(5),
+        }
+    out_hosts = {}
+    for host, rows in sorted(hosts.items()):
+        lat = [ms for st, ms in rows if st]
+        out_hosts[host] = {
+            'n': len(rows),
+            'status': dict(Counter(str(st) for st, _ms in rows)),
+            'p50_ms': _quantile(lat, 0.5), 'p95_ms': _quantile(lat, 0.95),
+        }
+    return {'ok': True, 'kind': 'stats', 'events': len(events), 'prefetch_events': prefetch,
+            'since': min((e.get('ts', 0) for e in events), default=None),
+            'groups': out_groups, 'hosts': out_hosts}
 
 
 # ---------------------------------------------------------------------------
@@ -319,6 +766,9 @@ def _via_direct(url, method, body, headers, redirect, via_proxy=True):
     if persisted and 'Cookie' not in h and 'cookie' not in h:
         h['Cookie'] = '; '.join(f'{k}={v}' for k, v in persisted.items())
     proxies = None
+    proxy_url = ''
+    domain = _domain_for(url)
+    slot = _domain_slot(domain)
     if via_proxy:
         proxy_url = _proxy_for(url)
         if proxy_url:
@@ -327,9 +777,20 @@ def _via_direct(url, method, body, headers, redirect, via_proxy=True):
     # curl_cffi.Session.request: usa impersonate='chrome' per ottenere il
     # fingerprint TLS/JA3 di Chrome, requisito per non venire challenged da
     # Cloudflare ad ogni richiesta.
-    r = _cffi_session.request(method, url, data=body, headers=h,
-                              allow_redirects=redirect, timeout=HTTP_TIMEOUT,
-                              proxies=proxies, impersonate='chrome')
+    sess = _session_acquire(proxy_url)
+    t0 = time.time()
+    try:
+        r = sess.request(method, url, data=body, headers=h,
+                         allow_redirects=redirect, timeout=HTTP_TIMEOUT,
+                         proxies=proxies, impersonate='chrome')
+    except Exception:
+        _slot_stats_record(domain, slot, (time.time() - t0) * 1000, 0)
+        _telemetry_hop(url, (time.time() - t0) * 1000, 0)
+        raise
+    finally:
+        _session_release(proxy_url, sess)
+    _slot_stats_record(domain, slot, (time.time() - t0) * 1000, r.status_code)
+    _telemetry_hop(url, (time.time() - t0) * 1000, r.status_code)
     out_hdrs = {k.lower(): v for k, v in r.headers.items()}
     # Esponi l'URL finale post-redirect (key custom, non-HTTP) cosi' il caller
     # puo' ricostruire path tipo /emvvv/<id> da watchfree/X/Y/.
@@ -392,47 +853,334 @@ def cookies_from(hdrs):
 # OCR (used only by warmup)
 # ---------------------------------------------------------------------------
 
-def _ocr_one(image_bytes):
-    """3-digit numeric captcha OCR. Color-aware: keeps only dark pixels (digits)."""
-    if pytesseract is None:
-        return None
+# Lookup table per Image.point: soglie della maschera cifre.
+_LUT_LT_80 = [255 if v < 80 else 0 for v in range(256)]
+_LUT_LT_110 = [255 if v < 110 else 0 for v in range(256)]
+_LUT_LT_170 = [255 if v < 170 else 0 for v in range(256)]
+
+
+def _captcha_mask(image_bytes):
+    """Maschera L delle cifre: 0 sui pixel scuri poco saturi (le cifre), 255 altrove.
+
+    Equivale al vecchio doppio loop per-pixel (r<110, g<110, b<170,
+    max-min<80) ma usa operazioni per banda di PIL, eseguite in C.
+    """
     rgb = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-    w, h = rgb.size
-    px = rgb.load()
-    mask = Image.new('L', (w, h), 255)
-    mpx = mask.load()
-    for y in range(h):
-        for x in range(w):
-            r, g, b = px[x, y]
-            if r < 110 and g < 110 and b < 170 and max(r, g, b) - min(r, g, b) < 80:
-                mpx[x, y] = 0
-            else:
-                mpx[x, y] = 255
+    r, g, b = rgb.split()
+    spread = ImageChops.subtract(ImageChops.lighter(ImageChops.lighter(r, g), b),
+                                 ImageChops.darker(ImageChops.darker(r, g), b))
+    # Ogni test diventa una maschera 255/0; multiply fa da AND logico.
+    keep = ImageChops.multiply(
+        ImageChops.multiply(r.point(_LUT_LT_110), g.point(_LUT_LT_110)),
+        ImageChops.multiply(b.point(_LUT_LT_170), spread.point(_LUT_LT_80)))
+    return ImageChops.invert(keep)
+
+
+def _captcha_variants(image_bytes):
+    """Varianti pre-processate (upscale x5 + filtri) calcolate una sola volta
+    per immagine e riusate per tutti i PSM tesseract."""
+    mask = _captcha_mask(image_bytes)
+    w, h = mask.size
     base = mask.resize((w * 5, h * 5), Image.LANCZOS)
-    variants = [
+    return [
         base,
         base.filter(ImageFilter.MedianFilter(3)),
         base.filter(ImageFilter.MedianFilter(5)),
         base.filter(ImageFilter.MaxFilter(3)),
     ]
-    candidates = []
-    for vimg in variants:
-        for psm in (6, 7, 8, 10, 11, 13):
-            try:
-                out = pytesseract.image_to_string(
-                    vimg, config=f'-c tessedit_char_whitelist=0123456789 --psm {psm}')
-                digits = ''.join(c for c in out if c.isdigit())
-                # Captcha uprot può essere 3 o 4 cifre (msf=3, msei=4 osservato).
-                if 3 <= len(digits) <= 6:
-                    candidates.append(digits[:4] if len(digits) >= 4 else digits[:3])
-            except Exception:
-                pass
-    if not candidates:
+
+
+# Voto OCR: 4 varianti x 6 PSM = 24 run tesseract. Le eseguiamo in parallelo
+# (pytesseract lancia comunque un processo tesseract per run, quindi bastano
+# thread: il lavoro vero gira fuori dal GIL) e ci fermiamo appena una lettura
+# raggiunge OCR_CONSENSUS voti. L'ordine delle combinazioni (variante, psm)
+# segue il loro storico di letture corrette, salvato in OCR_STATS_PATH.
+OCR_PSMS = (6, 7, 8, 10, 11, 13)
+OCR_WORKERS = int(os.environ.get('UPROT_OCR_WORKERS', '4'))
+OCR_CONSENSUS = int(os.environ.get('UPROT_OCR_CONSENSUS', '4'))
+OCR_STATS_PATH = os.environ.get('UPROT_OCR_STATS_PATH', '/tmp/uprot_ocr_stats.json')
+_ocr_stats_lock = threading.Lock()
+
+
+def _ocr_stats_load() -> dict:
+    try:
+        with open(OCR_STATS_PATH, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _ocr_combo_order(n_variants):
+    """Combinazioni (variante, psm) ordinate per hit-rate storico (Laplace),
+    a parita' nell'ordine di default."""
+    stats = _ocr_stats_load()
+    combos = [(vi, psm) for vi in range(n_variants) for psm in OCR_PSMS]
+
+    def score(combo):
+        hits, reads = (stats.get(f'{combo[0]}:{combo[1]}') or [0, 0])[:2]
+        return (hits + 1) / (reads + 2)
+    return sorted(combos, key=score, reverse=True)
+
+
+def _ocr_stats_record(reads, guess, accepted):
+    """Aggiorna lo storico per-combinazione dopo l'esito della POST captcha.
+
+    accepted=True: ogni combinazione che ha letto `guess` conta un hit, tutte
+    quelle che hanno letto qualcosa contano una lettura.
+    accepted=False: sappiamo solo che chi ha letto `guess` ha sbagliato.
+    """
+    if not reads or not guess:
+        return
+    with _ocr_stats_lock:
+        stats = _ocr_stats_load()
+        for (vi, psm), digits in reads.items():
+            if not accepted and digits != guess:
+                continue
+            key = f'{vi}:{psm}'
+            hits, n = (stats.get(key) or [0, 0])[:2]
+            stats[key] = [hits + (1 if accepted and digits == guess else 0), n + 1]
+        _write_json_atomic(OCR_STATS_PATH, stats)
+
+
+def _tesseract_digits(vimg, psm):
+    try:
+        out = pytesseract.image_to_string(
+            vimg, config=f'-c tessedit_char_whitelist=0123456789 --psm {psm}')
+    except Exception:
+        return None
+    digits = ''.join(c for c in out if c.isdigit())
+    # Captcha uprot può essere 3 o 4 cifre (msf=3, msei=4 osservato).
+    if 3 <= len(digits) <= 6:
+        return digits[:4] if len(digits) >= 4 else digits[:3]
+    return None
+
+
+def _ocr_vote(image_bytes):
+    """Ritorna (guess, reads) dove reads = {(variante, psm): cifre lette}."""
+    if pytesseract is None:
+        return None, {}
+    variants = _captcha_variants(image_bytes)
+    reads = {}
+    votes = Counter()
+    pool = ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS))
+    try:
+        pending = {pool.submit(_tesseract_digits, variants[vi], psm): (vi, psm)
+                   for vi, psm in _ocr_combo_order(len(variants))}
+        while pending:
+            done, _rest = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                combo = pending.pop(fut)
+                digits = fut.result()
+                if digits:
+                    reads[combo] = digits
+                    votes[digits] += 1
+            if votes and votes.most_common(1)[0][1] >= OCR_CONSENSUS:
+                break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if not votes:
+        return None, reads
+    return votes.most_common(1)[0][0], reads
+
+
+def _ocr_one(image_bytes):
+    """3-digit numeric captcha OCR. Color-aware: keeps only dark pixels (digits)."""
+    return _ocr_vote(image_bytes)[0]
+
+
+# ---------------------------------------------------------------------------
+# Template digit classifier (prima di tesseract)
+# ---------------------------------------------------------------------------
+# I captcha uprot/safego usano un font fisso: segmentiamo la maschera in glifi
+# (colonne con inchiostro contigue), normalizziamo ogni glifo a GLYPH_W x
+# GLYPH_H bit e lo confrontiamo (distanza di Hamming) con i template imparati
+# dai guess accettati dal server. Millisecondi, niente processi tesseract, e
+# funziona anche senza il binario. Tesseract resta il fallback quando la
+# segmentazione non torna o nessun template e' abbastanza vicino.
+# I template sono separati per campo form ('captcha' uprot, 'captch5' safego).
+GLYPH_W, GLYPH_H = 12, 16
+GLYPH_MIN_W = 2
+DIGIT_TEMPLATES_PATH = os.environ.get('UPROT_DIGIT_TEMPLATES_PATH', '/tmp/uprot_digit_templates.json')
+DIGIT_TEMPLATES_PER_DIGIT = int(os.environ.get('UPROT_DIGIT_TEMPLATES_PER_DIGIT', '12'))
+# Frazione massima di bit diversi per accettare un match.
+DIGIT_MATCH_MAX_DIST = float(os.environ.get('UPROT_DIGIT_MATCH_MAX_DIST', '0.18'))
+_templates_lock = threading.Lock()
+_templates_cache: dict[str, Any] = {'mtime': None, 'data': {}}
+
+
+def _captcha_glyphs(image_bytes):
+    """Glifi della captcha come interi di GLYPH_W*GLYPH_H bit, da sinistra a destra."""
+    ink = ImageChops.invert(_captcha_mask(image_bytes))
+    w, h = ink.size
+    # Media per colonna (BOX su altezza 1): > 0 se la colonna ha inchiostro.
+    cols = ink.resize((w, 1), Image.BOX).tobytes()
+    runs = []
+    x0 = None
+    for x, v in enumerate(cols + b'\0'):
+        if v and x0 is None:
+            x0 = x
+        elif not v and x0 is not None:
+            if x - x0 >= GLYPH_MIN_W:
+                runs.append((x0, x))
+            x0 = None
+    glyphs = []
+    for x0, x1 in runs:
+        crop = ink.crop((x0, 0, x1, h))
+        bbox = crop.getbbox()
+        if not bbox:
+            continue
+        norm = crop.crop(bbox).resize((GLYPH_W, GLYPH_H), Image.BILINEAR).point(lambda v: 255 if v >= 128 else 0)
+        glyphs.append(int.from_bytes(norm.convert('1').tobytes(), 'big'))
+    return glyphs
+
+
+def _digit_templates_load() -> dict:
+    """{field: {digit: [int, ...]}}, ricaricato solo se il file e' cambiato."""
+    try:
+        mtime = os.path.getmtime(DIGIT_TEMPLATES_PATH)
+    except OSError:
+        return {}
+    if _templates_cache['mtime'] == mtime:
+        return _templates_cache['data']
+    data = {}
+    try:
+        with open(DIGIT_TEMPLATES_PATH, 'r') as f:
+            raw = json.load(f)
+        for field, digits in (raw or {}).items():
+            data[field] = {d: [int(hx, 16) for hx in lst] for d, lst in digits.items()}
+    except Exception:
+        data = {}
+    _templates_cache['mtime'] = mtime
+    _templates_cache['data'] = data
+    return data
+
+
+def _template_read(image_bytes, field):
+    """Legge la captcha con i template di `field`. None se non e' sicuro."""
+    templates = _digit_templates_load().get(field) or {}
+    if not templates:
         return None
-    best, _n = Counter(candidates).most_common(1)[0]
+    try:
+        glyphs = _captcha_glyphs(image_bytes)
+    except Exception:
+        return None
+    if not 3 <= len(glyphs) <= 4:
+        return None
+    max_bits = int(GLYPH_W * GLYPH_H * DIGIT_MATCH_MAX_DIST)
+    out = []
+    for g in glyphs:
+        best, best_dist = None, max_bits + 1
+        for digit, tpls in templates.items():
+            for t in tpls:
+                dist = (g ^ t).bit_count()
+                if dist < best_dist:
+                    best, best_dist = digit, dist
+        if best is None:
+            return None
+        out.append(best)
+    return ''.join(out)
+
+
+def _digit_templates_learn(image_bytes, guess, field):
+    """Salva i glifi di una captcha il cui guess e' stato accettato dal server."""
+    try:
+        glyphs = _captcha_glyphs(image_bytes)
+    except Exception:
+        return
+    if not guess or len(glyphs) != len(guess):
+        return
+    with _templates_lock:
+        try:
+            with open(DIGIT_TEMPLATES_PATH, 'r') as f:
+                raw = json.load(f)
+            if not isinstance(raw, dict):
+                raw = {}
+        except Exception:
+            raw = {}
+        per_field = raw.setdefault(field, {})
+        for digit, g in zip(guess, glyphs):
+            lst = per_field.setdefault(digit, [])
+            hx = format(g, 'x')
+            if hx in lst:
+                continue
+            lst.append(hx)
+            del lst[:-DIGIT_TEMPLATES_PER_DIGIT]
+        _write_json_atomic(DIGIT_TEMPLATES_PATH, raw)
+
+
+# ---------------------------------------------------------------------------
+# Perceptual-hash answer cache
+# ---------------------------------------------------------------------------
+# Se uprot/safego riusano le stesse immagini captcha, la risposta accettata la
+# conosciamo gia': dHash (256 bit) della maschera cifre -> guess accettato.
+# Lookup prima di template/OCR: solve istantaneo e niente tentativi sbagliati
+# che bruciano budget di rate-limit. La maschera rende l'hash stabile rispetto
+# al rumore di sfondo e al re-encoding del PNG.
+CAPTCHA_ANSWERS_PATH = os.environ.get('UPROT_CAPTCHA_ANSWERS_PATH', '/tmp/uprot_captcha_answers.json')
+CAPTCHA_ANSWERS_MAX = int(os.environ.get('UPROT_CAPTCHA_ANSWERS_MAX', '2000'))
+CAPTCHA_PHASH_MAX_DIST = int(os.environ.get('UPROT_CAPTCHA_PHASH_MAX_DIST', '2'))
+_answers_lock = threading.Lock()
+
+
+def _captcha_phash(image_bytes):
+    """dHash 16x16 (256 bit) della maschera cifre, come intero."""
+    small = _captcha_mask(image_bytes).resize((17, 16), Image.BILINEAR).tobytes()
+    bits = 0
+    for y in range(16):
+        row = small[y * 17:(y + 1) * 17]
+        for x in range(16):
+            bits = (bits << 1) | (1 if row[x] > row[x + 1] else 0)
+    return bits
+
+
+def _captcha_answers_load() -> dict:
+    try:
+        with open(CAPTCHA_ANSWERS_PATH, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _captcha_answer_lookup(image_bytes, field):
+    """Guess gia' accettato per un'immagine (quasi) identica, oppure None."""
+    answers = _captcha_answers_load().get(field) or {}
+    if not answers:
+        return None
+    try:
+        h = _captcha_phash(image_bytes)
+    except Exception:
+        return None
+    hit = answers.get(format(h, 'x'))
+    if hit:
+        return hit
+    best, best_dist = None, CAPTCHA_PHASH_MAX_DIST + 1
+    for hx, guess in answers.items():
+        dist = (h ^ int(hx, 16)).bit_count()
+        if dist < best_dist:
+            best, best_dist = guess, dist
     return best
 
 
+def _captcha_answer_store(image_bytes, field, guess):
+    """Registra (accepted) o rimuove (guess=None, risposta rifiutata) l'entry."""
+    try:
+        hx = format(_captcha_phash(image_bytes), 'x')
+    except Exception:
+        return
+    with _answers_lock:
+        data = _captcha_answers_load()
+        per_field = data.setdefault(field, {})
+        per_field.pop(hx, None)
+        if guess:
+            per_field[hx] = guess
+            # dict mantiene l'ordine di inserimento: scarta le entry piu' vecchie.
+            while len(per_field) > CAPTCHA_ANSWERS_MAX:
+                per_field.pop(next(iter(per_field)))
+        _write_json_atomic(CAPTCHA_ANSWERS_PATH, data)
+
+
 def _extract_captcha_png(body):
     m = re.search(r'data:image/(?:png|jpe?g);base64,([A-Za-z0-9+/=]+)', body, re.I)
     if not m:
@@ -461,10 +1209,150 @@ M3U8_FILE_RE = re.compile(r'(?:file|src|url)\s*[:=]\s*["\'](https?://[^"\']+\.m3
 # Eval/packed JS spesso contiene il link m3u8 dopo unpacking; cerchiamo anche su raw.
 
 
+# Scanner unico per le pagine uprot/safego: una sola finditer su una regex
+# con alternative nominate raccoglie anchor, primi uprots/adelta e immagini
+# inline. Un match consuma il testo, quindi sugli anchor ricontrolliamo il
+# frammento (corto) per uprots/adelta/img. Il risultato e' memorizzato per
+# thread sull'ultimo body, cosi' _is_captcha_page, _find_continue_link e
+# _bypass_link sullo stesso hop scansionano una volta.
+_PAGE_SCAN_RE = re.compile(
+    r'<a[^>]+href=["\'](?P<href>[^"\']+)["\'][^>]*>(?P<text>.*?)</a>'
+    r'|(?P<uprots>https?://maxstream\.video/uprots/[A-Za-z0-9=]+)'
+    r'|(?P<adelta>https?://clicka\.cc/adelta/[A-Za-z0-9=]+)'
+    r'|(?P<img>data:image)',
+    re.I | re.S)
+_CONTINUE_HOSTS = ('maxstream', 'clicka', 'uprots', 'adelta')
+
+
+def _scan_page(body):
+    memo = getattr(_tls, 'page_scan', None)
+    if memo is not None and memo[0] is body:
+        return memo[1]
+    sc = {'continue': None, 'continue_any': None, 'uprots': None, 'adelta': None, 'img': False}
+    for m in _PAGE_SCAN_RE.finditer(body):
+        kind = m.lastgroup
+        if kind == 'uprots' or kind == 'adelta':
+            sc[kind] = sc[kind] or m.group(kind)
+            continue
+        if kind == 'img':
+            sc['img'] = True
+            continue
+        frag = m.group(0)
+        if not sc['uprots']:
+            mu = UPROTS_RE.search(frag)
+            sc['uprots'] = mu.group(0) if mu else None
+        if not sc['adelta']:
+            ma = ADELTA_RE.search(frag)
+            sc['adelta'] = ma.group(0) if ma else None
+        sc['img'] = sc['img'] or 'data:image' in frag
+        if sc['continue']:
+            continue
+        text = m.group('text')
+        if 'CONTINUE' not in ''.join(text.split()).upper():
+            continue
+        href = m.group('href')
+        if any(h in href for h in _CONTINUE_HOSTS):
+            sc['continue'] = href
+        elif not sc['continue_any']:
+            sc['continue_any'] = href
+    _tls.page_scan = (body, sc)
+    return sc
+
+
 def _is_captcha_page(body):
-    has_img = 'data:image' in body
-    has_target = bool(UPROTS_RE.search(body) or ADELTA_RE.search(body))
-    return has_img and not has_target
+    sc = _scan_page(body)
+    return sc['img'] and not (sc['uprots'] or sc['adelta'])
+
+
+def _bypass_link(body):
+    """Primo link uprots/adelta della pagina (None = IP non whitelistato)."""
+    sc = _scan_page(body)
+    return sc['uprots'] or sc['adelta']
+
+
+# ---------------------------------------------------------------------------
+# Chain snapshots (debug)
+# ---------------------------------------------------------------------------
+# Ogni hop della chain maxstream viene annotato (url, status, ms, body
+# troncato) in memoria; solo a fine chain si decide se salvarlo: sempre con
+# UPROT_CHAIN_DEBUG=1, sui fallimenti con probabilita' UPROT_CHAIN_DEBUG_SAMPLE.
+# La scrittura la fa un thread writer da una coda limitata (se piena si scarta,
+# mai bloccare il resolve) in CHAIN_DEBUG_DIR/<ts>-<pid>-<seq>.json, tenendo
+# solo gli ultimi CHAIN_DEBUG_KEEP file: fallimenti concorrenti non si
+# sovrascrivono piu'. All'uscita di uno spawn CLI la coda viene svuotata dopo
+# la stampa del risultato.
+CHAIN_DEBUG = os.environ.get('UPROT_CHAIN_DEBUG', '0') == '1'
+CHAIN_DEBUG_SAMPLE = float(os.environ.get('UPROT_CHAIN_DEBUG_SAMPLE', '1.0'))
+CHAIN_DEBUG_DIR = os.environ.get('UPROT_CHAIN_DEBUG_DIR', '/tmp/uprot_debug')
+CHAIN_DEBUG_KEEP = int(os.environ.get('UPROT_CHAIN_DEBUG_KEEP', '30'))
+CHAIN_DEBUG_BODY = 24576
+_chain_dump_q: queue.Queue = queue.Queue(maxsize=16)
+_chain_dump_seq = 0
+_chain_dump_writer = None
+_chain_dump_lock = threading.Lock()
+
+
+def _chain_dump_write(snap):
+    try:
+        os.makedirs(CHAIN_DEBUG_DIR, exist_ok=True)
+        path = os.path.join(CHAIN_DEBUG_DIR, snap['id'] + '.json')
+        _write_json_atomic(path, snap)
+        files = sorted(f for f in os.listdir(CHAIN_DEBUG_DIR) if f.endswith('.json'))
+        for old in files[:-CHAIN_DEBUG_KEEP]:
+            try:
+                os.unlink(os.path.join(CHAIN_DEBUG_DIR, old))
+            except Exception:
+                pass
+        print(f'  [debug] chain snapshot {path} ({len(snap["hops"])} hops)', file=sys.stderr, flush=True)
+    except Exception:
+        pass
+
+
+def _chain_dump_loop():
+    while True:
+        snap = _chain_dump_q.get()
+        try:
+            _chain_dump_write(snap)
+        finally:
+            _chain_dump_q.task_done()
+
+
+def _chain_dump_flush():
+    while True:
+        try:
+            snap = _chain_dump_q.get_nowait()
+        except queue.Empty:
+            return
+        _chain_dump_write(snap)
+        _chain_dump_q.task_done()
+
+
+atexit.register(_chain_dump_flush)
+
+
+def _chain_hop(hops, name, url, status, t0, body):
+    hops.append({'name': name, 'url': url, 'status': status,
+                 'ms': int((time.time() - t0) * 1000),
+                 'bytes': len(body or ''), 'body': (body or '')[:CHAIN_DEBUG_BODY]})
+
+
+def _chain_snapshot(start_url, hops, out):
+    """Accoda lo snapshot della chain se debug attivo o fallimento campionato."""
+    global _chain_dump_seq, _chain_dump_writer
+    if not (CHAIN_DEBUG or (not out.get('ok') and random.random() < CHAIN_DEBUG_SAMPLE)):
+        return
+    with _chain_dump_lock:
+        _chain_dump_seq += 1
+        sid = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{_chain_dump_seq:04d}'
+        if _chain_dump_writer is None:
+            _chain_dump_writer = threading.Thread(target=_chain_dump_loop, daemon=True)
+            _chain_dump_writer.start()
+    snap = {'id': sid, 'url': start_url, 'ok': bool(out.get('ok')),
+            'error': out.get('error'), 'ts': int(time.time()), 'hops': hops}
+    try:
+        _chain_dump_q.put_nowait(snap)
+    except queue.Full:
+        pass
 
 
 # ---------------------------------------------------------------------------
@@ -482,6 +1370,13 @@ JQ_COOKIE_RE = re.compile(r"""\$\.cookie\(\s*['"]([A-Za-z0-9_-]+)['"]\s*,\s*['"]
 
 
 def _follow_maxstream_chain(uprots_link):
+    hops: list[dict] = []
+    out = _follow_maxstream_chain_hops(uprots_link, hops)
+    _chain_snapshot(uprots_link, hops, out)
+    return out
+
+
+def _follow_maxstream_chain_hops(uprots_link, hops):
     """Maxstream chain MammaMia-style.
 
     Strategia (allineata a Src/API/extractors/maxstream.py + uprot.py upstream):
@@ -503,25 +1398,18 @@ def _follow_maxstream_chain(uprots_link):
         m = M3U8_SRC_RE.search(body_str) or M3U8_FILE_RE.search(body_str) or M3U8_ANY_RE.search(body_str)
         return m.group(1) if m else None
 
-    def _dump(name, url, status, body):
-        try:
-            with open(f'/tmp/uprot_debug_{name}.html', 'w') as fdbg:
-                fdbg.write(f'<!-- url={url} status={status} -->\n')
-                fdbg.write(body[:24576])
-            print(f'  [debug] {name} dumped to /tmp/uprot_debug_{name}.html ({len(body)} bytes)',
-                  file=sys.stderr, flush=True)
-        except Exception:
-            pass
-
     # Step 1: GET uprots con redirect=True (delega chain redirect a curl_cffi).
+    t0 = time.time()
     try:
         st, hdrs, raw = http(uprots_link, 'GET', headers=headers, redirect=True)
     except Exception as e:
+        _chain_hop(hops, 'uprots', uprots_link, 0, t0, str(e))
         return {'ok': False, 'error': f'uprots GET failed: {e}'}
-    if st != 200:
-        return {'ok': False, 'error': f'uprots GET status {st}'}
     body = raw.decode('utf-8', 'replace') if raw else ''
     final_url = hdrs.get('_final_url') or uprots_link
+    _chain_hop(hops, 'uprots', final_url, st, t0, body)
+    if st != 200:
+        return {'ok': False, 'error': f'uprots GET status {st}'}
 
     # Step 2: m3u8 sul body finale (caso comune MammaMia per /msf/->/mse/).
     m3u = _find_m3u8(body)
@@ -552,23 +1440,24 @@ def _follow_maxstream_chain(uprots_link):
         if m_if:
             target = m_if.group(1)
     if not target:
-        _dump('player', final_url, st, body)
         return {'ok': False, 'error': f'no m3u8/watchfree on final page (final_url={final_url[:80]})'}
 
     # Step 4: GET player page con redirect=True e cerca m3u8.
     player_hdrs = dict(UPROT_FULL_HEADERS)
     player_hdrs['Referer'] = final_url
     player_hdrs['Origin'] = 'https://maxstream.video'
+    t0 = time.time()
     try:
         st2, hdrs2, raw2 = http(target, 'GET', headers=player_hdrs, redirect=True)
     except Exception as e:
+        _chain_hop(hops, 'player', target, 0, t0, str(e))
         return {'ok': False, 'error': f'player GET failed: {e}'}
     body2 = raw2.decode('utf-8', 'replace') if raw2 else ''
+    _chain_hop(hops, 'player', target, st2, t0, body2)
     m3u = _find_m3u8(body2)
     if m3u:
         return {'ok': True, 'kind': 'maxstream', 'm3u8': m3u,
                 'headers': {'Referer': 'https://maxstream.video/'}}
-    _dump('player', target, st2, body2)
     return {'ok': False, 'error': f'no m3u8 on player page ({target[:80]})'}
 
 
@@ -585,28 +1474,13 @@ def _find_continue_link(body):
     dell'anchor con testo "CONTINUE"; quindi diamo precedenza a quello
     rispetto al primo match regex.
     """
-    # 1) Anchor con testo CONTINUE / C O N T I N U E (priorità: è il link
-    #    che il browser seguirebbe cliccando il pulsante).
-    for a_m in re.finditer(r'<a[^>]+href=["\']([^"\']+)["\'][^>]*>(.*?)</a>', body, re.I | re.S):
-        href = a_m.group(1)
-        text = re.sub(r'\s+', '', a_m.group(2)).upper()
-        if 'CONTINUE' in text and ('maxstream' in href or 'clicka' in href or 'uprots' in href or 'adelta' in href):
-            return href
+    sc = _scan_page(body)
+    # 1) Anchor con testo CONTINUE / C O N T I N U E verso maxstream/clicka
+    #    (priorità: è il link che il browser seguirebbe cliccando il pulsante).
     # 2) Fallback: primo uprots/adelta URL nel body (può essere dummy se la
     #    pagina ne contiene più d'uno, ma è meglio di niente).
-    m = UPROTS_RE.search(body)
-    if m:
-        return m.group(0)
-    m = ADELTA_RE.search(body)
-    if m:
-        return m.group(0)
     # 3) Fallback finale: anchor CONTINUE senza filtro host.
-    for a_m in re.finditer(r'<a[^>]+href=["\']([^"\']+)["\'][^>]*>(.*?)</a>', body, re.I | re.S):
-        href = a_m.group(1)
-        text = re.sub(r'\s+', '', a_m.group(2)).upper()
-        if 'CONTINUE' in text:
-            return href
-    return None
+    return sc['continue'] or sc['uprots'] or sc['adelta'] or sc['continue_any']
 
 
 def resolve_uprot_fast(url):
@@ -671,11 +1545,13 @@ def resolve_uprot_fast(url):
     # inline runtime. Il provider chiamante deve fare skip immediato dello
     # stream. Il warmup periodico ripopolera' lo state.
     if _is_captcha_page(body_text):
+        _wl_event('uprot', 'lost')
         return {'ok': False, 'error': 'captcha_required'}
     cont = _find_continue_link(body_text)
     if not cont:
         preview = re.sub(r'\s+', ' ', body_text[:200])
         return {'ok': False, 'error': f'no continue link in body: {preview[:160]}'}
+    _wl_event('uprot', 'alive')
     if 'maxstream' in cont or '/uprots/' in cont:
         # Può essere un uprots/<id> o un redirect chain. Risolvi via chain.
         if '/uprots/' not in cont:
@@ -711,7 +1587,7 @@ def resolve_clicka_fast(url):
             stp, _hp, rawp = http(safego_url, 'POST', post_data, post_hdrs, via_proxy=True)
             if stp == 200:
                 bodyp = rawp.decode('utf-8', 'replace')
-                if ADELTA_RE.search(bodyp) and not _is_captcha_page(bodyp):
+                if _scan_page(bodyp)['adelta']:
                     body = bodyp
         # Se lo state non c'era o non ha funzionato, GET normale + OCR inline.
         if body is None:
@@ -720,14 +1596,15 @@ def resolve_clicka_fast(url):
             safego_hdrs['Referer'] = safego_url
             st, hdrs, raw = http(safego_url, 'GET', headers=safego_hdrs, via_proxy=True)
             body = raw.decode('utf-8', 'replace')
-        m = ADELTA_RE.search(body)
-        if not m:
+        adelta = _scan_page(body)['adelta']
+        if not adelta:
             if _is_captcha_page(body):
                 # NIENTE OCR inline runtime. Skip immediato.
+                _wl_event('clicka', 'lost')
                 return {'ok': False, 'error': 'captcha_required'}
             else:
                 return {'ok': False, 'error': 'no adelta link on safego page'}
-        adelta = m.group(0)
+        _wl_event('clicka', 'alive')
     else:
         m = ADELTA_RE.search(url)
         if not m:
@@ -750,6 +1627,7 @@ def resolve_clicka_fast(url):
 # ---------------------------------------------------------------------------
 
 def _captcha_solve_attempt(url, field, origin, via_proxy):
+    _telemetry_ocr_attempt()
     # Full browser headers: CF su uprot.net/safego.cc richiede l'header set
     # completo anche con TLS chrome impersonation. Vedi prepare_manual().
     get_hdrs = dict(UPROT_FULL_HEADERS)
@@ -765,24 +1643,35 @@ def _captcha_solve_attempt(url, field, origin, via_proxy):
         if loc and any(mk in loc_low for mk in next_hop_markers):
             # Cookie correnti dal jar persistito (set durante questa GET).
             current_cookies = dict(_cookies_for(url))
+            _wl_event(_domain_for(url), 'alive')
             return {'ok': True, 'body': loc, 'already_open': True,
                     'cookies': current_cookies, 'data': {}}
         return {'ok': False, 'error': f'GET status {st} loc={loc[:80]}'}
     if st != 200:
         return {'ok': False, 'error': f'GET status {st}'}
     body = raw.decode('utf-8', 'replace')
-    if UPROTS_RE.search(body) or ADELTA_RE.search(body):
+    if _bypass_link(body):
         # Body gia' contiene il link bypass: l'IP e' whitelistato. Popoliamo i
         # cookies dal jar persistito cosi' il caller puo' salvare uno state
         # coerente (mtime fresca per la UI /chapta).
         current_cookies = dict(_cookies_for(url))
+        _wl_event(_domain_for(url), 'alive')
         return {'ok': True, 'body': body, 'already_open': True,
                 'cookies': current_cookies, 'data': {}}
     cookie = cookies_from(hdrs)
     png = _extract_captcha_png(body)
     if not png:
         return {'ok': False, 'error': 'no captcha png on GET'}
-    guess = _ocr_one(png)
+    _wl_event(_domain_for(url), 'lost')
+    reads = {}
+    solver = 'phash'
+    guess = _captcha_answer_lookup(png, field)
+    if not guess:
+        solver = 'template'
+        guess = _template_read(png, field)
+    if not guess:
+        solver = 'tesseract'
+        guess, reads = _ocr_vote(png)
     if not guess:
         return {'ok': False, 'error': 'OCR produced no candidate'}
     post_data = {field: guess}
@@ -795,7 +1684,7 @@ def _captcha_solve_attempt(url, field, origin, via_proxy):
     post_hdrs['Content-Type'] = 'application/x-www-form-urlencoded'
     st2, hdrs2, raw2 = http(url, 'POST', post_body, post_hdrs, via_proxy=via_proxy)
     body2 = raw2.decode('utf-8', 'replace')
-    if UPROTS_RE.search(body2) or ADELTA_RE.search(body2):
+    if _bypass_link(body2):
         # Cookies dopo solve: ricostruiamo dal cookie jar persistito + eventuali
         # nuovi set-cookie ritornati nella POST response.
         merged_cookies = dict(_cookies_for(url))
@@ -806,9 +1695,18 @@ def _captcha_solve_attempt(url, field, origin, via_proxy):
                 m_kv = re.match(r'([A-Za-z0-9_\-]+)=([^;]+)', entry)
                 if m_kv:
                     merged_cookies[m_kv.group(1)] = m_kv.group(2)
-        return {'ok': True, 'body': body2, 'guess': guess,
+        _ocr_stats_record(reads, guess, accepted=True)
+        _digit_templates_learn(png, guess, field)
+        _captcha_answer_store(png, field, guess)
+        _wl_event(_domain_for(url), 'gained')
+        return {'ok': True, 'body': body2, 'guess': guess, 'solver': solver,
                 'cookies': merged_cookies, 'data': post_data}
-    return {'ok': False, 'error': f'wrong guess {guess}', 'guess': guess}
+    # 403/429/503: il captcha non e' stato valutato, non dice nulla sull'OCR.
+    if st2 == 200:
+        _ocr_stats_record(reads, guess, accepted=False)
+        if solver == 'phash':
+            _captcha_answer_store(png, field, None)
+    return {'ok': False, 'error': f'wrong guess {guess}', 'guess': guess, 'solver': solver}
 
 
 def _solve_captcha_inline(url, field, origin, via_proxy, label):
@@ -865,7 +1763,7 @@ def _uprot_whitelist_probe(url):
     if st != 200:
         return {'ok': False, 'error': f'probe status {st}'}
     body = raw.decode('utf-8', 'replace') if raw else ''
-    if UPROTS_RE.search(body) or ADELTA_RE.search(body):
+    if _bypass_link(body):
         return {'ok': True, 'body': body}
     return {'ok': False, 'error': 'probe: no maxstream/clicka link (not whitelisted)'}
 
@@ -879,14 +1777,15 @@ def warmup_uprot(url):
     # rinfrescare la mtime del file di state per la UI /chapta.
     probe = _uprot_whitelist_probe(url)
     if probe.get('ok'):
+        _wl_event('uprot', 'alive')
         body0 = probe.get('body') or ''
         merged = dict(_cookies_for(url))
         _uprot_state_save(merged, {})
         print(f'warmup_uprot SUCCESS (whitelist probe) state refreshed cookies={list(merged.keys())}',
               file=sys.stderr, flush=True)
-        m = UPROTS_RE.search(body0)
-        if m:
-            chain = _follow_maxstream_chain(m.group(0))
+        uprots = _scan_page(body0)['uprots']
+        if uprots:
+            chain = _follow_maxstream_chain(uprots)
             if chain.get('ok'):
                 return {'ok': True, 'kind': 'maxstream', 'm3u8': chain['m3u8'],
                         'headers': chain['headers'], 'diag': {'probe': True}}
@@ -925,9 +1824,9 @@ def warmup_uprot(url):
             # IP è ora whitelistato (il captcha è stato accettato). Indipendentemente
             # dal fatto che il chain maxstream completi o meno, il goal del warmup
             # è raggiunto: non ci servono altri tentativi.
-            m = UPROTS_RE.search(r['body'])
-            if m:
-                chain = _follow_maxstream_chain(m.group(0))
+            uprots = _scan_page(r['body'])['uprots']
+            if uprots:
+                chain = _follow_maxstream_chain(uprots)
                 if chain.get('ok'):
                     print(f'warmup_uprot SUCCESS m3u8 ok', file=sys.stderr, flush=True)
                     return {'ok': True, 'kind': 'maxstream', 'm3u8': chain['m3u8'],
@@ -993,11 +1892,242 @@ def warmup_clicka(url):
     return {'ok': False, 'error': 'warmup attempts exhausted', 'diag': diag}
 
 
+# ---------------------------------------------------------------------------
+# Whitelist expiry learning
+# ---------------------------------------------------------------------------
+# Invece di un timer fisso, impariamo quanto dura la whitelist di uprot/clicka
+# per ogni slot. Eventi:
+#   gained: captcha accettato (warmup o /chapta manuale)
+#   alive:  una GET e' passata senza captcha (probe, resolve runtime)
+#   lost:   prima pagina captcha vista dopo un gained
+# Ogni gained->lost produce un campione di durata (scadenza stimata a meta'
+# tra l'ultimo alive e il lost). Il prossimo warmup e' pianificato a
+# gained + quantile(durate) - lead, e la schedule viene riscritta in
+# WHITELIST_SCHEDULE_PATH ad ogni evento: il timer Node la legge a ogni tick.
+WHITELIST_HISTORY_PATH = os.environ.get('UPROT_WHITELIST_HISTORY_PATH', '/tmp/uprot_whitelist_history.json')
+WHITELIST_SCHEDULE_PATH = os.environ.get('UPROT_WHITELIST_SCHEDULE_PATH', '/tmp/uprot_whitelist_schedule.json')
+WHITELIST_DEFAULT_TTL = int(os.environ.get('UPROT_WHITELIST_DEFAULT_TTL_S', str(2 * 3600)))
+WHITELIST_LEAD = int(os.environ.get('UPROT_WHITELIST_LEAD_S', '600'))
+WHITELIST_QUANTILE = float(os.environ.get('UPROT_WHITELIST_QUANTILE', '0.2'))
+WHITELIST_MIN_SAMPLES = int(os.environ.get('UPROT_WHITELIST_MIN_SAMPLES', '3'))
+WHITELIST_MAX_SAMPLES = 50
+# Gli 'alive' arrivano ad ogni resolve: aggiorniamo il file al massimo ogni N s.
+WHITELIST_ALIVE_EVERY = 60
+
+
+def _quantile(values, q):
+    v = sorted(values)
+    if not v:
+        return None
+    pos = (len(v) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(v) - 1)
+    return v[lo] + (v[hi] - v[lo]) * (pos - lo)
+
+
+def _wl_history_load() -> dict:
+    try:
+        with open(WHITELIST_HISTORY_PATH, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _wl_event(domain, kind):
+    """Registra un evento gained|alive|lost per lo slot corrente di `domain`."""
+    try:
+        slot = _domain_slot(domain)
+    except Exception:
+        return
+    now = int(time.time() * 1000)
+    # Daemon e spawn CLI aggiornano lo stesso storico: lock di processo + flock.
+    with _json_file_lock(WHITELIST_HISTORY_PATH):
+        hist = _wl_history_load()
+        st = hist.setdefault(domain, {}).setdefault(slot, {'samples_s': []})
+        before = json.dumps(st, sort_keys=True)
+        if kind == 'gained':
+            st.update(gained_ms=now, alive_ms=now, lost_ms=None)
+        elif kind == 'alive':
+            if st.get('lost_ms') or not st.get('gained_ms'):
+                # Whitelistato senza un gained osservato (es. primo avvio):
+                # l'inizio reale e' ignoto, partiamo da qui.
+                st.update(gained_ms=now, lost_ms=None)
+            elif now - (st.get('alive_ms') or 0) < WHITELIST_ALIVE_EVERY * 1000:
+                return
+            st['alive_ms'] = now
+        elif kind == 'lost':
+            if not st.get('gained_ms') or st.get('lost_ms'):
+                return
+            st['lost_ms'] = now
+            alive = st.get('alive_ms') or st['gained_ms']
+            life_s = ((alive + now) / 2 - st['gained_ms']) / 1000
+            st['samples_s'] = (st.get('samples_s') or [])[-(WHITELIST_MAX_SAMPLES - 1):] + [round(life_s)]
+        if json.dumps(st, sort_keys=True) == before:
+            return
+        _write_json_atomic(WHITELIST_HISTORY_PATH, hist)
+        _write_json_atomic(WHITELIST_SCHEDULE_PATH, _wl_schedule(hist))
+
+
+def _wl_schedule(hist=None):
+    """Prossimo warmup consigliato per dominio/slot (ms epoch)."""
+    hist = _wl_history_load() if hist is None else hist
+    now = int(time.time() * 1000)
+    out = {'ok': True, 'kind': 'schedule', 'now_ms': now, 'domains': {}}
+    for domain in ('uprot', 'clicka'):
+        slots_out = {}
+        for slot, st in (hist.get(domain) or {}).items():
+            samples = st.get('samples_s') or []
+            if len(samples) >= WHITELIST_MIN_SAMPLES:
+                ttl_s = _quantile(samples, WHITELIST_QUANTILE)
+            else:
+                ttl_s = WHITELIST_DEFAULT_TTL
+            if st.get('lost_ms') or not st.get('gained_ms'):
+                next_ms = now
+            else:
+                next_ms = max(now, int(st['gained_ms'] + (ttl_s - WHITELIST_LEAD) * 1000))
+            slots_out[slot] = {
+                'gained_ms': st.get('gained_ms'), 'alive_ms': st.get('alive_ms'),
+                'lost_ms': st.get('lost_ms'), 'samples': len(samples),
+                'ttl_p50_s': _quantile(samples, 0.5), 'ttl_s': ttl_s,
+                'next_warmup_ms': next_ms,
+            }
+        active = _effective_slot(domain)
+        act = slots_out.get(active)
+        out['domains'][domain] = {
+            'active_slot': active,
+            # Il warmup (anche --warmup-all) serve appena uno slot noto scade.
+            'next_warmup_ms': min((v['next_warmup_ms'] for v in slots_out.values()), default=None),
+            'active_next_warmup_ms': act['next_warmup_ms'] if act else None,
+            'slots': slots_out,
+        }
+    return out
+
+
 # ---------------------------------------------------------------------------
 # Folder parser
 # ---------------------------------------------------------------------------
 
+# Cache indice folder: le entries parsate di una /msfld/ vanno nella stessa
+# sqlite della resolve cache (tabella folders, TTL FOLDER_CACHE_TTL) e ogni
+# /msfi/ e' indicizzato per (folder, season, episode) in folder_episodes.
+# Quando un episodio viene risolto, il daemon --serve risolve in background i
+# PREFETCH_NEXT episodi successivi dello stesso folder, cosi' il "prossimo
+# episodio" parte gia' dalla resolve cache. Negli spawn CLI il processo
+# termina subito dopo la stampa, quindi niente prefetch.
+FOLDER_CACHE_TTL = int(os.environ.get('UPROT_FOLDER_CACHE_TTL', '1800'))
+PREFETCH_NEXT = int(os.environ.get('UPROT_PREFETCH_NEXT', '2'))
+_prefetch_enabled = False
+_prefetch_inflight: set[str] = set()
+_prefetch_lock = threading.Lock()
+
+
+def _folder_cache_get(url):
+    try:
+        db = _resolve_cache_db()
+        row = db.execute('SELECT entries, expires FROM folders WHERE url = ?', (url,)).fetchone()
+        if row and row[1] > time.time():
+            return json.loads(row[0])
+    except Exception:
+        pass
+    return None
+
+
+def _folder_cache_purge(db, now):
+    """Rimuove i folder scaduti insieme ai loro episodi indicizzati."""
+    db.execute('DELETE FROM folder_episodes WHERE folder IN (SELECT url FROM folders WHERE expires <= ?)', (now,))
+    db.execute('DELETE FROM folders WHERE expires <= ?', (now,))
+
+
+def _folder_cache_put(url, entries):
+    if FOLDER_CACHE_TTL <= 0:
+        return
+    try:
+        db = _resolve_cache_db()
+        with db:
+            db.execute('INSERT OR REPLACE INTO folders (url, entries, expires) VALUES (?, ?, ?)',
+                       (url, json.dumps(entries), time.time() + FOLDER_CACHE_TTL))
+            db.execute('DELETE FROM folder_episodes WHERE folder = ?', (url,))
+            db.executemany('INSERT OR REPLACE INTO folder_episodes (msfi, folder, season, episode) '
+                           'VALUES (?, ?, ?, ?)',
+                           [(e['msfi'], url, e['season'], e['episode']) for e in entries])
+            _folder_cache_purge(db, time.time())
+    except Exception:
+        pass
+
+
+def folder_episode(url, season, episode):
+    """Entry (season, episode) di un folder, via indice se gia' in cache."""
+    u = url.strip()
+    if _folder_cache_get(u) is None:
+        folder = parse_folder(u)
+        if not folder.get('ok'):
+            return folder
+    try:
+        db = _resolve_cache_db()
+        row = db.execute('SELECT msfi FROM folder_episodes WHERE folder = ? AND season = ? AND episode = ?',
+                         (u, int(season), int(episode))).fetchone()
+    except Exception as e:
+        return {'ok': False, 'error': f'folder index failed: {e}'}
+    if not row:
+        return {'ok': False, 'error': f'episode S{season}E{episode} not in folder'}
+    entry = next((e for e in _folder_cache_get(u) or [] if e['msfi'] == row[0]), None)
+    return {'ok': True, 'kind': 'folder_episode', 'entry': entry or {'msfi': row[0]}}
+
+
+def _next_episodes(msfi, n):
+    """Gli n episodi che seguono msfi nel suo folder (ordine season, episode)."""
+    try:
+        db = _resolve_cache_db()
+        cur = db.execute('SELECT folder, season, episode FROM folder_episodes WHERE msfi = ?',
+                         (msfi,)).fetchone()
+        if not cur or cur[1] is None or cur[2] is None:
+            return []
+        rows = db.execute('SELECT msfi FROM folder_episodes WHERE folder = ? AND '
+                          '(season > ? OR (season = ? AND episode > ?)) '
+                          'ORDER BY season, episode LIMIT ?',
+                          (cur[0], cur[1], cur[1], cur[2], n)).fetchall()
+    except Exception:
+        return []
+    return [r[0] for r in rows]
+
+
+def _prefetch_next(u):
+    if not _prefetch_enabled or PREFETCH_NEXT <= 0:
+        return
+    for nxt in _next_episodes(u, PREFETCH_NEXT):
+        with _prefetch_lock:
+            if nxt in _prefetch_inflight:
+                continue
+            _prefetch_inflight.add(nxt)
+
+        def run(target=nxt):
+            _tls.prefetch = True
+            try:
+                if _resolve_cache_get(target) is None:
+                    out = resolve(target, prefetch=False)
+                    print(f'[prefetch] {target[:80]} ok={out.get("ok")}', file=sys.stderr, flush=True)
+            except Exception as e:
+                print(f'[prefetch] {target[:80]} error: {e}', file=sys.stderr, flush=True)
+            finally:
+                with _prefetch_lock:
+                    _prefetch_inflight.discard(target)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
 def parse_folder(url):
+    u = url.strip()
+    entries = _folder_cache_get(u)
+    if entries is not None:
+        return {'ok': True, 'kind': 'folder', 'entries': entries, 'cached': True}
+    out = _parse_folder_uncached(u)
+    if out.get('ok'):
+        _folder_cache_put(u, out['entries'])
+    return out
+
+
+def _parse_folder_uncached(url):
     # Full browser headers anche sul folder GET: uprot.net e' dietro CF.
     folder_hdrs = dict(UPROT_FULL_HEADERS)
     folder_hdrs['Referer'] = 'https://uprot.net/'
@@ -1032,14 +2162,131 @@ def parse_folder(url):
     return {'ok': True, 'kind': 'folder', 'entries': entries}
 
 
+# ---------------------------------------------------------------------------
+# Resolve cache (sqlite, condivisa tra processi)
+# ---------------------------------------------------------------------------
+# Lo stesso /msf/ o /msfi/ viene risolto ad ogni play: uprot -> uprots ->
+# watchfree -> emvvv, tutto via proxy. Salviamo {m3u8, headers} (o il link
+# deltabit) per URL di input. TTL: dal parametro di scadenza nell'URL finale
+# se presente (meno un margine), altrimenti RESOLVE_CACHE_TTL. sqlite perche'
+# la cache deve essere condivisa tra il daemon --serve e gli spawn CLI.
+# Un play fallito si segnala con --invalidate <url> (o op "invalidate").
+RESOLVE_CACHE_PATH = os.environ.get('UPROT_RESOLVE_CACHE_PATH', '/tmp/uprot_resolve_cache.sqlite')
+RESOLVE_CACHE_TTL = int(os.environ.get('UPROT_RESOLVE_CACHE_TTL', '900'))
+RESOLVE_CACHE_MAX_TTL = int(os.environ.get('UPROT_RESOLVE_CACHE_MAX_TTL', str(6 * 3600)))
+RESOLVE_CACHE_MARGIN = int(os.environ.get('UPROT_RESOLVE_CACHE_MARGIN', '120'))
+_EXPIRY_PARAMS = ('e', 'exp', 'expires', 'expiry', 'expire', 'expiration', 'valid', 'deadline', 'validto')
+
+
+_resolve_cache_schema: set[str] = set()
+_resolve_cache_schema_lock = threading.Lock()
+
+
+def _resolve_cache_db():
+    """Connessione sqlite del thread corrente (riusata: il cache hit non paga
+    connect + PRAGMA + DDL). Lo schema si crea una volta per processo."""
+    conn = getattr(_tls, 'resolve_cache_db', None)
+    if conn is not None and conn[0] == RESOLVE_CACHE_PATH:
+        return conn[1]
+    db = sqlite3.connect(RESOLVE_CACHE_PATH, timeout=2)
+    with _resolve_cache_schema_lock:
+        if RESOLVE_CACHE_PATH not in _resolve_cache_schema:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS resolved '
+                       '(url TEXT PRIMARY KEY, result TEXT NOT NULL, expires REAL NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS folders '
+                       '(url TEXT PRIMARY KEY, entries TEXT NOT NULL, expires REAL NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS folder_episodes '
+                       '(msfi TEXT PRIMARY KEY, folder TEXT NOT NULL, season INTEGER, episode INTEGER)')
+            db.execute('CREATE INDEX IF NOT EXISTS folder_episodes_se ON folder_episodes (folder, season, episode)')
+            db.commit()
+            _resolve_cache_schema.add(RESOLVE_CACHE_PATH)
+    if conn is not None:
+        conn[1].close()
+    _tls.resolve_cache_db = (RESOLVE_CACHE_PATH, db)
+    return db
+
+
+def _resolved_ttl(result):
+    """TTL in secondi per un risultato ok, letto dai parametri di scadenza del link."""
+    link = result.get('m3u8') or result.get('deltabit') or ''
+    try:
+        qs = urllib.parse.parse_qs(urllib.parse.urlparse(link).query)
+    except Exception:
+        qs = {}
+    now = time.time()
+    for name in _EXPIRY_PARAMS:
+        for v in qs.get(name, []):
+            if re.fullmatch(r'\d{10}(?:\d{3})?', v):
+                ts = int(v) / (1000 if len(v) == 13 else 1)
+                if ts > now:
+                    return max(0, min(ts - now - RESOLVE_CACHE_MARGIN, RESOLVE_CACHE_MAX_TTL))
+    return RESOLVE_CACHE_TTL
+
+
+def _resolve_cache_get(url):
+    try:
+        db = _resolve_cache_db()
+        row = db.execute('SELECT result, expires FROM resolved WHERE url = ?', (url,)).fetchone()
+    except Exception:
+        return None
+    if not row or row[1] <= time.time():
+        return None
+    try:
+        out = json.loads(row[0])
+    except Exception:
+        return None
+    out['cached'] = True
+    return out
+
+
+def _resolve_cache_put(url, result):
+    ttl = _resolved_ttl(result)
+    if ttl <= 0:
+        return
+    try:
+        db = _resolve_cache_db()
+        with db:
+            db.execute('INSERT OR REPLACE INTO resolved (url, result, expires) VALUES (?, ?, ?)',
+                       (url, json.dumps(result), time.time() + ttl))
+            db.execute('DELETE FROM resolved WHERE expires <= ?', (time.time(),))
+            _folder_cache_purge(db, time.time())
+    except Exception:
+        pass
+
+
+def invalidate(url):
+    """Rimuove un URL dalla resolve cache (es. il player ha fallito sull'm3u8)."""
+    try:
+        db = _resolve_cache_db()
+        with db:
+            n = db.execute('DELETE FROM resolved WHERE url = ?', (url.strip(),)).rowcount
+    except Exception as e:
+        return {'ok': False, 'error': f'invalidate failed: {e}'}
+    return {'ok': True, 'removed': n}
+
+
 # ---------------------------------------------------------------------------
 # Public dispatch
 # ---------------------------------------------------------------------------
 
-def resolve(url):
+def resolve(url, prefetch=True):
     u = url.strip()
     if re.search(r'uprot\.net/msfld/', u, re.I):
         return parse_folder(u)
+    cached = _resolve_cache_get(u)
+    if cached:
+        return _telemetry_run('resolve', u, lambda: cached)
+    out = _telemetry_run('resolve', u, lambda: _resolve_uncached(u))
+    if out.get('ok') and out.get('kind') in ('maxstream', 'deltabit'):
+        _resolve_cache_put(u, out)
+    # Solo su miss: su un hit i successivi sono gia' stati accodati allora.
+    if prefetch and out.get('ok'):
+        _prefetch_next(u)
+    return out
+
+
+def _resolve_uncached(u):
     if re.search(r'uprot\.net/(?:msf|msfi|msei|msdi)/', u, re.I):
         return resolve_uprot_fast(u)
     if re.search(r'maxstream\.video/uprots/', u, re.I):
@@ -1049,15 +2296,166 @@ def resolve(url):
     return {'ok': False, 'error': f'unsupported url: {u[:120]}'}
 
 
+# ---------------------------------------------------------------------------
+# Batch resolve (--resolve-batch)
+# ---------------------------------------------------------------------------
+# Risolve molti link in parallelo (es. tutti gli episodi di una /msfld/) e
+# stampa un risultato NDJSON per riga appena pronto. La concorrenza e' limitata
+# per egress (URL proxy dello slot del primo hop), cosi' un folder da 20
+# episodi non apre 20 chain simultanee sullo stesso IP.
+# Thread invece di curl_cffi AsyncSession: resolve() e' la stessa chain
+# sincrona del percorso singolo (http() con sessioni curl_cffi per thread,
+# stato per-thread in _tls, resolve cache sqlite per thread, OCR/telemetria),
+# e una versione async andrebbe duplicata hop per hop. Il tempo e' tutto
+# attesa di rete, durante la quale curl rilascia il GIL, quindi i thread
+# sovrappongono le chain quanto un event loop.
+BATCH_WORKERS = int(os.environ.get('UPROT_BATCH_WORKERS', '8'))
+BATCH_PER_SLOT = int(os.environ.get('UPROT_BATCH_PER_SLOT', '3'))
+
+
+def _batch_items(urls):
+    """Espande le /msfld/ nei loro episodi. Yield (url, extra_fields)."""
+    for raw in urls:
+        u = (raw or '').strip()
+        if not u:
+            continue
+        if re.search(r'uprot\.net/msfld/', u, re.I):
+            try:
+                folder = parse_folder(u)
+            except Exception as e:
+                folder = {'ok': False, 'error': f'exception: {e}'}
+            if not folder.get('ok'):
+                yield u, {'folder_error': folder.get('error')}
+                continue
+            for e in folder.get('entries') or []:
+                yield e['msfi'], {'folder': u, 'filename': e.get('filename'),
+                                  'season': e.get('season'), 'episode': e.get('episode')}
+            continue
+        yield u, {}
+
+
+def resolve_batch(urls, emit):
+    """Chiama emit(dict) per ogni URL risolto, nell'ordine di completamento.
+    Concorrenza su thread (non AsyncSession): vedi il commento di sezione."""
+    slot_sems: dict[str, threading.Semaphore] = {}
+    sems_lock = threading.Lock()
+
+    def one(u, extra):
+        if 'folder_error' in extra:
+            return {'url': u, 'ok': False, 'error': extra['folder_error']}
+        try:
+            key = _proxy_for(u)
+        except Exception:
+            key = ''
+        with sems_lock:
+            sem = slot_sems.setdefault(key, threading.Semaphore(max(1, BATCH_PER_SLOT)))
+        with sem:
+            # ms = tempo di resolve, esclusa l'attesa sul semaforo dello slot.
+            t0 = time.time()
+            try:
+                out = resolve(u, prefetch=False)
+            except Exception as e:
+                out = {'ok': False, 'error': f'exception: {e}'}
+            ms = int((time.time() - t0) * 1000)
+        return {'url': u, **extra, **out, 'ms': ms}
+
+    with ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS)) as pool:
+        futures = [pool.submit(one, u, extra) for u, extra in _batch_items(urls)]
+        for fut in as_completed(futures):
+            emit(fut.result())
+
+
 def warmup(url):
     u = url.strip()
     if re.search(r'uprot\.net/(?:msf|msfi|msei|msdi)/', u, re.I):
-        return warmup_uprot(u)
-    if re.search(r'clicka\.cc/(?:delta|adelta)/', u, re.I):
-        return warmup_clicka(u)
-    if re.search(r'uprot\.net/msfld/', u, re.I):
+        out = _telemetry_run('warmup', u, lambda: warmup_uprot(u))
+    elif re.search(r'clicka\.cc/(?:delta|adelta)/', u, re.I):
+        out = _telemetry_run('warmup', u, lambda: warmup_clicka(u))
+    elif re.search(r'uprot\.net/msfld/', u, re.I):
         return parse_folder(u)
-    return {'ok': False, 'error': f'unsupported warmup url: {u[:120]}'}
+    else:
+        return {'ok': False, 'error': f'unsupported warmup url: {u[:120]}'}
+    domain = _domain_for(u)
+    _slot_whitelist_record(domain, _domain_slot(domain), out)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Warmup di tutti gli slot (--warmup-all)
+# ---------------------------------------------------------------------------
+# Il warmup normale whitelista solo l'IP dello slot attivo: quando Node ruota
+# su PROXY_BACKUP o DIRECT il nuovo IP non e' whitelistato e ogni stream
+# fallisce con captcha_required fino al warmup successivo. --warmup-all esegue
+# il warmup su ogni slot configurato in parallelo (slot forzato per-thread),
+# salva lo state per-slot (uprot_state.<SLOT>.json) e registra l'esito in
+# SLOT_WHITELIST_PATH, cosi' il failover puo' adottare subito uno slot gia'
+# whitelistato.
+SLOT_WHITELIST_PATH = os.environ.get('UPROT_SLOT_WHITELIST_PATH', '/tmp/uprot_slot_whitelist.json')
+
+
+def _slot_whitelist_load() -> dict:
+    try:
+        with open(SLOT_WHITELIST_PATH, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _slot_whitelist_record(domain, slot, result):
+    entry = {'ok': bool(result.get('ok')), 'at_ms': int(time.time() * 1000)}
+    if result.get('ok'):
+        entry['kind'] = result.get('kind')
+    else:
+        entry['error'] = str(result.get('error') or '')[:200]
+    # warmup_all_slots registra tutti gli slot nello stesso istante, e anche i
+    # processi CLI scrivono qui: lock di processo + flock.
+    with _json_file_lock(SLOT_WHITELIST_PATH):
+        data = _slot_whitelist_load()
+        data.setdefault(domain, {})[slot] = entry
+        _write_json_atomic(SLOT_WHITELIST_PATH, data)
+
+
+def _configured_slots():
+    """Slot con un egress distinto: PROXY/PROXY_BACKUP se impostati (deduplicati
+    per endpoint) e DIRECT, che esiste sempre."""
+    slots, seen = [], set()
+    for slot in _VALID_SLOTS:
+        ep = '' if slot == 'DIRECT' else os.environ.get(slot, '').split('@')[-1].strip()
+        if slot != 'DIRECT' and not ep:
+            continue
+        if ep in seen:
+            continue
+        seen.add(ep)
+        slots.append(slot)
+    return slots
+
+
+def warmup_all_slots(url):
+    u = url.strip()
+    domain = _domain_for(u)
+    slots = _configured_slots()
+
+    def run(slot):
+        _tls.forced_slot = slot
+        try:
+            out = warmup(u)
+        except Exception as e:
+            out = {'ok': False, 'error': f'exception: {e}'}
+        finally:
+            _tls.forced_slot = None
+        out.pop('diag', None)
+        return slot, out
+
+    with ThreadPoolExecutor(max_workers=max(1, len(slots))) as pool:
+        results = dict(pool.map(run, slots))
+    ok_slots = [sl for sl in slots if results[sl].get('ok')]
+    out = {'ok': bool(ok_slots), 'kind': 'slots', 'domain': domain,
+           'active_slot': _effective_slot(domain),
+           'ok_slots': ok_slots, 'slots': results}
+    if not ok_slots:
+        out['error'] = 'warmup failed on every slot'
+    return out
 
 
 # ---------------------------------------------------------------------------
@@ -1082,12 +2480,12 @@ def prepare_manual(domain):
         url = os.environ.get('STREAMVIX_UPROT_WARMUP_URL', 'https://uprot.net/msf/rizwh38f389b')
         field = 'captcha'
         origin = 'https://uprot.net'
-        slot = _read_slot(UPROT_ACTIVE_SLOT_PATH)
         # Probe whitelist reale prima di scaricare la captcha PNG: se l'IP
         # corrente bypassa gia' /mse/, segnala already_whitelisted e refresh
         # state mtime cosi' la UI /chapta resta coerente.
         probe = _uprot_whitelist_probe(url)
         if probe.get('ok'):
+            _wl_event('uprot', 'alive')
             merged = dict(_cookies_for(url))
             _uprot_state_save(merged, {})
             return {'ok': True, 'already_whitelisted': True, 'domain': domain}
@@ -1108,9 +2506,11 @@ def prepare_manual(domain):
         url = loc
         field = 'captch5'
         origin = 'https://safego.cc'
-        slot = _read_slot(CLICKA_ACTIVE_SLOT_PATH)
     else:
         return {'ok': False, 'error': f'unknown domain: {domain}'}
+    # Slot che esegue davvero la GET (forzato > pin > auto-selezione > file
+    # slot): submit_manual deve postare la risposta dallo stesso IP.
+    slot = _domain_slot(domain)
     try:
         # Pass FULL browser headers (UPROT_FULL_HEADERS-style) on the GET.
         # Without these, Cloudflare on uprot.net/safego.cc replies 403 even
@@ -1131,11 +2531,12 @@ def prepare_manual(domain):
     if st != 200:
         return {'ok': False, 'error': f'GET status {st}'}
     body = raw.decode('utf-8', 'replace')
-    if UPROTS_RE.search(body) or ADELTA_RE.search(body):
+    if _bypass_link(body):
         return {'ok': True, 'already_whitelisted': True, 'domain': domain}
     png = _extract_captcha_png(body)
     if not png:
         return {'ok': False, 'error': 'no captcha png on GET'}
+    _wl_event(domain, 'lost')
     cookie = cookies_from(hdrs)
     session = {
         'domain': domain,
@@ -1145,6 +2546,9 @@ def prepare_manual(domain):
         'cookie': cookie,
         'proxy_slot': slot,
         'created_ms': int(time.time() * 1000),
+        # PNG anche nella session: submit_manual lo usa per imparare i template
+        # cifre quando il guess umano viene accettato.
+        'png_b64': base64.b64encode(png).decode('ascii'),
     }
     return {
         'ok': True,
@@ -1175,8 +2579,27 @@ def submit_manual(session_path, guess):
         return {'ok': False, 'error': 'invalid guess (digits only)'}
     # Forza lo slot della session: anche se nel frattempo il file slot e' stato
     # ruotato, la POST esce dallo stesso IP della GET fatta da prepare_manual.
+    prev_forced = getattr(_tls, 'forced_slot', None)
     if slot in _VALID_SLOTS:
-        os.environ['_FORCE_PROXY_SLOT'] = slot
+        _tls.forced_slot = slot
+    try:
+        out = _submit_manual_post(domain, url, field, origin, cookie, slot, guess)
+        # Ancora nello scope forzato: l'evento va sullo slot appena whitelistato.
+        if out.get('ok'):
+            _wl_event(domain, 'gained')
+    finally:
+        _tls.forced_slot = prev_forced
+    if out.get('ok') and sess.get('png_b64'):
+        try:
+            png = base64.b64decode(sess['png_b64'])
+            _digit_templates_learn(png, guess, field)
+            _captcha_answer_store(png, field, guess)
+        except Exception:
+            pass
+    return out
+
+
+def _submit_manual_post(domain, url, field, origin, cookie, slot, guess):
     post_data = {field: guess}
     post_body = urllib.parse.urlencode(post_data)
     # Full browser headers (allineato a MammaMia / prepare_manual GET).
@@ -1190,7 +2613,7 @@ def submit_manual(session_path, guess):
     except Exception as e:
         return {'ok': False, 'error': f'POST failed: {e}'}
     body = raw.decode('utf-8', 'replace')
-    if UPROTS_RE.search(body) or ADELTA_RE.search(body):
+    if _bypass_link(body):
         # Salva state esattamente come fa warmup_uprot / warmup_clicka.
         merged_cookies = dict(_cookies_for(url))
         sc = hdrs.get('set-cookie')
@@ -1218,24 +2641,165 @@ def submit_manual(session_path, guess):
     return {'ok': False, 'error': f'wrong guess (status {st})', 'guess': guess, 'proxy_slot': slot}
 
 
+# ---------------------------------------------------------------------------
+# Daemon mode (--serve)
+# ---------------------------------------------------------------------------
+# Node (shortenerResolver.ts) spawnava un processo per ogni link: import di PIL
+# e curl_cffi, nuova Session e nuovo handshake TLS via proxy ogni volta. In
+# modalita' --serve il processo resta vivo su un unix socket e riceve richieste
+# JSON una per riga; le sessioni curl_cffi restano nel pool per slot proxy.
+#
+# Richiesta:  {"op": "resolve", "url": "..."}            -> come --resolve
+#             {"op": "folder", "url": "..."}             -> come --folder
+#             (+ "season"/"episode" opzionali -> solo quell'entry)
+#             {"op": "warmup", "url": "..."}             -> come --warmup
+#             {"op": "warmup_all", "url": "..."}         -> come --warmup-all
+#             {"op": "prepare_manual", "domain": "..."}  -> come --prepare-manual
+#             {"op": "submit_manual", "session_path": "...", "guess": "..."}
+#             {"op": "invalidate", "url": "..."}           -> come --invalidate
+#             {"op": "schedule"}                         -> come --schedule
+#             {"op": "slots"}                            -> come --slots
+#             {"op": "stats"}                            -> come --stats
+#             {"op": "ping"}
+# Risposta:   una riga JSON, stesso formato dell'output CLI.
+
+def _dispatch(req):
+    if not isinstance(req, dict):
+        return {'ok': False, 'error': 'invalid request (expected JSON object)'}
+    op = str(req.get('op') or '')
+    if op == 'ping':
+        return {'ok': True, 'pid': os.getpid()}
+    if op == 'resolve':
+        return resolve(str(req.get('url') or ''))
+    if op == 'folder':
+        if req.get('season') is not None and req.get('episode') is not None:
+            return folder_episode(str(req.get('url') or ''), req['season'], req['episode'])
+        return parse_folder(str(req.get('url') or ''))
+    if op == 'invalidate':
+        return invalidate(str(req.get('url') or ''))
+    if op == 'warmup':
+        return warmup(str(req.get('url') or ''))
+    if op == 'warmup_all':
+        return warmup_all_slots(str(req.get('url') or ''))
+    if op == 'schedule':
+        return _wl_schedule()
+    if op == 'slots':
+        return slots_health()
+    if op == 'stats':
+        return telemetry_stats()
+    if op == 'prepare_manual':
+        return prepare_manual(str(req.get('domain') or ''))
+    if op == 'submit_manual':
+        return submit_manual(str(req.get('session_path') or ''), str(req.get('guess') or ''))
+    return {'ok': False, 'error': f'unknown op: {op[:40]}'}
+
+
+class _ServeHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out = _dispatch(json.loads(line))
+            except Exception as e:
+                out = {'ok': False, 'error': f'exception: {e}'}
+            try:
+                self.wfile.write((json.dumps(out) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except Exception:
+                return
+
+
+class _ServeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(sock_path):
+    # Socket rimasto da un'istanza precedente (crash/SIGKILL): se nessuno
+    # risponde lo rimuoviamo, altrimenti non rubiamo il path a un daemon vivo.
+    if os.path.exists(sock_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(sock_path)
+            probe.close()
+            print(f'[serve] another daemon is listening on {sock_path}', file=sys.stderr, flush=True)
+            sys.exit(1)
+        except OSError:
+            os.unlink(sock_path)
+    global _prefetch_enabled
+    _prefetch_enabled = True
+    server = _ServeServer(sock_path, _ServeHandler)
+    try:
+        os.chmod(sock_path, 0o600)
+    except Exception:
+        pass
+    print(f'[serve] listening on {sock_path} pid={os.getpid()}', file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(sock_path)
+        except Exception:
+            pass
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--resolve', help='URL to resolve (fast path, no captcha)')
     ap.add_argument('--warmup', help='URL for warmup (OCR captcha solve)')
+    ap.add_argument('--warmup-all', dest='warmup_all',
+                    help='URL per warmup parallelo su tutti gli slot proxy configurati')
     ap.add_argument('--folder', help='Folder URL to parse (uprot /msfld/)')
+    ap.add_argument('--season', type=int, help='Con --folder: ritorna solo l\'entry di questa stagione')
+    ap.add_argument('--episode', type=int, help='Con --folder: ritorna solo l\'entry di questo episodio')
     ap.add_argument('--prepare-manual', dest='prepare_manual',
                     help='Domain (uprot|clicka): scarica captcha tramite proxy attivo, ritorna PNG b64 + session')
     ap.add_argument('--submit-manual', dest='submit_manual',
                     help='Path al session JSON salvato da --prepare-manual')
     ap.add_argument('--guess', help='Captcha guess (cifre) per --submit-manual')
+    ap.add_argument('--resolve-batch', dest='resolve_batch', nargs='+', metavar='URL',
+                    help="URL da risolvere in parallelo (folder /msfld/ espanse; '-' = leggi da stdin). Output NDJSON")
+    ap.add_argument('--invalidate', help='URL da rimuovere dalla resolve cache (playback fallito)')
+    ap.add_argument('--schedule', action='store_true',
+                    help='Stampa la schedule warmup stimata dalla durata osservata delle whitelist')
+    ap.add_argument('--slots', action='store_true',
+                    help='Stampa salute per slot (latenza p50/p95, tassi 403/429/503, whitelist) e slot scelto')
+    ap.add_argument('--stats', action='store_true',
+                    help='Aggrega la telemetria resolve/warmup (percentili, success rate per slot/dominio/host)')
+    ap.add_argument('--serve', help='Unix socket path: daemon mode (richieste JSON una per riga)')
     args = ap.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
     try:
+        if args.resolve_batch:
+            urls = []
+            for a in args.resolve_batch:
+                urls.extend(sys.stdin.read().split() if a == '-' else [a])
+            resolve_batch(urls, lambda r: print(json.dumps(r), flush=True))
+            return
         if args.folder:
+            if args.season is not None and args.episode is not None:
+                print(json.dumps(folder_episode(args.folder, args.season, args.episode))); return
             print(json.dumps(parse_folder(args.folder))); return
         if args.warmup:
             print(json.dumps(warmup(args.warmup))); return
+        if args.warmup_all:
+            print(json.dumps(warmup_all_slots(args.warmup_all))); return
         if args.resolve:
             print(json.dumps(resolve(args.resolve))); return
+        if args.invalidate:
+            print(json.dumps(invalidate(args.invalidate))); return
+        if args.schedule:
+            print(json.dumps(_wl_schedule())); return
+        if args.slots:
+            print(json.dumps(slots_health())); return
+        if args.stats:
+            print(json.dumps(telemetry_stats())); return
         if args.prepare_manual:
             print(json.dumps(prepare_manual(args.prepare_manual))); return
         if args.submit_manual:
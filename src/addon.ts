@@ -25,6 +25,7 @@ declare function require(name: string): any;
 declare const global: any;
 import { AnimeUnityConfig } from './types/animeunity';
 import { EPGManager } from './utils/epg';
+import { execResolverCliCb, streamResolverCli, startLiveResolverSidecar } from './utils/liveResolverSidecar';
 import { execFile, spawn } from 'child_process';
 import * as crypto from 'crypto';
 import * as util from 'util';
@@ -1277,8 +1278,9 @@ function saveVavooCache(): void {
         };
 
         // Salva prima in un file temporaneo e poi rinomina per evitare file danneggiati
+        // (JSON compatto: vavoo_resolver.py ricalcola l'hash dai link)
         const tempPath = `${vavaoCachePath}.tmp`;
-        fs.writeFileSync(tempPath, JSON.stringify(cacheData, null, 2), 'utf-8');
+        fs.writeFileSync(tempPath, JSON.stringify(cacheData), 'utf-8');
 
         // Rinomina il file temporaneo nel file finale
         fs.renameSync(tempPath, vavaoCachePath);
@@ -1289,6 +1291,21 @@ function saveVavooCache(): void {
     }
 }
 
+// Manifest scritto da vavoo_resolver.py quando la cache cambia:
+// { timestamp, hash, prev_hash, added[], removed[], changed[] }
+const vavooManifestPath = path.join(__dirname, '../cache/vavoo_cache.manifest.json');
+
+function readVavooManifest(sinceMs: number): { added: string[]; removed: string[]; changed: string[] } | null {
+    try {
+        if (!fs.existsSync(vavooManifestPath)) return null;
+        const m = JSON.parse(fs.readFileSync(vavooManifestPath, 'utf-8'));
+        if (!m || typeof m.timestamp !== 'number' || m.timestamp < sinceMs) return null;
+        return { added: m.added || [], removed: m.removed || [], changed: m.changed || [] };
+    } catch {
+        return null;
+    }
+}
+
 // Funzione per aggiornare la cache Vavoo
 async function updateVavooCache(): Promise<boolean> {
     if (vavooCache.updating) {
@@ -1300,32 +1317,49 @@ async function updateVavooCache(): Promise<boolean> {
     console.log(`📺 Avvio aggiornamento cache Vavoo...`);
     try {
         // PATCH: Prendi TUTTI i canali da Vavoo, senza filtri su tv_channels.json
-        const result = await execFilePromise('python3', [
-            path.join(__dirname, '../vavoo_resolver.py'),
-            '--dump-channels'
-        ], { timeout: 30000 });
-
-        if (result.stdout) {
+        // NDJSON: un canale per riga appena arriva ogni pagina del catalogo.
+        // Ogni canale entra subito anche in vavooCache.links, cosi' si serve
+        // gia' durante il crawl senza tenere in memoria l'intero JSON.
+        const updatedLinks = new Map<string, string>();
+        let badLines = 0;
+        const startedAt = Date.now();
+        const code = await streamResolverCli(path.join(__dirname, '../vavoo_resolver.py'), [
+            '--dump-channels', '--ndjson'
+        ], (line: string) => {
             try {
-                const channels = JSON.parse(result.stdout);
-                console.log(`📺 Recuperati ${channels.length} canali da Vavoo (nessun filtro)`);
-                const updatedLinks = new Map<string, string>();
-                for (const ch of channels) {
-                    if (!ch || !ch.name || !ch.links) continue;
-                    const first = Array.isArray(ch.links) ? ch.links[0] : ch.links;
-                    if (first) updatedLinks.set(String(ch.name), String(first));
-                }
+                const ch = JSON.parse(line);
+                if (!ch || !ch.name || !ch.links) return;
+                const first = Array.isArray(ch.links) ? ch.links[0] : ch.links;
+                if (!first) return;
+                updatedLinks.set(String(ch.name), String(first));
+                vavooCache.links.set(String(ch.name), String(first));
+            } catch {
+                badLines++;
+            }
+        }, { timeout: 30000 });
+
+        if (badLines) console.error(`❌ Errore nel parsing di ${badLines} righe canali Vavoo`);
+        if (updatedLinks.size) {
+            console.log(`📺 Recuperati ${updatedLinks.size} canali da Vavoo (nessun filtro)`);
+            vavooCache.timestamp = Date.now();
+            if (code === 0) {
+                // Crawl completo: vavoo_resolver.py ha gia' scritto il file (solo se cambiato).
                 vavooCache.links = updatedLinks;
-                vavooCache.timestamp = Date.now();
+                const manifest = readVavooManifest(startedAt);
+                if (manifest) {
+                    console.log(`📺 Vavoo cache aggiornata: ${vavooCache.links.size} canali (+${manifest.added.length} -${manifest.removed.length} ~${manifest.changed.length})`);
+                } else {
+                    console.log(`📺 Vavoo cache invariata: ${vavooCache.links.size} canali`);
+                }
+            } else {
+                // Crawl incompleto (timeout/errore): si tengono anche i canali vecchi.
                 saveVavooCache();
                 console.log(`📺 Vavoo cache aggiornata: ${vavooCache.links.size} canali salvati`);
-            } catch (e) {
-                console.error('❌ Errore nel parsing canali Vavoo:', e);
             }
         } else {
             console.warn('⚠️ Nessun output da vavoo_resolver.py --dump-channels');
         }
-        return true;
+        return code === 0;
     } catch (error) {
         console.error('❌ Errore aggiornamento cache Vavoo:', error);
         return false;
@@ -6092,7 +6126,7 @@ function createBuilder(initialConfig: AddonConfig = {}) {
                                         }
                                     };
 
-                                    execFile('python3', [path.join(__dirname, '../tvtap_resolver.py'), vavooName], options, (error: Error | null, stdout: string, stderr: string) => {
+                                    execResolverCliCb(path.join(__dirname, '../tvtap_resolver.py'), [vavooName], options, (error: Error | null, stdout: string, stderr: string) => {
                                         clearTimeout(timeout);
 
                                         if (error) {
@@ -7498,7 +7532,8 @@ app.use('/public', express.static(path.join(__dirname, '..', 'public')));
             const href = isCurrent ? '#' : _withToken('/chapta', token, { [`set_${c.domain}`]: s.key });
             const onclick = isCurrent ? 'return false;' : '';
             return `<a href="${href}" onclick="${onclick}" style="display:inline-block;margin:.25em;padding:.45em .8em;border-radius:6px;text-decoration:none;font-size:.9em;${style}" title="${_escapeHtml(s.host)}">${_escapeHtml(s.label)}${isCurrent ? ' &check;' : ''}</a>`;
-        }).join('');
+        }).join('')
+            + `<a href="${_withToken('/chapta', token, { [`set_${c.domain}`]: 'AUTO' })}" style="display:inline-block;margin:.25em;padding:.45em .8em;border-radius:6px;text-decoration:none;font-size:.9em;background:#065f46;color:#fff;border:0" title="rimuove il pin: slot scelto per salute (latenza/errori)">AUTO</a>`;
         return `<div style="margin-top:.6em;padding-top:.5em;border-top:1px dashed #444">`
              + `<p style="margin:.2em 0;font-size:.85em;opacity:.8">Forza slot manualmente (resetta solo <code>${c.domain}</code>):</p>`
              + `<div>${btns}</div>`
@@ -7839,14 +7874,18 @@ app.use('/public', express.static(path.join(__dirname, '..', 'public')));
             _cleanupChaptaSessions();
             const token = _extractTokenAndLegacyQuery(req).token;
             const sr = require('./utils/shortenerResolver');
-            const { setActiveSlot } = sr;
+            const { setActiveSlot, clearSlotPin } = sr;
             const VALID = new Set(['PROXY', 'PROXY_BACKUP', 'DIRECT']);
             // Handle manual slot override: ?set_<domain>=<slot> — TOCCA SOLO
-            // il dominio richiesto. Non resetta l'altro.
+            // il dominio richiesto. Non resetta l'altro. La scelta manuale e'
+            // un pin (disattiva l'auto-selezione per salute slot);
+            // ?set_<domain>=AUTO rimuove il pin.
             for (const domain of ['uprot', 'clicka'] as const) {
                 const q = (req.query[`set_${domain}`] as string | undefined || '').trim();
-                if (q && VALID.has(q)) {
-                    try { setActiveSlot(domain, q as any); } catch { /* ignore */ }
+                if (q === 'AUTO') {
+                    try { clearSlotPin(domain); } catch { /* ignore */ }
+                } else if (q && VALID.has(q)) {
+                    try { setActiveSlot(domain, q as any, { pin: true }); } catch { /* ignore */ }
                     const statePath = domain === 'uprot' ? '/tmp/uprot_state.json' : '/tmp/clicka_state.json';
                     try { if (fs.existsSync(statePath)) fs.unlinkSync(statePath); } catch { /* ignore */ }
                     _dropCurrentCaptcha(domain);
@@ -8101,7 +8140,8 @@ app.use('/public', express.static(path.join(__dirname, '..', 'public')));
         }
     });
 
-    // POST /chapta/test-resolve  body: { url }
+    // POST /chapta/test-resolve  body: { url, refresh? }
+    // refresh=true invalida prima la resolve cache (link in cache che non va).
     // Esegue resolveShortener(url) usando lo slot attivo del dominio coerente
     // con l'URL (uprot.net -> uprot slot, clicka.cc -> clicka slot, gestito
     // dal python tramite i file /tmp/<dom>_active_proxy_slot.txt).
@@ -8125,6 +8165,9 @@ app.use('/public', express.static(path.join(__dirname, '..', 'public')));
                 if (domain && typeof sr.getActiveSlot === 'function') activeSlot = sr.getActiveSlot(domain);
             } catch { /* ignore */ }
             const timeoutMs = parseInt(process.env.TEST_RESOLVE_TIMEOUT_MS || '', 10) || 30000;
+            if (req.body && (req.body.refresh === true || req.body.refresh === '1')) {
+                await sr.invalidateShortener(url).catch(() => undefined);
+            }
             const result = await sr.resolveShortener(url, timeoutMs);
             const ms = Date.now() - t0;
             if (result && result.ok) {
@@ -8600,8 +8643,7 @@ app.get('/tvtap-resolve/:channelId', async (req: Request, res: Response) => {
             }
         };
 
-        execFile('python3', [
-            path.join(__dirname, '../tvtap_resolver.py'),
+        execResolverCliCb(path.join(__dirname, '../tvtap_resolver.py'), [
             // Se channelId è un numero, usa il formato tvtap_id:, altrimenti cerca per nome
             /^\d+$/.test(channelId) ? `tvtap_id:${channelId}` : channelId
         ], options, (error: Error | null, stdout: string, stderr: string) => {
@@ -9637,11 +9679,19 @@ function startServer(basePort: number, attempts = 0) {
         // OCR su un seed URL così che l'IP del server resti whitelistato e tutte le
         // chiamate runtime saltino direttamente il captcha (fast path).
         try {
-            const { startWarmupLoop } = require('./utils/shortenerResolver');
+            const { startWarmupLoop, startResolverDaemon } = require('./utils/shortenerResolver');
+            startResolverDaemon();
             startWarmupLoop();
         } catch (e) {
             console.warn('[addon] shortenerResolver warmup loop failed to start:', (e as Error).message);
         }
+        // Sidecar Vavoo/TVTap: un processo Python long-lived al posto di uno
+        // spawn per stream (le CLI restano come fallback).
+        try {
+            startLiveResolverSidecar();
+        } catch (e) {
+            console.warn('[addon] live resolver sidecar failed to start:', (e as Error).message);
+        }
     });
     server.on('error', (err: any) => {
         if (err.code === 'EADDRINUSE' && attempts < 10) {
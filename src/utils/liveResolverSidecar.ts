@@ -0,0 +1,255 @@
+/// <reference types="node" />
+/**
+ * Client per live_resolver_sidecar.py — un solo processo Python long-lived
+ * per vavoo_resolver.py e tvtap_resolver.py.
+ *
+ *   - startLiveResolverSidecar(): mantiene vivo `live_resolver_sidecar.py
+ *     --serve` su un unix socket (riavvio automatico). Disattivabile con
+ *     LIVE_RESOLVER_SIDECAR=0.
+ *
+ *   - execResolverCli(script, args, options): stessa firma/risultato di
+ *     execFile('python3', [script, ...args]) ma passa dal sidecar quando il
+ *     socket risponde (niente avvio interprete, import requests/RSA, TLS
+ *     nuovi). Se il sidecar non c'e' ricade sullo spawn per-call.
+ *
+ *   - streamResolverCli(script, args, onLine, options): per output NDJSON
+ *     (es. --dump-channels --ndjson) chiama onLine per ogni riga appena
+ *     arriva, senza bufferizzare tutto lo stdout.
+ */
+import { execFile, spawn, ChildProcess, ExecFileOptions, ExecFileOptionsWithStringEncoding } from 'child_process';
+import * as fs from 'fs';
+import * as net from 'net';
+import * as path from 'path';
+import * as readline from 'readline';
+import { resolvePython } from './shortenerResolver';
+
+const SIDECAR_SOCKET = process.env.LIVE_RESOLVER_SOCKET || '/tmp/live_resolver.sock';
+const SIDECAR_RESTART_MS = parseInt(process.env.LIVE_RESOLVER_RESTART_MS || '', 10) || 5000;
+// Exit code di `--serve` se il socket e' gia' servito da un altro sidecar (ALREADY_RUNNING_EXIT).
+const SIDECAR_ALREADY_RUNNING = 3;
+let sidecarProc: ChildProcess | null = null;
+let sidecarStopped = false;
+
+type CliReply = { ok: boolean; code: number; stdout: string; stderr: string };
+export type CliResult = { stdout: string; stderr: string };
+type CliError = Error & { code?: number; stdout?: string; stderr?: string };
+
+function sidecarScriptPath(): string {
+  const candidates = [
+    path.join(__dirname, '..', '..', 'live_resolver_sidecar.py'),
+    path.join(__dirname, '..', 'live_resolver_sidecar.py'),
+    path.join(process.cwd(), 'live_resolver_sidecar.py'),
+  ];
+  for (const c of candidates) {
+    if (fs.existsSync(c)) return c;
+  }
+  return candidates[0];
+}
+
+/** Avvia (e mantiene vivo) il sidecar. Disattivabile con LIVE_RESOLVER_SIDECAR=0. */
+export function startLiveResolverSidecar(): void {
+  if (process.env.LIVE_RESOLVER_SIDECAR === '0') {
+    console.log('[liveResolverSidecar] disabled by LIVE_RESOLVER_SIDECAR=0');
+    return;
+  }
+  if (sidecarProc) return;
+  sidecarStopped = false;
+  const proc = spawn(resolvePython(), [sidecarScriptPath(), '--serve', SIDECAR_SOCKET], {
+    env: { ...process.env },
+    stdio: ['ignore', 'ignore', 'pipe'],
+  });
+  sidecarProc = proc;
+  proc.stderr?.on('data', (d: Buffer) => {
+    const chunk = d.toString();
+    if (chunk.trim()) process.stderr.write('[liveResolverSidecar] ' + chunk);
+  });
+  const onExit = (why: string, alreadyRunning = false) => {
+    if (sidecarProc !== proc) return;
+    sidecarProc = null;
+    if (sidecarStopped) return;
+    if (alreadyRunning) {
+      // Un altro sidecar (es. orfano) serve gia' il socket: lo usiamo e
+      // ne riavviamo uno nostro solo quando smette di rispondere.
+      console.log(`[liveResolverSidecar] sidecar already running on ${SIDECAR_SOCKET}`);
+      _watchForeignSidecar();
+      return;
+    }
+    console.warn(`[liveResolverSidecar] sidecar ${why}, restart in ${SIDECAR_RESTART_MS}ms`);
+    setTimeout(() => startLiveResolverSidecar(), SIDECAR_RESTART_MS);
+  };
+  proc.on('exit', (code: number | null) => onExit(`exited (code ${code})`, code === SIDECAR_ALREADY_RUNNING));
+  proc.on('error', (err: Error) => onExit(`spawn error: ${err.message}`));
+}
+
+function _socketAlive(): Promise<boolean> {
+  return new Promise((resolve) => {
+    const sock = net.createConnection(SIDECAR_SOCKET);
+    const done = (v: boolean) => { sock.destroy(); resolve(v); };
+    sock.setTimeout(2000, () => done(false));
+    sock.on('connect', () => done(true));
+    sock.on('error', () => done(false));
+  });
+}
+
+function _watchForeignSidecar(): void {
+  const timer = setInterval(async () => {
+    if (sidecarStopped || sidecarProc) {
+      clearInterval(timer);
+      return;
+    }
+    if (!(await _socketAlive())) {
+      clearInterval(timer);
+      console.warn('[liveResolverSidecar] foreign sidecar gone, starting our own');
+      startLiveResolverSidecar();
+    }
+  }, SIDECAR_RESTART_MS);
+  timer.unref?.();
+}
+
+export function stopLiveResolverSidecar(): void {
+  sidecarStopped = true;
+  if (sidecarProc) {
+    try { sidecarProc.kill('SIGTERM'); } catch { /* ignore */ }
+    sidecarProc = null;
+  }
+}
+
+/**
+ * Una richiesta sul socket. `null` = sidecar non raggiungibile (fallback spawn).
+ * Con onLine le righe {"line": ...} in streaming vengono inoltrate man mano.
+ */
+function _sidecarCall(req: Record<string, unknown>, timeoutMs: number, onLine?: (line: string) => void): Promise<CliReply | null> {
+  return new Promise((resolve) => {
+    let finished = false;
+    let connected = false;
+    let buf = '';
+    const sock = net.createConnection(SIDECAR_SOCKET);
+    const done = (v: CliReply | null) => {
+      if (finished) return;
+      finished = true;
+      clearTimeout(killer);
+      sock.destroy();
+      resolve(v);
+    };
+    const killer = setTimeout(() => done(connected ? { ok: false, code: -1, stdout: '', stderr: 'TIMEOUT' } : null), timeoutMs);
+    sock.on('connect', () => {
+      connected = true;
+      sock.write(JSON.stringify(req) + '\n');
+    });
+    sock.on('data', (d: Buffer) => {
+      buf += d.toString();
+      let nl: number;
+      while (!finished && (nl = buf.indexOf('\n')) >= 0) {
+        const raw = buf.slice(0, nl);
+        buf = buf.slice(nl + 1);
+        try {
+          const parsed = JSON.parse(raw);
+          if (onLine && typeof parsed.line === 'string' && parsed.code === undefined) {
+            onLine(parsed.line);
+            continue;
+          }
+          done(typeof parsed.code === 'number' ? parsed as CliReply : null);
+        } catch {
+          done(null);
+        }
+      }
+    });
+    sock.on('error', () => done(null));
+    sock.on('close', () => done(null));
+  });
+}
+
+function _providerFor(script: string): string | null {
+  const base = path.basename(script);
+  if (base === 'vavoo_resolver.py') return 'vavoo';
+  if (base === 'tvtap_resolver.py') return 'tvtap';
+  return null;
+}
+
+/** Come execFilePromise('python3', [script, ...args], options), via sidecar se disponibile. */
+export async function execResolverCli(script: string, args: string[], options: ExecFileOptions = {}): Promise<CliResult> {
+  const provider = _providerFor(script);
+  const timeoutMs = typeof options.timeout === 'number' && options.timeout > 0 ? options.timeout : 30000;
+  const reply = provider && process.env.LIVE_RESOLVER_SIDECAR !== '0'
+    ? await _sidecarCall({ op: 'cli', provider, argv: args }, timeoutMs)
+    : null;
+  if (reply) {
+    const stdout = reply.stdout ? reply.stdout + '\n' : '';
+    const stderr = reply.stderr ? reply.stderr + '\n' : '';
+    if (reply.code === 0) return { stdout, stderr };
+    const err: CliError = new Error(`Command failed: ${path.basename(script)} ${args.join(' ')} (exit ${reply.code})\n${stderr}`);
+    err.code = reply.code;
+    err.stdout = stdout;
+    err.stderr = stderr;
+    throw err;
+  }
+  const execOpts: ExecFileOptionsWithStringEncoding = { ...options, encoding: 'utf8' };
+  return new Promise((resolve, reject) => {
+    execFile(resolvePython(), [script, ...args], execOpts, (error, stdout, stderr) => {
+      if (error) {
+        const err = error as CliError;
+        err.stdout = String(stdout);
+        err.stderr = String(stderr);
+        return reject(err);
+      }
+      resolve({ stdout: String(stdout), stderr: String(stderr) });
+    });
+  });
+}
+
+/** Variante callback-style di execResolverCli (stessa forma di execFile). */
+export function execResolverCliCb(
+  script: string,
+  args: string[],
+  options: ExecFileOptions,
+  cb: (error: Error | null, stdout: string, stderr: string) => void,
+): void {
+  execResolverCli(script, args, options).then(
+    (r) => cb(null, r.stdout, r.stderr),
+    (e: CliError) => cb(e, e.stdout || '', e.stderr || ''),
+  );
+}
+
+/**
+ * Come execResolverCli ma per output NDJSON: onLine(riga) per ogni riga di
+ * stdout appena disponibile. Ritorna l'exit code (-1 = timeout/spawn error).
+ * Se il sidecar cade a meta' si ripete con lo spawn: onLine deve tollerare
+ * righe gia' viste.
+ */
+export async function streamResolverCli(
+  script: string,
+  args: string[],
+  onLine: (line: string) => void,
+  options: { timeout?: number } = {},
+): Promise<number> {
+  const provider = _providerFor(script);
+  const timeoutMs = typeof options.timeout === 'number' && options.timeout > 0 ? options.timeout : 30000;
+  const reply = provider && process.env.LIVE_RESOLVER_SIDECAR !== '0'
+    ? await _sidecarCall({ op: 'cli', provider, argv: args, stream: true }, timeoutMs, onLine)
+    : null;
+  if (reply) {
+    if (reply.stderr) process.stderr.write(reply.stderr + '\n');
+    return reply.code;
+  }
+  return new Promise((resolve) => {
+    let settled = false;
+    const finish = (code: number) => {
+      if (settled) return;
+      settled = true;
+      clearTimeout(killer);
+      resolve(code);
+    };
+    const proc = spawn(resolvePython(), [script, ...args], { env: { ...process.env }, stdio: ['ignore', 'pipe', 'pipe'] });
+    const killer = setTimeout(() => {
+      try { proc.kill('SIGKILL'); } catch { /* ignore */ }
+      finish(-1);
+    }, timeoutMs);
+    proc.stderr?.on('data', () => { /* log [DEBUG] del resolver: ignorati come con execFile */ });
+    const rl = readline.createInterface({ input: proc.stdout! });
+    rl.on('line', (line: string) => {
+      if (!settled && line.trim()) onLine(line);
+    });
+    proc.on('error', () => finish(-1));
+    proc.on('close', (code: number | null) => finish(code ?? -1));
+  });
+}
@@ -17,9 +17,19 @@
  *     budget). Used on addon startup and on a 2h timer.
  *
  *   - parseUprotFolder(url): parses a /msfld/ folder page; no captcha.
+ *
+ *   - invalidateShortener(url): drops a link from the Python resolve cache
+ *     when a cached link failed to play (e.g. /chapta/test-resolve with
+ *     refresh). Otherwise cached links live until their TTL.
+ *
+ *   - startResolverDaemon(): keeps one `uprot_resolver.py --serve` process
+ *     alive on a unix socket. When the socket is up every call above goes
+ *     through it (warm imports + pooled curl_cffi sessions); otherwise we
+ *     fall back to spawning the script per call.
  */
-import { spawn, spawnSync } from 'child_process';
+import { spawn, spawnSync, ChildProcess } from 'child_process';
 import * as fs from 'fs';
+import * as net from 'net';
 import * as path from 'path';
 
 export type MaxstreamResolved = {
@@ -44,6 +54,14 @@ export type FolderResolved = {
   kind: 'folder';
   entries: FolderEntry[];
 };
+export type SlotsWarmupResult = {
+  ok: true;
+  kind: 'slots';
+  domain: 'uprot' | 'clicka';
+  active_slot: string;
+  ok_slots: string[];
+  slots: Record<string, { ok: boolean; kind?: string; error?: string }>;
+};
 export type ResolverFailure = {
   ok: false;
   error: string;
@@ -53,10 +71,11 @@ export type ResolverResult =
   | MaxstreamResolved
   | DeltabitResolved
   | FolderResolved
+  | SlotsWarmupResult
   | ResolverFailure;
 
 let cachedPythonCmd: string | null = null;
-function resolvePython(): string {
+export function resolvePython(): string {
   if (cachedPythonCmd) return cachedPythonCmd;
   const candidates = ['/usr/bin/python3', '/usr/local/bin/python3', 'python3', 'python'];
   for (const c of candidates) {
@@ -87,8 +106,123 @@ function scriptPath(): string {
   return candidates[0];
 }
 
-function runResolverArgs(args: string[], timeoutMs: number,
-                        envExtra?: Record<string, string>): Promise<ResolverResult> {
+// ---------------------------------------------------------------------------
+// Resolver daemon (uprot_resolver.py --serve)
+// ---------------------------------------------------------------------------
+// Un solo processo Python long-lived su unix socket: niente import PIL/curl_cffi
+// e niente handshake TLS via proxy per ogni link. Il protocollo e' JSON una
+// riga per richiesta / una riga per risposta (vedi _dispatch lato Python).
+// Se il socket non risponde si torna allo spawn per-call.
+
+const RESOLVER_SOCKET = process.env.UPROT_RESOLVER_SOCKET || '/tmp/uprot_resolver.sock';
+const DAEMON_RESTART_MS = parseInt(process.env.UPROT_DAEMON_RESTART_MS || '', 10) || 5000;
+let daemonProc: ChildProcess | null = null;
+let daemonStopped = false;
+
+/** Avvia (e mantiene vivo) il daemon --serve. Disattivabile con UPROT_RESOLVER_DAEMON=0. */
+export function startResolverDaemon(): void {
+  if (process.env.UPROT_RESOLVER_DAEMON === '0') {
+    console.log('[shortenerResolver] daemon disabled by UPROT_RESOLVER_DAEMON=0');
+    return;
+  }
+  if (daemonProc) return;
+  daemonStopped = false;
+  const proc = spawn(resolvePython(), [scriptPath(), '--serve', RESOLVER_SOCKET], {
+    env: { ...process.env },
+    stdio: ['ignore', 'ignore', 'pipe'],
+  });
+  daemonProc = proc;
+  proc.stderr?.on('data', (d: Buffer) => {
+    const chunk = d.toString();
+    if (chunk.trim()) process.stderr.write('[shortenerResolver][daemon] ' + chunk);
+  });
+  const onExit = (why: string) => {
+    if (daemonProc !== proc) return;
+    daemonProc = null;
+    if (daemonStopped) return;
+    console.warn(`[shortenerResolver] daemon ${why}, restart in ${DAEMON_RESTART_MS}ms`);
+    setTimeout(() => startResolverDaemon(), DAEMON_RESTART_MS);
+  };
+  proc.on('exit', (code: number | null) => onExit(`exited (code ${code})`));
+  proc.on('error', (err: Error) => onExit(`spawn error: ${err.message}`));
+}
+
+export function stopResolverDaemon(): void {
+  daemonStopped = true;
+  if (daemonProc) {
+    try { daemonProc.kill('SIGTERM'); } catch { /* ignore */ }
+    daemonProc = null;
+  }
+}
+
+/** Traduce gli argv CLI nella richiesta JSON equivalente per il daemon. */
+function _argsToRequest(args: string[]): Record<string, string> | null {
+  const [flag, value] = args;
+  switch (flag) {
+    case '--resolve': return { op: 'resolve', url: value };
+    case '--warmup': return { op: 'warmup', url: value };
+    case '--warmup-all': return { op: 'warmup_all', url: value };
+    case '--folder': return { op: 'folder', url: value };
+    case '--invalidate': return { op: 'invalidate', url: value };
+    case '--prepare-manual': return { op: 'prepare_manual', domain: value };
+    case '--submit-manual': {
+      const gi = args.indexOf('--guess');
+      return { op: 'submit_manual', session_path: value, guess: gi >= 0 ? (args[gi + 1] || '') : '' };
+    }
+    default: return null;
+  }
+}
+
+/** Una richiesta sul socket del daemon. `null` = daemon non raggiungibile (fallback spawn). */
+function _daemonCall(req: Record<string, string>, timeoutMs: number): Promise<ResolverResult | null> {
+  return new Promise((resolve) => {
+    let finished = false;
+    let connected = false;
+    let buf = '';
+    const sock = net.createConnection(RESOLVER_SOCKET);
+    const done = (v: ResolverResult | null) => {
+      if (finished) return;
+      finished = true;
+      clearTimeout(killer);
+      sock.destroy();
+      resolve(v);
+    };
+    const killer = setTimeout(() => done({ ok: false, error: 'timeout' }), timeoutMs);
+    sock.on('connect', () => {
+      connected = true;
+      sock.write(JSON.stringify(req) + '\n');
+    });
+    sock.on('data', (d: Buffer) => {
+      buf += d.toString();
+      const nl = buf.indexOf('\n');
+      if (nl < 0) return;
+      try {
+        done(JSON.parse(buf.slice(0, nl)) as ResolverResult);
+      } catch (e) {
+        done({ ok: false, error: `parse error: ${(e as Error).message}` });
+      }
+    });
+    sock.on('error', (err: Error) => {
+      done(connected ? { ok: false, error: `daemon error: ${err.message}` } : null);
+    });
+    sock.on('close', () => {
+      done(connected ? { ok: false, error: 'daemon closed connection' } : null);
+    });
+  });
+}
+
+async function runResolverArgs(args: string[], timeoutMs: number,
+                               envExtra?: Record<string, string>): Promise<ResolverResult> {
+  const req = envExtra ? null : _argsToRequest(args);
+  if (req && fs.existsSync(RESOLVER_SOCKET)) {
+    const r = await _daemonCall(req, timeoutMs);
+    if (r) return r;
+  }
+  return spawnResolverArgs(args, timeoutMs, envExtra);
+}
+
+function spawnResolverArgs(args: string[], timeoutMs: number,
+                           envExtra?: Record<string, string>): Promise<ResolverResult> {
   return new Promise((resolve) => {
     const py = resolvePython();
     const script = scriptPath();
@@ -134,7 +268,7 @@ function runResolverArgs(args: string[], timeoutMs: number,
   });
 }
 
-function runResolver(flag: '--resolve' | '--warmup' | '--folder', url: string,
+function runResolver(flag: '--resolve' | '--warmup' | '--warmup-all' | '--folder' | '--invalidate', url: string,
                      timeoutMs: number): Promise<ResolverResult> {
   return runResolverArgs([flag, url], timeoutMs);
 }
@@ -160,6 +294,29 @@ function _isStateFresh(p: string): boolean {
   }
 }
 
+/** Copia per-slot scritta dal Python: /tmp/uprot_state.json -> /tmp/uprot_state.PROXY.json */
+function _slotStatePath(statePath: string, slot: string): string {
+  const ext = path.extname(statePath);
+  return `${statePath.slice(0, statePath.length - ext.length)}.${slot}${ext || '.json'}`;
+}
+
+/**
+ * Rende "attivo" lo state per-slot di `slot` copiandolo sul file condiviso
+ * (quello che Node e la UI /chapta controllano). false se non c'e' uno state
+ * per-slot fresco da adottare.
+ */
+function _adoptSlotState(dom: 'uprot' | 'clicka', slot: string): boolean {
+  const statePath = dom === 'uprot' ? UPROT_STATE_PATH : CLICKA_STATE_PATH;
+  const slotPath = _slotStatePath(statePath, slot);
+  if (!_isStateFresh(slotPath)) return false;
+  try {
+    fs.copyFileSync(slotPath, statePath);
+    return true;
+  } catch {
+    return false;
+  }
+}
+
 function _stateForUrl(url: string): string | null {
   if (/uprot\.net\//i.test(url)) return UPROT_STATE_PATH;
   if (/clicka\.cc\/|safego\.cc\/|deltabit\.co\//i.test(url)) return CLICKA_STATE_PATH;
@@ -189,11 +346,29 @@ export function resolveShortener(url: string, timeoutMs = 10000): Promise<Resolv
   }) as Promise<ResolverResult>;
 }
 
+/**
+ * Drop `url` from the Python-side resolve cache (shared sqlite). Call it when
+ * a cached m3u8/deltabit link failed to play, so the next resolve walks the
+ * uprot/maxstream chain again.
+ */
+export function invalidateShortener(url: string, timeoutMs = 5000): Promise<ResolverResult> {
+  return runResolver('--invalidate', url, timeoutMs);
+}
+
 /** OCR-based warmup. Long-running. Use periodically to keep IP whitelisted. */
 export function warmupShortener(url: string, timeoutMs = 5 * 60 * 1000): Promise<ResolverResult> {
   return runResolver('--warmup', url, timeoutMs);
 }
 
+/**
+ * Warmup on every configured proxy slot in parallel (PROXY, PROXY_BACKUP,
+ * DIRECT). Python saves a per-slot state file for each slot that got
+ * whitelisted, so a later slot flip can adopt it immediately.
+ */
+export function warmupAllSlots(url: string, timeoutMs = 5 * 60 * 1000): Promise<ResolverResult> {
+  return runResolver('--warmup-all', url, timeoutMs);
+}
+
 /** Parse a uprot /msfld/ folder (no captcha needed). */
 export function parseUprotFolder(url: string, timeoutMs = 20000): Promise<ResolverResult> {
   return runResolver('--folder', url, timeoutMs);
@@ -238,6 +413,9 @@ export function getWarmupState(): WarmupState & { lastWarmupOk: number } {
 const WARMUP_PERIOD_OK = parseInt(process.env.UPROT_WARMUP_PERIOD_OK_MS || '', 10) || ((7 * 60 + 30) * 60 * 1000); // 7h30min
 const WARMUP_PERIOD_FAIL = parseInt(process.env.UPROT_WARMUP_PERIOD_FAIL_MS || '', 10) || (30 * 60 * 1000); // 30min
 const WARMUP_TICK_MS = parseInt(process.env.UPROT_WARMUP_TICK_MS || '', 10) || (60 * 1000); // 60s
+// Warmup su tutti gli slot in parallelo (default ON). Con =0 si torna al
+// warmup del solo slot attivo + rotazione cieca su fallimento.
+const WARMUP_ALL_SLOTS = process.env.UPROT_WARMUP_ALL_SLOTS !== '0';
 
 type DomainKey = 'uprot' | 'clicka';
 const nextRetry: Record<DomainKey, number> = { uprot: 0, clicka: 0 };
@@ -248,12 +426,25 @@ async function _warmupDomain(dom: DomainKey): Promise<void> {
     : (process.env.STREAMVIX_CLICKA_WARMUP_URL || 'https://clicka.cc/delta/mfua6zl4cb9p');
   console.log(`[shortenerResolver] warmup START ${dom}=`, seed);
   warmupState[dom].lastAttempt = Date.now();
-  const r = await warmupShortener(seed);
+  const r = WARMUP_ALL_SLOTS ? await warmupAllSlots(seed) : await warmupShortener(seed);
+  if (r.ok && r.kind === 'slots') {
+    // Se lo slot attivo non e' whitelistato ma un altro si', failover subito
+    // su quello (il suo state per-slot e' gia' pronto).
+    const active = getActiveSlot(dom);
+    if (!r.ok_slots.includes(active)) {
+      const pick = SLOT_ROTATION.find(sl => r.ok_slots.includes(sl));
+      if (pick) {
+        setActiveSlot(dom, pick);
+        _adoptSlotState(dom, pick);
+        console.log(`[shortenerResolver] ${dom} active slot ${active} not whitelisted -> switched to ${pick}`);
+      }
+    }
+  }
   if (r.ok) {
     warmupState[dom].lastOk = Date.now();
     lastWarmupOk = Date.now();
-    nextRetry[dom] = Date.now() + WARMUP_PERIOD_OK;
-    console.log(`[shortenerResolver] ${dom} warmup OK -> next in ${Math.round(WARMUP_PERIOD_OK / 60000)} min`);
+    nextRetry[dom] = _nextWarmupAfterOk(dom);
+    console.log(`[shortenerResolver] ${dom} warmup OK -> next in ${Math.round((nextRetry[dom] - Date.now()) / 60000)} min`);
   } else {
     warmupState[dom].lastError = (r as ResolverFailure).error;
     nextRetry[dom] = Date.now() + WARMUP_PERIOD_FAIL;
@@ -264,7 +455,9 @@ async function _warmupDomain(dom: DomainKey): Promise<void> {
     try {
       const next = flipProxySlot(dom);
       const statePath = dom === 'uprot' ? UPROT_STATE_PATH : CLICKA_STATE_PATH;
-      try { if (fs.existsSync(statePath)) fs.unlinkSync(statePath); } catch { /* ignore */ }
+      if (!_adoptSlotState(dom, next)) {
+        try { if (fs.existsSync(statePath)) fs.unlinkSync(statePath); } catch { /* ignore */ }
+      }
       console.warn(`[shortenerResolver] ${dom} warmup FAIL ${warmupState[dom].lastError}`,
         `-> flipped proxy slot to ${next}, retry in ${Math.round(WARMUP_PERIOD_FAIL / 60000)} min`);
     } catch (e) {
@@ -274,11 +467,46 @@ async function _warmupDomain(dom: DomainKey): Promise<void> {
   }
 }
 
+// Schedule appresa dal Python (durata osservata delle whitelist per slot, vedi
+// "Whitelist expiry learning" in uprot_resolver.py). Riscritta ad ogni evento
+// gained/alive/lost: se una resolve vede captcha_required la schedule diventa
+// "adesso" e il tick anticipa il warmup invece di aspettare il periodo fisso.
+const WHITELIST_SCHEDULE_PATH = process.env.UPROT_WHITELIST_SCHEDULE_PATH || '/tmp/uprot_whitelist_schedule.json';
+const WARMUP_MIN_GAP = parseInt(process.env.UPROT_WARMUP_MIN_GAP_MS || '', 10) || (5 * 60 * 1000); // 5min
+
+function _scheduledWarmup(dom: DomainKey): number | null {
+  try {
+    const j = JSON.parse(fs.readFileSync(WHITELIST_SCHEDULE_PATH, 'utf8'));
+    const d = j && j.domains && j.domains[dom];
+    const v = d ? (WARMUP_ALL_SLOTS ? d.next_warmup_ms : d.active_next_warmup_ms) : null;
+    return typeof v === 'number' ? v : null;
+  } catch {
+    return null;
+  }
+}
+
+function _nextWarmupAfterOk(dom: DomainKey): number {
+  const now = Date.now();
+  const sched = _scheduledWarmup(dom);
+  if (sched === null) return now + WARMUP_PERIOD_OK;
+  return Math.min(Math.max(sched, now + WARMUP_MIN_GAP), now + WARMUP_PERIOD_OK);
+}
+
 async function runWarmupTick(): Promise<void> {
   if (warmupRunning) return;
   warmupRunning = true;
   try {
     const now = Date.now();
+    // Anticipa il warmup se la schedule appresa lo chiede (whitelist in
+    // scadenza o gia' persa). Solo dopo un warmup OK: dopo un FAIL vale il
+    // periodo FAIL, per non martellare un IP gia' rate-limited.
+    for (const dom of ['uprot', 'clicka'] as DomainKey[]) {
+      if (warmupState[dom].lastOk < warmupState[dom].lastAttempt) continue;
+      const sched = _scheduledWarmup(dom);
+      if (sched !== null && sched < nextRetry[dom]) {
+        nextRetry[dom] = Math.max(sched, warmupState[dom].lastAttempt + WARMUP_MIN_GAP);
+      }
+    }
     // Sceglie i domini scaduti. Se ce ne sono piu' di uno scaduto, li lancia
     // in sequenza (no parallel: rispetta il lock e gli IP del proxy).
     const due: DomainKey[] = [];
@@ -345,6 +573,28 @@ function slotPathFor(domain: DomainKey): string {
   return domain === 'uprot' ? UPROT_ACTIVE_SLOT_PATH : CLICKA_ACTIVE_SLOT_PATH;
 }
 
+// Pin manuale: con il file presente il resolver Python usa quello slot e
+// salta l'auto-selezione per salute (latenza/403/429/503, vedi --slots).
+// Senza pin lo slot attivo e' solo il preferito.
+const UPROT_PIN_SLOT_PATH = process.env.UPROT_PIN_SLOT_PATH || '/tmp/uprot_pinned_proxy_slot.txt';
+const CLICKA_PIN_SLOT_PATH = process.env.CLICKA_PIN_SLOT_PATH || '/tmp/clicka_pinned_proxy_slot.txt';
+
+function pinPathFor(domain: DomainKey): string {
+  return domain === 'uprot' ? UPROT_PIN_SLOT_PATH : CLICKA_PIN_SLOT_PATH;
+}
+
+export function getPinnedSlot(domain: DomainKey): ProxySlot | null {
+  try {
+    const v = fs.readFileSync(pinPathFor(domain), 'utf8').trim();
+    if ((VALID_SLOTS as string[]).includes(v)) return v as ProxySlot;
+  } catch { /* nessun pin */ }
+  return null;
+}
+
+export function clearSlotPin(domain: DomainKey): void {
+  try { fs.unlinkSync(pinPathFor(domain)); } catch { /* gia' assente */ }
+}
+
 export function getActiveSlot(domain: DomainKey): ProxySlot {
   try {
     const v = fs.readFileSync(slotPathFor(domain), 'utf8').trim();
@@ -353,9 +603,10 @@ export function getActiveSlot(domain: DomainKey): ProxySlot {
   return 'PROXY';
 }
 
-export function setActiveSlot(domain: DomainKey, slot: ProxySlot): void {
+export function setActiveSlot(domain: DomainKey, slot: ProxySlot, opts: { pin?: boolean } = {}): void {
   try {
     fs.writeFileSync(slotPathFor(domain), slot);
+    if (opts.pin) fs.writeFileSync(pinPathFor(domain), slot);
     // L'IP egress puo' cambiare: invalida cache cosi' la prossima probe rilegge.
     _egressCache.delete(slot);
   } catch (e) {
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import pytest
+
+import uprot_resolver as ur
+
+
+# ---------------------- TTL resolve cache (_resolved_ttl) ----------------------
+
+def test_resolved_ttl_from_expiry_param():
+    exp = int(time.time()) + 3600
+    ttl = ur._resolved_ttl({'m3u8': f'https://cdn.example/a.m3u8?e={exp}&s=x'})
+    assert ttl == pytest.approx(3600 - ur.RESOLVE_CACHE_MARGIN, abs=2)
+
+
+def test_resolved_ttl_milliseconds_and_cap():
+    exp_ms = int((time.time() + 10 * ur.RESOLVE_CACHE_MAX_TTL) * 1000)
+    assert ur._resolved_ttl({'deltabit': f'https://x/y?expires={exp_ms}'}) == ur.RESOLVE_CACHE_MAX_TTL
+
+
+def test_resolved_ttl_default_and_near_expiry():
+    assert ur._resolved_ttl({'m3u8': 'https://cdn.example/a.m3u8'}) == ur.RESOLVE_CACHE_TTL
+    past = int(time.time()) - 10
+    assert ur._resolved_ttl({'m3u8': f'https://x/a.m3u8?exp={past}'}) == ur.RESOLVE_CACHE_TTL
+    soon = int(time.time()) + ur.RESOLVE_CACHE_MARGIN // 2
+    assert ur._resolved_ttl({'m3u8': f'https://x/a.m3u8?exp={soon}'}) == 0
+
+
+# ---------------------- salute e scelta slot ----------------------
+
+def _samples(ms, status, n):
+    return [[0, ms, status] for _ in range(n)]
+
+
+def test_slot_health_rates_and_whitelist_sources():
+    stats = {'uprot': {'PROXY': _samples(100, 200, 6) + _samples(0, 403, 3) + _samples(0, 0, 1)}}
+    h = ur._slot_health('uprot', 'PROXY', stats, {}, {'uprot': {'PROXY': {'ok': True}}})
+    assert h['samples'] == 10
+    assert h['p50_ms'] == 100
+    assert h['rate_403'] == pytest.approx(0.3)
+    assert h['rate_fail'] == pytest.approx(0.1)
+    assert h['err_rate'] == pytest.approx(0.4)
+    assert h['whitelisted'] is True
+    # La storia della whitelist ha la precedenza sull'ultimo probe.
+    hist = {'uprot': {'PROXY': {'gained_ms': 1, 'lost_ms': 2}}}
+    assert ur._slot_health('uprot', 'PROXY', stats, hist, {})['whitelisted'] is False
+    assert ur._slot_health('uprot', 'DIRECT', stats, {}, {})['whitelisted'] is None
+
+
+def test_slot_stats_merge_keeps_window(monkeypatch):
+    monkeypatch.setattr(ur, 'SLOT_STATS_WINDOW', 3)
+    data = {'uprot': {'PROXY': _samples(1, 200, 2)}}
+    out = ur._slot_stats_merge(data, {'uprot': {'PROXY': _samples(2, 200, 2)}, 'clicka': {'DIRECT': _samples(3, 200, 1)}})
+    assert [s[1] for s in out['uprot']['PROXY']] == [1, 2, 2]
+    assert out['clicka']['DIRECT'] == [[0, 3, 200]]
+
+
+def test_slot_stats_flush_appends_to_file(monkeypatch, tmp_path):
+    path = tmp_path / 'slot_stats.json'
+    path.write_text(json.dumps({'uprot': {'PROXY': _samples(5, 200, 1)}}))
+    monkeypatch.setattr(ur, 'SLOT_STATS_PATH', str(path))
+    monkeypatch.setattr(ur, '_slot_stats_pending', {'uprot': {'PROXY': _samples(7, 503, 1)}})
+    ur._slot_stats_flush()
+    assert json.loads(path.read_text())['uprot']['PROXY'] == [[0, 5, 200], [0, 7, 503]]
+    assert ur._slot_stats_pending == {}
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    monkeypatch.setenv('PROXY', 'http://user:pw@proxy-a:8080')
+    monkeypatch.setenv('PROXY_BACKUP', 'http://proxy-b:8080')
+    monkeypatch.setattr(ur, '_auto_memo', {})
+    state = {'stats': {}, 'hist': {}, 'wl': {}}
+    monkeypatch.setattr(ur, '_slot_stats_load', lambda: state['stats'])
+    monkeypatch.setattr(ur, '_wl_history_load', lambda: state['hist'])
+    monkeypatch.setattr(ur, '_slot_whitelist_load', lambda: state['wl'])
+    return state
+
+
+def test_auto_slot_keeps_healthy_preferred(slots):
+    slots['stats'] = {'uprot': {'PROXY': _samples(900, 200, 10), 'DIRECT': _samples(50, 200, 10)}}
+    slots['wl'] = {'uprot': {sl: {'ok': True} for sl in ('PROXY', 'PROXY_BACKUP', 'DIRECT')}}
+    assert ur._auto_slot('uprot', 'PROXY') == 'PROXY'
+
+
+def test_auto_slot_switches_to_best_whitelisted(slots):
+    slots['stats'] = {'uprot': {
+        'PROXY': _samples(0, 429, 10),
+        'PROXY_BACKUP': _samples(400, 200, 10),
+        'DIRECT': _samples(100, 200, 10),
+    }}
+    slots['wl'] = {'uprot': {'PROXY': {'ok': True}, 'PROXY_BACKUP': {'ok': True}, 'DIRECT': {'ok': False}}}
+    # DIRECT e' piu' veloce ma non whitelistato.
+    assert ur._auto_slot('uprot', 'PROXY') == 'PROXY_BACKUP'
+    # Scelta memorizzata: cambiare le statistiche non la sposta subito.
+    slots['wl']['uprot']['DIRECT'] = {'ok': True}
+    assert ur._auto_slot('uprot', 'PROXY') == 'PROXY_BACKUP'
+
+
+def test_auto_slot_without_alternatives_keeps_preferred(slots):
+    slots['stats'] = {'clicka': {'PROXY': _samples(0, 503, 10)}}
+    assert ur._auto_slot('clicka', 'PROXY') == 'PROXY'
+
+
+# ---------------------- scanner pagine (_scan_page) ----------------------
+
+UPROTS = 'https://maxstream.video/uprots/QUJDRA=='
+ADELTA = 'https://clicka.cc/adelta/WFla'
+
+
+def test_scan_page_continue_prefers_known_hosts():
+    body = ('<a href="https://other.example/x">C o n t i n u e</a>'
+            '<a href="https://maxstream.video/next">CONTINUE</a>')
+    sc = ur._scan_page(body)
+    assert sc['continue'] == 'https://maxstream.video/next'
+    assert sc['continue_any'] == 'https://other.example/x'
+
+
+def test_scan_page_links_inside_and_outside_anchors():
+    body = f'<p>{ADELTA}</p><a href="{UPROTS}">go</a>'
+    sc = ur._scan_page(body)
+    assert sc['uprots'] == UPROTS
+    assert sc['adelta'] == ADELTA
+    assert sc['continue'] is None and sc['continue_any'] is None
+    assert ur._bypass_link(body) == UPROTS
+
+
+def test_scan_page_captcha_detection():
+    captcha = '<img src="data:image/png;base64,AAAA"><form></form>'
+    assert ur._scan_page(captcha)['img'] is True
+    assert ur._is_captcha_page(captcha)
+    assert ur._bypass_link(captcha) is None
+    # Con un link di bypass la pagina non e' un captcha.
+    assert not ur._is_captcha_page(captcha + ADELTA)
+    assert ur._bypass_link(captcha + ' ' + ADELTA) == ADELTA
+
+
+def test_scan_page_memo_is_per_body_object():
+    body = f'<a href="{UPROTS}">x</a>'
+    first = ur._scan_page(body)
+    assert ur._scan_page(body) is first
+    other = ''.join(['<p>', 'nothing', '</p>'])
+    assert ur._scan_page(other)['uprots'] is None
+
+
+# ---------------------- sessione captcha manuale ----------------------
+
+@pytest.fixture
+def manual(monkeypatch, tmp_path, slots):
+    """Slot file di Node su PROXY; GET finte che registrano il proxy usato."""
+    monkeypatch.delenv('STREAMVIX_HTTP_PROXY', raising=False)
+    monkeypatch.delenv('_FORCE_PROXY_SLOT', raising=False)
+    monkeypatch.setattr(ur, 'AUTO_SLOT', True)
+    for domain in ('uprot', 'clicka'):
+        active = tmp_path / f'{domain}_active.txt'
+        active.write_text('PROXY')
+        monkeypatch.setitem(ur._ACTIVE_SLOT_PATHS, domain, str(active))
+        monkeypatch.setitem(ur._PIN_SLOT_PATHS, domain, str(tmp_path / f'{domain}_pin.txt'))
+    used = []
+
+    def fake_http(url, method='GET', body=None, headers=None, redirect=False, via_proxy=True):
+        used.append(ur._proxy_for(url))
+        if 'clicka.cc' in url:
+            return 302, {'location': 'https://safego.cc/safe.php?url=x'}, b''
+        return 200, {}, b'<img src="data:image/png;base64,AAAA">'
+    monkeypatch.setattr(ur, 'http', fake_http)
+    monkeypatch.setattr(ur, '_uprot_whitelist_probe', lambda url: {'ok': False})
+    monkeypatch.setattr(ur, '_extract_captcha_png', lambda body: b'png')
+    monkeypatch.setattr(ur, '_wl_event', lambda domain, kind: None)
+    return used
+
+
+def test_prepare_manual_saves_pinned_slot(manual, tmp_path):
+    (tmp_path / 'uprot_pin.txt').write_text('PROXY_BACKUP')
+    out = ur.prepare_manual('uprot')
+    assert out['ok'] and out['session']['proxy_slot'] == 'PROXY_BACKUP'
+    assert manual == ['http://proxy-b:8080']
+
+
+def test_prepare_manual_saves_auto_selected_slot(manual, slots):
+    slots['stats'] = {'clicka': {'PROXY': _samples(0, 403, 10), 'DIRECT': _samples(80, 200, 10)}}
+    slots['wl'] = {'clicka': {'PROXY': {'ok': True}, 'DIRECT': {'ok': True}}}
+    out = ur.prepare_manual('clicka')
+    assert out['ok'] and out['session']['proxy_slot'] == 'DIRECT'
+    # Seed clicka e GET captcha escono entrambe dall'egress diretto.
+    assert manual == ['', '']
+
+
+def test_submit_manual_records_gained_on_session_slot(monkeypatch, tmp_path, slots):
+    monkeypatch.setattr(ur, 'WHITELIST_HISTORY_PATH', str(tmp_path / 'wl_history.json'))
+    monkeypatch.setattr(ur, 'WHITELIST_SCHEDULE_PATH', str(tmp_path / 'wl_schedule.json'))
+    monkeypatch.setattr(ur, '_effective_slot', lambda domain: 'PROXY')
+    monkeypatch.setattr(ur, '_submit_manual_post', lambda *a: {'ok': True})
+    session = tmp_path / 'session.json'
+    session.write_text(json.dumps({'domain': 'uprot', 'url': 'https://uprot.net/msf/x', 'field': 'captcha',
+                                   'origin': 'https://uprot.net', 'proxy_slot': 'PROXY_BACKUP'}))
+    assert ur.submit_manual(str(session), '1234')['ok']
+    hist = json.loads((tmp_path / 'wl_history.json').read_text())
+    assert hist['uprot']['PROXY_BACKUP']['gained_ms']
+    assert 'PROXY' not in hist['uprot']
+    assert getattr(ur._tls, 'forced_slot', None) is None
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import vavoo_resolver as vr
+
+CHANNELS = [
+    {'name': 'RAI 1 HD .c', 'url': 'https://vavoo.to/play/1'},
+    {'name': 'SKY SPORT 24 FHD', 'url': 'https://vavoo.to/play/2'},
+    {'name': 'SKY SPORT UNO', 'url': 'https://vavoo.to/play/3'},
+    {'name': 'DAZN 1', 'url': 'https://vavoo.to/play/4'},
+    {'name': 'RAI 1', 'url': 'https://vavoo.to/play/5'},
+    {'name': 'CANALE 5', 'url': 'https://vavoo.to/play/6'},
+]
+
+
+@pytest.fixture
+def name_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(vr, 'NAME_INDEX_PATH', str(tmp_path / 'vavoo_name_index.json'))
+    monkeypatch.setattr(vr, 'ensure_cache_dir', lambda: None)
+    monkeypatch.setattr(vr, '_name_index_mem', {'source_ts': None, 'index': None})
+    links = {ch['name']: ch['url'] for ch in CHANNELS}
+    return links
+
+
+def _lookup(links, wanted, ts=1):
+    found = vr.lookup_channel(vr.load_name_index(links, ts), vr.normalize_vavoo_name(wanted))
+    return found and found['url']
+
+
+# ---------------------- indice nomi ----------------------
+
+def test_lookup_exact_and_partial(name_index):
+    assert _lookup(name_index, 'rai 1') == 'https://vavoo.to/play/5'
+    # Nome del catalogo contenuto in wanted (tier "clean").
+    assert _lookup(name_index, 'DAZN 1 ITALIA') == 'https://vavoo.to/play/4'
+    # wanted contenuto nel nome: vince il primo in ordine di catalogo.
+    assert _lookup(name_index, 'SKY SPORT') == 'https://vavoo.to/play/2'
+    # Solo alfanumerico.
+    assert _lookup(name_index, 'canale-5') == 'https://vavoo.to/play/6'
+    assert _lookup(name_index, 'ITALIA 1') is None
+
+
+def test_lookup_matches_reference_scan(name_index):
+    """Stesso risultato della scansione lineare a tre passate."""
+    def reference(wanted):
+        for ch in CHANNELS:
+            if vr.normalize_vavoo_name(ch['name']) == wanted:
+                return ch['url']
+        for tier_fn, w in ((vr._clean_name, wanted), (vr._simple_name, vr._simple_name(wanted))):
+            for ch in CHANNELS:
+                key = tier_fn(ch['name'])
+                if key in w or w in key:
+                    return ch['url']
+        return None
+    for wanted in ('RAI', 'SKY SPORT 24', 'SPORT UNO', 'DAZN', 'CANALE 5 HD', 'XYZ', 'R', 'SKYSPORT24'):
+        assert _lookup(name_index, wanted) == reference(vr.normalize_vavoo_name(wanted)), wanted
+
+
+def test_name_index_persists_maps_only_and_stays_in_memory(name_index):
+    index = vr.load_name_index(name_index, 7)
+    vr.lookup_channel(index, 'SKY')
+    with open(vr.NAME_INDEX_PATH, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert set(saved) == {'version', 'source_ts', 'names', 'urls', 'exact', 'clean', 'simple'}
+    assert vr.load_name_index(name_index, 7) is index
+    # Nuovo timestamp della cache: indice ricaricato/ricostruito.
+    assert vr.load_name_index(name_index, 8) is not index
+    # Processo nuovo: indice riletto dal file, senza ricostruzione.
+    vr._name_index_mem.update(source_ts=None, index=None)
+    reloaded = vr.load_name_index(name_index, 8)
+    assert reloaded['exact'] == index['exact']
+
+
+# ---------------------- pre-warm eventi ----------------------
+
+NOW = datetime(2026, 5, 1, 20, 0, tzinfo=timezone.utc).timestamp()
+
+
+def _event(start, *urls):
+    return {'eventStart': start, 'streams': [{'url': u} for u in urls]}
+
+
+def test_prewarm_aliases_window():
+    events = [
+        _event('2026-05-01T20:05:00Z', 'vavoo://SKY SPORT UNO', 'https://other/x'),   # imminente
+        _event('2026-05-01T18:30:00Z', 'vavoo://DAZN 1', 'vavoo://SKY SPORT UNO'),    # in corso
+        _event('2026-05-01T23:00:00Z', 'vavoo://RAI 1'),                              # troppo lontano
+        _event('2026-05-01T10:00:00Z', 'vavoo://CANALE 5'),                           # finito
+        _event('not a date', 'vavoo://RAI 2'),
+        'garbage',
+        {'eventStart': '2026-05-01T20:00:00+00:00', 'streams': ['vavoo://bad', {'url': 'vavoo:// '}]},
+    ]
+    assert vr.prewarm_aliases(events, now=NOW) == ['SKY SPORT UNO', 'DAZN 1']
+
+
+# ---------------------- CLI ----------------------
+
+def test_dump_entry():
+    assert vr.dump_entry({'name': 'RAI 1'}) is None
+    entry = vr.dump_entry({'name': 'RAI 1 HD .c', 'url': 'https://vavoo.to/play/1'})
+    assert entry['links'] == ['https://vavoo.to/play/1']
+    assert entry['aliases'] == ['RAI 1 .c', 'RAI 1 HD']
+
+
+def test_cli_main_exit_codes(monkeypatch, name_index, tmp_path):
+    assert vr.cli_main([])[0] == 1
+    code, out, _ = vr.cli_main(['--prewarm', str(tmp_path / 'missing.json')])
+    assert code == 1 and json.loads(out)['ok'] is False
+
+    monkeypatch.setattr(vr, 'resolve_direct_link', lambda link: None)
+    assert vr.cli_main(['https://vavoo.to/play/1/index.m3u8']) == (4, '', 'RESOLVE_FAIL')
+
+    monkeypatch.setattr(vr, 'load_unified_cache_ts', lambda: (name_index, 1))
+    monkeypatch.setattr(vr, 'unified_cache_fresh', lambda ts: True)
+    monkeypatch.setattr(vr, 'get_channels', lambda on_page=None: [])
+    assert vr.cli_main(['NOPE TV']) == (2, '', 'NOT_FOUND')
+    assert vr.cli_main(['rai 1', '--original-link']) == (0, 'https://vavoo.to/play/5', '')
+
+    monkeypatch.setattr(vr, 'resolve_vavoo_link', lambda url: url + '/resolved.m3u8')
+    assert vr.cli_main(['dazn 1']) == (0, 'https://vavoo.to/play/4/resolved.m3u8', '')
+
+    def boom(url):
+        raise RuntimeError('network')
+    monkeypatch.setattr(vr, 'resolve_vavoo_link', boom)
+    assert vr.cli_main(['dazn 1']) == (5, '', 'ERROR')
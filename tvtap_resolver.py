@@ -5,9 +5,19 @@ TVTap Resolver per StreamViX MFP
 Basato sul codice originale funzionante
 """
 
+import os
+import sys
+# Con il sidecar (live_resolver_sidecar.py --serve) attivo la CLI e' un client
+# sottile: esce qui senza importare requests/pycryptodome.
+if __name__ == "__main__":
+    try:
+        from live_resolver_sidecar import cli_via_sidecar
+    except ImportError:
+        cli_via_sidecar = None  # script copiato da solo: modalita' locale
+    if cli_via_sidecar:
+        cli_via_sidecar('tvtap', sys.argv[1:])
 import requests
 import json
-import sys
 import argparse
 from base64 import b64decode, b64encode
 from binascii import a2b_hex
@@ -17,13 +27,16 @@ def logga(messaggio):
     """Funzione di logging per debug"""
     print(f"[DEBUG] {messaggio}", file=sys.stderr)
 
+_PUBKEY = None  # chiave RSA importata una volta per processo (sidecar)
+
 def payload():
     """Genera payload per le richieste TVTap - esatto come nel codice originale"""
+    global _PUBKEY
     try:
         from Crypto.Cipher import PKCS1_v1_5 as Cipher_PKCS1_v1_5
         from Crypto.PublicKey import RSA
         
-        _pubkey = RSA.importKey(
+        _pubkey = _PUBKEY or RSA.importKey(
             a2b_hex(
                 "30819f300d06092a864886f70d010101050003818d003081890281"
                 "8100bfa5514aa0550688ffde568fd95ac9130fcdd8825bdecc46f1"
@@ -33,6 +46,7 @@ def payload():
                 "bd8f2003ab6a251d25f40df08b1c1588a4380a1ce8030203010001"
             )
         )
+        _PUBKEY = _pubkey
         _msg = a2b_hex(
             "7b224d4435223a22695757786f45684237686167747948392b58563052513d3d5c6e222c22534"
             "84131223a2242577761737941713841327678435c2f5450594a74434a4a544a66593d5c6e227d"
@@ -352,65 +366,58 @@ if "--build-cache" in sys.argv:
     print("Cache TVTap generata con successo!")
     sys.exit(0)
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 tvtap_resolver.py <channel_name> [--original-link] [--dump-channels] [--find-channel <name>]", file=sys.stderr)
-        sys.exit(1)
+def cli_main(argv):
+    """Logica CLI (anche per il sidecar): ritorna (exit_code, stdout, marker_stderr).
+    I log [DEBUG] restano su stderr."""
+    if not argv:
+        return 1, '', "Usage: python3 tvtap_resolver.py <channel_name> [--original-link] [--dump-channels] [--find-channel <name>]"
     
     # Controllo se l'opzione per dump dei canali è presente
-    if "--dump-channels" in sys.argv:
+    if "--dump-channels" in argv:
         channels = get_tvtap_channels()
-        print(json.dumps(channels, ensure_ascii=False, indent=2))
-        sys.exit(0)
+        return 0, json.dumps(channels, ensure_ascii=False, indent=2), ''
     
     # Controllo se l'opzione per risolvere stream tramite ID è presente
-    if "--resolve-stream" in sys.argv:
-        resolve_idx = sys.argv.index("--resolve-stream")
-        if resolve_idx + 1 >= len(sys.argv):
-            print("Error: --resolve-stream requires a channel ID", file=sys.stderr)
-            sys.exit(1)
+    if "--resolve-stream" in argv:
+        resolve_idx = argv.index("--resolve-stream")
+        if resolve_idx + 1 >= len(argv):
+            return 1, '', "Error: --resolve-stream requires a channel ID"
         
-        channel_id = sys.argv[resolve_idx + 1]
+        channel_id = argv[resolve_idx + 1]
         logga(f"Resolving stream for channel ID: {channel_id}")
         
         try:
             stream_url = get_tvtap_stream(channel_id)
             if stream_url:
-                print(stream_url)
-                sys.exit(0)
+                return 0, stream_url, ''
             else:
                 logga("Failed to get stream URL")
-                print("STREAM_FAIL", file=sys.stderr)
-                sys.exit(5)
+                return 5, '', "STREAM_FAIL"
         except Exception as e:
             logga(f"Exception: {str(e)}")
-            print("ERROR", file=sys.stderr)
-            sys.exit(6)
+            return 6, '', "ERROR"
     
     # Controllo se l'opzione per trovare un canale specifico è presente
-    if "--find-channel" in sys.argv:
-        find_idx = sys.argv.index("--find-channel")
-        if find_idx + 1 >= len(sys.argv):
-            print("Error: --find-channel requires a channel name", file=sys.stderr)
-            sys.exit(1)
+    if "--find-channel" in argv:
+        find_idx = argv.index("--find-channel")
+        if find_idx + 1 >= len(argv):
+            return 1, '', "Error: --find-channel requires a channel name"
         
-        search_name = sys.argv[find_idx + 1]
+        search_name = argv[find_idx + 1]
         channels = get_tvtap_channels()
         found_channel = find_channel_by_name(search_name, channels)
         
         if found_channel:
-            print(json.dumps(found_channel, ensure_ascii=False, indent=2))
-            sys.exit(0)
+            return 0, json.dumps(found_channel, ensure_ascii=False, indent=2), ''
         else:
             logga(f"Channel '{search_name}' not found in {len(channels)} channels")
             # Debug: mostra alcuni nomi di canali per aiutare
             sample_names = [ch.get("name", "") for ch in channels[:10]]
             logga(f"Sample channel names: {sample_names}")
-            print("NOT_FOUND", file=sys.stderr)
-            sys.exit(3)
+            return 3, '', "NOT_FOUND"
     
-    channel_name = sys.argv[1]
-    return_original_link = "--original-link" in sys.argv
+    channel_name = argv[0]
+    return_original_link = "--original-link" in argv
     
     # Controlla se l'input è un ID TVTap diretto (formato: tvtap_id:123)
     if channel_name.startswith("tvtap_id:"):
@@ -420,20 +427,17 @@ if __name__ == "__main__":
         # Ottieni direttamente il link stream
         stream_url = get_tvtap_stream(tvtap_id)
         if stream_url:
-            print(stream_url)
-            sys.exit(0)
+            return 0, stream_url, ''
         else:
             logga("Failed to get stream for TVTap ID")
-            print("STREAM_FAIL", file=sys.stderr)
-            sys.exit(5)
+            return 5, '', "STREAM_FAIL"
     
     try:
         # Ottieni tutti i canali
         channels = get_tvtap_channels()
         if not channels:
             logga("No channels retrieved")
-            print("NO_CHANNELS", file=sys.stderr)
-            sys.exit(2)
+            return 2, '', "NO_CHANNELS"
         
         # Trova il canale
         found_channel = find_channel_by_name(channel_name, channels)
@@ -442,33 +446,36 @@ if __name__ == "__main__":
             # Debug: mostra alcuni nomi di canali per aiutare
             sample_names = [ch.get("name", "") for ch in channels[:10]]
             logga(f"Sample channel names: {sample_names}")
-            print("NOT_FOUND", file=sys.stderr)
-            sys.exit(3)
+            return 3, '', "NOT_FOUND"
         
         channel_id = found_channel.get("id")
         if not channel_id:
             logga("No ID found for channel")
-            print("NO_ID", file=sys.stderr)
-            sys.exit(4)
+            return 4, '', "NO_ID"
         
         logga(f"Found channel: {found_channel.get('name')} (ID: {channel_id})")
         
         # Se richiesto, restituisci solo l'ID del canale (equivalente al link originale Vavoo)
         if return_original_link:
-            print(f"tvtap://{channel_id}")
-            sys.exit(0)
+            return 0, f"tvtap://{channel_id}", ''
         
         # Altrimenti ottieni il link stream
         stream_url = get_tvtap_stream(channel_id)
         if stream_url:
-            print(stream_url)
-            sys.exit(0)
+            return 0, stream_url, ''
         else:
             logga("Failed to get stream URL")
-            print("STREAM_FAIL", file=sys.stderr)
-            sys.exit(5)
+            return 5, '', "STREAM_FAIL"
             
     except Exception as e:
         logga(f"Exception: {str(e)}")
-        print("ERROR", file=sys.stderr)
-        sys.exit(6)
+        return 6, '', "ERROR"
+
+
+if __name__ == "__main__":
+    code, out, err = cli_main(sys.argv[1:])
+    if out:
+        print(out)
+    if err:
+        print(err, file=sys.stderr)
+    sys.exit(code)
@@ -5,11 +5,33 @@ vavoo_resolver.py
 Script unico: dato il nome del canale, trova il link Vavoo e lo risolve in tempo reale.
 """
 import sys
+import os
+# Con il sidecar (live_resolver_sidecar.py --serve) attivo la CLI e' un client
+# sottile: esce qui senza importare requests ne' scaricare nulla.
+if __name__ == "__main__":
+    try:
+        from live_resolver_sidecar import cli_via_sidecar
+    except ImportError:
+        cli_via_sidecar = None  # script copiato da solo: modalita' locale
+    if cli_via_sidecar:
+        cli_via_sidecar('vavoo', sys.argv[1:])
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-import os
 import re
-from typing import List, Dict, Any
+import time
+import fcntl
+import atexit
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import base64
+import hashlib
+import subprocess
+import urllib.parse
+from typing import List, Dict, Any, Optional
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_DIR = os.path.join(BASE_DIR, 'config')
@@ -19,7 +41,332 @@ with open(os.path.join(CONFIG_DIR, 'domains.json'), encoding='utf-8') as f:
 
 VAVOO_DOMAIN = DOMAINS.get("vavoo")
 
-def getAuthSignature():
+# ---------------------- SESSIONE HTTP CONDIVISA ----------------------
+# Una sola requests.Session con pool keep-alive per www.vavoo.tv e il dominio
+# Vavoo: ping, pagine di catalogo e resolve riusano le connessioni TLS invece
+# di un handshake per chiamata (conta soprattutto nel sidecar). Retry brevi
+# solo su errori di connessione e 502/503/504; gzip lo negozia requests.
+HTTP_POOL_SIZE = int(os.environ.get('VAVOO_HTTP_POOL_SIZE', '16'))
+_session: Optional[requests.Session] = None
+_race_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _new_session(retry) -> requests.Session:
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    sess = requests.Session()
+    sess.mount('https://', adapter)
+    sess.mount('http://', adapter)
+    return sess
+
+def _http() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _new_session(Retry(total=2, connect=2, read=1, status=2, backoff_factor=0.3,
+                                              status_forcelist=(502, 503, 504),
+                                              allowed_methods=frozenset(['GET', 'POST']),
+                                              raise_on_status=False))
+    return _session
+
+def _http_raced() -> requests.Session:
+    """Sessione senza retry dell'adapter per le POST in gara tra mirror: il
+    fallback e' gia' l'hedging, un retry interno allungherebbe solo la gamba."""
+    global _race_session
+    if _race_session is None:
+        with _session_lock:
+            if _race_session is None:
+                _race_session = _new_session(0)
+    return _race_session
+
+# ---------------------- ADDON SIGNATURE (CACHE CONDIVISA) ----------------------
+# La ping per l'addonSig costava un round trip prima di ogni catalog/resolve.
+# La firma viene salvata su file (condiviso tra i processi resolver) con TTL;
+# oltre SIG_REFRESH_AFTER la si usa comunque ma si lancia un refresh in un
+# processo separato (--refresh-sig), cosi' il caller non aspetta. Un flock
+# serializza le ping a cache fredda. Su 401/403 la firma viene invalidata e la
+# richiesta ripetuta una volta con firma nuova.
+SIG_CACHE_PATH = os.environ.get('VAVOO_SIG_CACHE_PATH', '/tmp/vavoo_addon_sig.json')
+SIG_TTL = int(os.environ.get('VAVOO_SIG_TTL', '900'))
+SIG_REFRESH_AFTER = int(SIG_TTL * 0.75)
+
+def _sig_cache_read() -> Optional[Dict[str, Any]]:
+    try:
+        with open(SIG_CACHE_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict) and data.get('sig') and isinstance(data.get('ts'), (int, float)):
+            return data
+    except Exception:
+        pass
+    return None
+
+def _sig_cache_write(sig: str):
+    try:
+        tmp = f"{SIG_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'sig': sig, 'ts': time.time()}, f)
+        os.replace(tmp, SIG_CACHE_PATH)
+    except Exception as e:
+        print(f"[DEBUG] Errore salvataggio signature: {e}", file=sys.stderr)
+
+def invalidate_signature():
+    try:
+        os.unlink(SIG_CACHE_PATH)
+    except Exception:
+        pass
+
+def _spawn_sig_refresh():
+    # Marker anti-tempesta: un solo refresh in volo ogni 30s.
+    marker = SIG_CACHE_PATH + '.refreshing'
+    try:
+        if time.time() - os.path.getmtime(marker) < 30:
+            return
+    except OSError:
+        pass
+    try:
+        with open(marker, 'w'):
+            pass
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--refresh-sig'],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except Exception as e:
+        print(f"[DEBUG] Refresh signature in background fallito: {e}", file=sys.stderr)
+
+def getAuthSignature(force: bool = False):
+    """addonSig dalla cache condivisa; ping solo se assente/scaduta (o force)."""
+    if not force:
+        cached = _sig_cache_read()
+        if cached:
+            age = time.time() - cached['ts']
+            if age < SIG_TTL:
+                if age >= SIG_REFRESH_AFTER:
+                    _spawn_sig_refresh()
+                return cached['sig']
+    try:
+        lock = open(SIG_CACHE_PATH + '.lock', 'w')
+    except Exception:
+        lock = None
+    try:
+        if lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        # Un altro processo puo' aver rinnovato la firma mentre aspettavamo il lock.
+        cached = _sig_cache_read()
+        if cached and not force and time.time() - cached['ts'] < SIG_TTL:
+            return cached['sig']
+        if cached and force and time.time() - cached['ts'] < 5:
+            return cached['sig']
+        sig = _ping_signature()
+        if sig:
+            _sig_cache_write(sig)
+        return sig
+    finally:
+        if lock:
+            lock.close()
+
+def _signed_post(url: str, data: Dict[str, Any], headers: Dict[str, str], timeout: int = 10,
+                 session: Optional[requests.Session] = None):
+    """POST con mediahubmx-signature; su 401/403 rinnova la firma e ripete una volta."""
+    signature = getAuthSignature()
+    if not signature:
+        return None
+    sess = session or _http()
+    resp = sess.post(url, json=data, headers={**headers, "mediahubmx-signature": signature}, timeout=timeout)
+    if resp.status_code in (401, 403):
+        print(f"[DEBUG] Signature rifiutata ({resp.status_code}), rinnovo", file=sys.stderr)
+        invalidate_signature()
+        signature = getAuthSignature(force=True)
+        if not signature:
+            return resp
+        resp = sess.post(url, json=data, headers={**headers, "mediahubmx-signature": signature}, timeout=timeout)
+    return resp
+
+# ---------------------- MIRROR VAVOO (RACING) ----------------------
+# Le resolve partono sul mirror piu' sano; se non risponde entro
+# MIRROR_HEDGE_DELAY (o fallisce) parte in parallelo il successivo, e cosi'
+# via: vince la prima risposta valida. Un mirror lento o giu' non tiene piu'
+# fermo il caller per tutto il timeout. Latenza (EWMA) ed errori per mirror
+# sono salvati su file (condiviso tra processi); dopo MIRROR_FAIL_LIMIT errori
+# di fila un mirror va in coda per MIRROR_COOLDOWN secondi. I campioni restano
+# in memoria e vengono scritti ogni MIRROR_HEALTH_FLUSH_S secondi (e all'uscita)
+# sotto flock; le gambe che perdono la gara non vengono registrate.
+# Mirror: VAVOO_MIRRORS (lista separata da virgole), altrimenti la chiave
+# opzionale "vavoo_mirrors" di domains.json, altrimenti solo VAVOO_DOMAIN.
+def _mirror_list() -> List[str]:
+    raw = os.environ.get('VAVOO_MIRRORS', '')
+    mirrors = [m.strip() for m in raw.split(',') if m.strip()]
+    if not mirrors and isinstance(DOMAINS.get('vavoo_mirrors'), list):
+        mirrors = [str(m).strip() for m in DOMAINS['vavoo_mirrors'] if str(m).strip()]
+    if VAVOO_DOMAIN and VAVOO_DOMAIN not in mirrors:
+        mirrors.insert(0, VAVOO_DOMAIN)
+    return mirrors
+
+VAVOO_MIRRORS = _mirror_list()
+MIRROR_HEALTH_PATH = os.environ.get('VAVOO_MIRROR_HEALTH_PATH', '/tmp/vavoo_mirror_health.json')
+MIRROR_HEDGE_DELAY = float(os.environ.get('VAVOO_HEDGE_DELAY', '0.8'))
+MIRROR_FAIL_LIMIT = int(os.environ.get('VAVOO_MIRROR_FAIL_LIMIT', '3'))
+MIRROR_COOLDOWN = int(os.environ.get('VAVOO_MIRROR_COOLDOWN', '120'))
+MIRROR_HEALTH_FLUSH_S = float(os.environ.get('VAVOO_MIRROR_HEALTH_FLUSH_S', '2'))
+_MIRROR_EWMA_ALPHA = 0.3
+_health_lock = threading.Lock()
+_health_pending: List[tuple] = []
+_health_flusher: Optional[threading.Thread] = None
+_race_pool: Optional[ThreadPoolExecutor] = None
+
+def _mirror_health_file_load() -> Dict[str, Any]:
+    try:
+        with open(MIRROR_HEALTH_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+def _mirror_health_apply(data: Dict[str, Any], samples: List[tuple]) -> Dict[str, Any]:
+    for mirror, ok, latency, ts in samples:
+        h = data.get(mirror) if isinstance(data.get(mirror), dict) else {}
+        h['ok'] = h.get('ok', 0) + (1 if ok else 0)
+        h['fail'] = h.get('fail', 0) + (0 if ok else 1)
+        if ok:
+            prev = h.get('latency')
+            h['latency'] = round(latency if prev is None else
+                                 prev + _MIRROR_EWMA_ALPHA * (latency - prev), 3)
+            h['fails_in_row'] = 0
+        else:
+            h['fails_in_row'] = h.get('fails_in_row', 0) + 1
+            h['last_fail'] = ts
+        data[mirror] = h
+    return data
+
+def _mirror_health_load() -> Dict[str, Any]:
+    """Stato su file piu' i campioni non ancora scritti da questo processo."""
+    with _health_lock:
+        pending = list(_health_pending)
+    return _mirror_health_apply(_mirror_health_file_load(), pending)
+
+def _mirror_health_flush():
+    with _health_lock:
+        pending = list(_health_pending)
+        del _health_pending[:]
+    if not pending:
+        return
+    try:
+        with open(MIRROR_HEALTH_PATH + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = _mirror_health_apply(_mirror_health_file_load(), pending)
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(MIRROR_HEALTH_PATH) + '.',
+                                       suffix='.tmp', dir=os.path.dirname(MIRROR_HEALTH_PATH) or '.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp, MIRROR_HEALTH_PATH)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                raise
+    except Exception as e:
+        print(f"[DEBUG] Errore salvataggio salute mirror: {e}", file=sys.stderr)
+
+def _mirror_health_flush_loop():
+    while True:
+        time.sleep(MIRROR_HEALTH_FLUSH_S)
+        _mirror_health_flush()
+
+def _mirror_record(mirror: str, ok: bool, latency: float):
+    global _health_flusher
+    with _health_lock:
+        _health_pending.append((mirror, ok, latency, time.time()))
+        if _health_flusher is None:
+            _health_flusher = threading.Thread(target=_mirror_health_flush_loop,
+                                               name='vavoo-mirror-health', daemon=True)
+            _health_flusher.start()
+            atexit.register(_mirror_health_flush)
+
+def _mirror_order() -> List[str]:
+    """Mirror sani prima (latenza EWMA crescente), quelli in cooldown in coda.
+    A parita' (nessun dato) resta l'ordine configurato."""
+    data = _mirror_health_load()
+    now = time.time()
+
+    def key(item):
+        pos, mirror = item
+        h = data.get(mirror) if isinstance(data.get(mirror), dict) else {}
+        cooling = (h.get('fails_in_row', 0) >= MIRROR_FAIL_LIMIT
+                   and now - h.get('last_fail', 0) < MIRROR_COOLDOWN)
+        return (cooling, h.get('latency', MIRROR_HEDGE_DELAY), pos)
+    return [m for _, m in sorted(enumerate(VAVOO_MIRRORS), key=key)]
+
+def mirrors_health() -> Dict[str, Any]:
+    data = _mirror_health_load()
+    return {'ok': True, 'order': _mirror_order(),
+            'mirrors': {m: data.get(m, {}) for m in VAVOO_MIRRORS}}
+
+def _mirror_attempt(mirror: str, path: str, data: Dict[str, Any], headers: Dict[str, str], timeout: int,
+                    decided: threading.Event):
+    started = time.time()
+    try:
+        resp = _signed_post(f"https://{mirror}{path}", data, headers, timeout, session=_http_raced())
+    except Exception:
+        if not decided.is_set():
+            _mirror_record(mirror, False, time.time() - started)
+        raise
+    # 5xx = mirror in difficolta'; firma mancante (None) non dipende dal mirror.
+    # Gamba arrivata dopo il vincitore: nessun campione.
+    if resp is not None and not decided.is_set():
+        _mirror_record(mirror, resp.status_code < 500, time.time() - started)
+    return resp
+
+def _raced_post(path: str, data: Dict[str, Any], headers: Dict[str, str], timeout: int = 10):
+    """POST firmata sui mirror con hedging: ritorna la prima risposta < 500,
+    altrimenti l'ultima risposta (o rilancia l'ultimo errore)."""
+    order = _mirror_order()
+    if len(order) <= 1:
+        return _signed_post(f"https://{order[0] if order else VAVOO_DOMAIN}{path}", data, headers, timeout)
+    global _race_pool
+    with _health_lock:
+        if _race_pool is None:
+            _race_pool = ThreadPoolExecutor(max_workers=4 * len(order), thread_name_prefix='vavoo-race')
+    pending = set()
+    # Settato appena la gara e' decisa: le gambe ancora in volo non
+    # registrano campioni di salute.
+    decided = threading.Event()
+    try:
+        last_resp, last_exc = None, None
+        deadline = time.time() + timeout
+        remaining = list(order)
+        while remaining or pending:
+            if remaining:
+                pending.add(_race_pool.submit(_mirror_attempt, remaining.pop(0), path, data, headers,
+                                              timeout, decided))
+            # Senza altri mirror da lanciare si aspetta fino al timeout complessivo.
+            wait_for = MIRROR_HEDGE_DELAY if remaining else max(0.0, deadline - time.time())
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    resp = fut.result()
+                except Exception as e:
+                    last_exc = e
+                    continue
+                if resp is None:
+                    return None
+                if resp.status_code < 500:
+                    return resp
+                last_resp = resp
+            if not remaining and not done and time.time() >= deadline:
+                break
+        if last_resp is not None:
+            return last_resp
+        if last_exc is not None:
+            raise last_exc
+        raise requests.exceptions.Timeout(f"no Vavoo mirror answered within {timeout}s")
+    finally:
+        decided.set()
+        # Le gambe ancora in coda non partono; quelle in volo finiscono da sole
+        # (nella CLI non si aspettano: vedi __main__).
+        for fut in pending:
+            fut.cancel()
+
+def _ping_signature():
     """Funzione che replica esattamente quella dell'addon utils.py"""
     headers = {
         "user-agent": "okhttp/4.11.0",
@@ -88,16 +435,58 @@ def getAuthSignature():
     }
     try:
         # Usa sempre il dominio ufficiale per la signature!
-        resp = requests.post("https://www.vavoo.tv/api/app/ping", json=data, headers=headers, timeout=10)
+        resp = _http().post("https://www.vavoo.tv/api/app/ping", json=data, headers=headers, timeout=10)
         resp.raise_for_status()
         return resp.json().get("addonSig")
     except Exception as e:
         print(f"Errore nel recupero della signature: {e}", file=sys.stderr)
         return None
 
-def get_channels() -> List[Dict[str, Any]]:
-    signature = getAuthSignature()
-    if not signature:
+# Gruppi del catalogo da scaricare (env VAVOO_GROUPS, separati da virgola).
+# I gruppi sono scaricati in parallelo; dentro un gruppo la paginazione resta
+# seriale perche' ogni pagina da' il nextCursor della successiva.
+CATALOG_GROUPS = [g.strip() for g in os.environ.get('VAVOO_GROUPS', 'Italy').split(',') if g.strip()]
+CATALOG_WORKERS = int(os.environ.get('VAVOO_CATALOG_WORKERS', '4'))
+
+def _crawl_group(group: str, headers: Dict[str, str], on_page=None) -> List[Dict[str, Any]]:
+    items_out: List[Dict[str, Any]] = []
+    cursor = 0
+    while True:
+        data = {
+            "language": "de",
+            "region": "AT",
+            "catalogId": "iptv",
+            "id": "iptv",
+            "adult": False,
+            "search": "",
+            "sort": "name",
+            "filter": {"group": group},
+            "cursor": cursor,
+            "clientVersion": "3.0.2"
+        }
+        try:
+            resp = _signed_post(f"https://{VAVOO_DOMAIN}/mediahubmx-catalog.json", data, headers)
+            if resp is None:
+                print("[DEBUG] Failed to get signature for channels", file=sys.stderr)
+                break
+            resp.raise_for_status()
+            r = resp.json()
+            items = r.get("items", [])
+            items_out.extend(items)
+            if on_page and items:
+                on_page(group, items)
+            cursor = r.get("nextCursor")
+            if not cursor:
+                break
+        except Exception as e:
+            print(f"[DEBUG] Error getting channels ({group}): {e}", file=sys.stderr)
+            break
+    return items_out
+
+def get_channels(groups: Optional[List[str]] = None, on_page=None) -> List[Dict[str, Any]]:
+    """Canali di tutti i gruppi, nell'ordine dei gruppi. on_page(group, items)
+    viene chiamato (serializzato) per ogni pagina appena arriva."""
+    if not getAuthSignature():
         print("[DEBUG] Failed to get signature for channels", file=sys.stderr)
         return []
     
@@ -105,44 +494,30 @@ def get_channels() -> List[Dict[str, Any]]:
         "user-agent": "okhttp/4.11.0",
         "accept": "application/json",
         "content-type": "application/json; charset=utf-8",
-        "accept-encoding": "gzip",
-        "mediahubmx-signature": signature
+        "accept-encoding": "gzip"
     }
-    all_channels = []
-    # Lista dei gruppi da controllare per i canali TV
-    groups = ["Italy"]
-    for group in groups:
-        cursor = 0
-        while True:
-            data = {
-                "language": "de",
-                "region": "AT",
-                "catalogId": "iptv",
-                "id": "iptv",
-                "adult": False,
-                "search": "",
-                "sort": "name",
-                "filter": {"group": group},
-                "cursor": cursor,
-                "clientVersion": "3.0.2"
-            }
-            try:
-                resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-catalog.json", json=data, headers=headers, timeout=10)
-                resp.raise_for_status()
-                r = resp.json()
-                items = r.get("items", [])
-                all_channels.extend(items)
-                cursor = r.get("nextCursor")
-                if not cursor:
-                    break
-            except Exception as e:
-                print(f"[DEBUG] Error getting channels: {e}", file=sys.stderr)
-                break
+    groups = groups or CATALOG_GROUPS
+    page_cb = None
+    if on_page:
+        page_lock = threading.Lock()
+
+        def page_cb(group, items):
+            with page_lock:
+                on_page(group, items)
+    if len(groups) == 1:
+        return _crawl_group(groups[0], headers, page_cb)
+    with ThreadPoolExecutor(max_workers=max(1, min(CATALOG_WORKERS, len(groups)))) as pool:
+        results = list(pool.map(lambda g: _crawl_group(g, headers, page_cb), groups))
+    all_channels: List[Dict[str, Any]] = []
+    for items in results:
+        all_channels.extend(items)
     return all_channels
 
 # ---------------------- CACHE HELPERS (UNIFICATA) ----------------------
 CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 UNIFIED_CACHE_PATH = os.path.join(CACHE_DIR, 'vavoo_cache.json')  # unico file usato da addon.ts
+# Ultime differenze scritte (added/removed/changed) per chi aggiorna in memoria.
+UNIFIED_MANIFEST_PATH = os.path.join(CACHE_DIR, 'vavoo_cache.manifest.json')
 
 def ensure_cache_dir():
     try:
@@ -150,35 +525,246 @@ def ensure_cache_dir():
     except Exception:
         pass
 
-def load_unified_cache() -> Dict[str, str]:
+# Eta' massima della cache per le lookup per nome: oltre, si riscarica il catalogo.
+UNIFIED_CACHE_MAX_AGE = int(os.environ.get('VAVOO_CACHE_MAX_AGE', str(12 * 3600)))
+
+def load_unified_cache_ts() -> tuple:
+    """(links, timestamp_ms) della cache unificata; ({}, 0) se assente."""
     try:
         if os.path.exists(UNIFIED_CACHE_PATH):
             with open(UNIFIED_CACHE_PATH, encoding='utf-8') as f:
                 data = json.load(f)
             links = data.get('links') if isinstance(data, dict) else {}
             if isinstance(links, dict):
-                return {k: v for k, v in links.items() if isinstance(v, str)}
+                ts = data.get('timestamp')
+                return ({k: v for k, v in links.items() if isinstance(v, str)},
+                        ts if isinstance(ts, (int, float)) else 0)
+    except Exception:
+        pass
+    return {}, 0
+
+def load_unified_cache() -> Dict[str, str]:
+    return load_unified_cache_ts()[0]
+
+def unified_cache_fresh(cache_ts: float) -> bool:
+    """True se il catalogo e' stato scaricato da meno di UNIFIED_CACHE_MAX_AGE.
+    Un rebuild senza differenze non riscrive il file ma ne aggiorna l'mtime."""
+    try:
+        checked = max(cache_ts / 1000, os.path.getmtime(UNIFIED_CACHE_PATH))
+    except OSError:
+        checked = cache_ts / 1000
+    return time.time() - checked < UNIFIED_CACHE_MAX_AGE
+
+def _links_hash(links_map: Dict[str, str]) -> str:
+    raw = json.dumps(links_map, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _unified_cache_hash() -> tuple:
+    """(hash, links) della cache su disco; hash '' se assente. I file scritti
+    da addon.ts non hanno 'hash': lo si ricalcola dai link."""
+    try:
+        with open(UNIFIED_CACHE_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        links = data.get('links') if isinstance(data, dict) else None
+        if isinstance(links, dict):
+            return data.get('hash') or _links_hash(links), links
     except Exception:
         pass
-    return {}
+    return '', {}
 
-def save_unified_cache(links_map: Dict[str, str]):
+def save_unified_cache(links_map: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Scrive la cache (JSON compatto) solo se il contenuto e' cambiato.
+    Ritorna il manifest delle differenze, None se invariata o in errore."""
     try:
         ensure_cache_dir()
+        new_hash = _links_hash(links_map)
+        old_hash, old_links = _unified_cache_hash()
+        if new_hash == old_hash:
+            os.utime(UNIFIED_CACHE_PATH, None)
+            print("[DEBUG] Cache unificata invariata, nessuna scrittura", file=sys.stderr)
+            return None
         payload = {
-            'timestamp': int(__import__('time').time() * 1000),
+            'timestamp': int(time.time() * 1000),
+            'hash': new_hash,
             'links': links_map
         }
         tmp = UNIFIED_CACHE_PATH + '.tmp'
         with open(tmp, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
         os.replace(tmp, UNIFIED_CACHE_PATH)
+        save_name_index(build_name_index([{'name': k, 'url': v} for k, v in links_map.items()],
+                                         payload['timestamp']))
+        manifest = {
+            'timestamp': payload['timestamp'],
+            'hash': new_hash,
+            'prev_hash': old_hash,
+            'added': sorted(k for k in links_map if k not in old_links),
+            'removed': sorted(k for k in old_links if k not in links_map),
+            'changed': sorted(k for k, v in links_map.items() if k in old_links and old_links[k] != v),
+        }
+        tmp = UNIFIED_MANIFEST_PATH + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, UNIFIED_MANIFEST_PATH)
+        print(f"[DEBUG] Cache unificata aggiornata: +{len(manifest['added'])} "
+              f"-{len(manifest['removed'])} ~{len(manifest['changed'])}", file=sys.stderr)
+        return manifest
     except Exception as e:
         print(f"[DEBUG] Errore salvataggio cache unificata: {e}", file=sys.stderr)
+        return None
 
-def resolve_vavoo_link(link):
-    signature = getAuthSignature()
-    if not signature:
+# ---------------------- CACHE URL RISOLTI ----------------------
+# Durante un evento molti utenti aprono lo stesso canale: il link Vavoo
+# risolto (URL firmato) viene salvato per link con TTL letto dai parametri di
+# scadenza dell'URL (timestamp in chiaro o dentro un token base64/JSON), meno
+# un margine; se non c'e' nulla si usa RESOLVED_TTL. File condiviso tra
+# processi, tenuto anche in memoria e riletto solo quando cambia (mtime/size/
+# inode); un flock per link fa si' che i caller concorrenti aspettino la
+# resolve in corso invece di lanciarne un'altra (single-flight). Il file di
+# lock viene rimosso da chi lo detiene a resolve finita.
+RESOLVED_CACHE_PATH = os.environ.get('VAVOO_RESOLVED_CACHE_PATH', '/tmp/vavoo_resolved_cache.json')
+RESOLVED_LOCK_DIR = os.environ.get('VAVOO_RESOLVED_LOCK_DIR', '/tmp/vavoo_resolve_locks')
+RESOLVED_TTL = int(os.environ.get('VAVOO_RESOLVED_TTL', '300'))
+RESOLVED_MAX_TTL = int(os.environ.get('VAVOO_RESOLVED_MAX_TTL', '3600'))
+RESOLVED_MARGIN = int(os.environ.get('VAVOO_RESOLVED_MARGIN', '60'))
+_resolved_mem: Dict[str, Any] = {'stamp': None, 'data': {}}
+_resolved_mem_lock = threading.Lock()
+_EXPIRY_KEYS = ('e', 'exp', 'expires', 'expiry', 'expire', 'expiration', 'validuntil', 'valid_until', 'deadline')
+
+def _expiry_from_value(key: str, value: str) -> Optional[float]:
+    if key.lower() in _EXPIRY_KEYS and re.fullmatch(r'\d{10}(?:\d{3})?', value):
+        return int(value) / (1000 if len(value) == 13 else 1)
+    # Token firmati tipo base64(JSON) con un campo di scadenza.
+    if len(value) >= 16:
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            data = json.loads(raw.decode('utf-8'))
+        except Exception:
+            return None
+        if isinstance(data, dict):
+            for k, v in data.items():
+                ts = _expiry_from_value(k, str(v)) if isinstance(v, (int, str)) else None
+                if ts:
+                    return ts
+    return None
+
+def _resolved_ttl(url: str) -> float:
+    now = time.time()
+    try:
+        params = urllib.parse.parse_qsl(urllib.parse.urlparse(url).query, keep_blank_values=True)
+    except Exception:
+        params = []
+    for key, value in params:
+        ts = _expiry_from_value(key, value)
+        if ts and ts > now:
+            return max(0, min(ts - now - RESOLVED_MARGIN, RESOLVED_MAX_TTL))
+    return RESOLVED_TTL
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _resolved_cache_load() -> Dict[str, Any]:
+    """Contenuto del file (sola lettura): riparsato solo se il file e' cambiato."""
+    stamp = _file_stamp(RESOLVED_CACHE_PATH)
+    with _resolved_mem_lock:
+        if stamp is not None and stamp == _resolved_mem['stamp']:
+            return _resolved_mem['data']
+    try:
+        with open(RESOLVED_CACHE_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        data = data if isinstance(data, dict) else {}
+    except Exception:
+        data = {}
+    with _resolved_mem_lock:
+        _resolved_mem['stamp'], _resolved_mem['data'] = stamp, data
+    return data
+
+def _resolved_cache_get(link: str, min_left: float = 0) -> Optional[str]:
+    """URL in cache se valido ancora per almeno min_left secondi."""
+    entry = _resolved_cache_load().get(link)
+    if isinstance(entry, dict) and entry.get('expires', 0) > time.time() + min_left:
+        return entry.get('url')
+    return None
+
+def _resolved_cache_put(link: str, url: str):
+    ttl = _resolved_ttl(url)
+    if ttl <= 0:
+        return
+    try:
+        with open(RESOLVED_CACHE_PATH + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            now = time.time()
+            data = {k: v for k, v in _resolved_cache_load().items()
+                    if isinstance(v, dict) and v.get('expires', 0) > now}
+            data[link] = {'url': url, 'expires': now + ttl}
+            tmp = f"{RESOLVED_CACHE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, RESOLVED_CACHE_PATH)
+            with _resolved_mem_lock:
+                _resolved_mem['stamp'], _resolved_mem['data'] = _file_stamp(RESOLVED_CACHE_PATH), data
+    except Exception as e:
+        print(f"[DEBUG] Errore salvataggio cache resolve: {e}", file=sys.stderr)
+
+def _link_lock_acquire(path: str):
+    """flock esclusivo su path. Se nel frattempo il detentore precedente ha
+    rimosso il file, il lock preso e' su un inode orfano: si riapre e riprova."""
+    while True:
+        lock = open(path, 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino:
+                return lock
+        except FileNotFoundError:
+            pass
+        except Exception:
+            lock.close()
+            raise
+        lock.close()
+
+def _resolve_cached(link: str, resolver, refresh_within: float = 0):
+    """refresh_within > 0 (pre-warm): risolve di nuovo se la voce scade entro
+    refresh_within secondi; intanto gli altri caller continuano a usarla."""
+    cached = _resolved_cache_get(link, refresh_within)
+    if cached:
+        print("[DEBUG] Resolved URL from cache", file=sys.stderr)
+        return cached
+    lock = None
+    lock_path = os.path.join(RESOLVED_LOCK_DIR, hashlib.sha1(link.encode('utf-8')).hexdigest() + '.lock')
+    try:
+        os.makedirs(RESOLVED_LOCK_DIR, exist_ok=True)
+        lock = _link_lock_acquire(lock_path)
+    except Exception:
+        pass
+    try:
+        # Un altro caller puo' aver risolto lo stesso link mentre aspettavamo.
+        cached = _resolved_cache_get(link, refresh_within)
+        if cached:
+            print("[DEBUG] Resolved URL from cache (in-flight)", file=sys.stderr)
+            return cached
+        url = resolver(link)
+        if url:
+            _resolved_cache_put(link, url)
+        return url
+    finally:
+        if lock:
+            # Rimosso mentre si detiene il lock: chi aspetta se ne accorge
+            # in _link_lock_acquire e rilegge la cache.
+            try:
+                os.unlink(lock_path)
+            except OSError:
+                pass
+            lock.close()
+
+def resolve_vavoo_link(link, refresh_within: float = 0):
+    return _resolve_cached(link, _resolve_vavoo_link_uncached, refresh_within)
+
+def _resolve_vavoo_link_uncached(link):
+    if not getAuthSignature():
         print("[DEBUG] Failed to get signature for resolution", file=sys.stderr)
         return None
         
@@ -187,8 +773,7 @@ def resolve_vavoo_link(link):
         "accept": "application/json",
         "content-type": "application/json; charset=utf-8",
         "content-length": "115",
-        "accept-encoding": "gzip",
-        "mediahubmx-signature": signature
+        "accept-encoding": "gzip"
     }
     data = {
         "language": "de",
@@ -197,7 +782,10 @@ def resolve_vavoo_link(link):
         "clientVersion": "3.0.2"
     }
     try:
-        resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-resolve.json", json=data, headers=headers, timeout=10)
+        resp = _raced_post("/mediahubmx-resolve.json", data, headers)
+        if resp is None:
+            print("[DEBUG] Failed to get signature for resolution", file=sys.stderr)
+            return None
         resp.raise_for_status()
         result = resp.json()
         if isinstance(result, list) and result and result[0].get("url"):
@@ -222,9 +810,10 @@ def resolve_direct_link(link):
     if not "vavoo" in link:
         print("[DEBUG] Il link non sembra essere un link Vavoo", file=sys.stderr)
         return None
-        
-    signature = getAuthSignature()
-    if not signature:
+    return _resolve_cached(link, _resolve_direct_link_uncached)
+
+def _resolve_direct_link_uncached(link):
+    if not getAuthSignature():
         print("[DEBUG] Failed to get signature for direct resolution", file=sys.stderr)
         return None
         
@@ -233,8 +822,7 @@ def resolve_direct_link(link):
         "accept": "application/json",
         "content-type": "application/json; charset=utf-8",
         "content-length": "115",
-        "accept-encoding": "gzip",
-        "mediahubmx-signature": signature
+        "accept-encoding": "gzip"
     }
     data = {
         "language": "de",
@@ -243,7 +831,10 @@ def resolve_direct_link(link):
         "clientVersion": "3.0.2"
     }
     try:
-        resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-resolve.json", json=data, headers=headers, timeout=10)
+        resp = _raced_post("/mediahubmx-resolve.json", data, headers)
+        if resp is None:
+            print("[DEBUG] Failed to get signature for resolution", file=sys.stderr)
+            return None
         resp.raise_for_status()
         result = resp.json()
         
@@ -260,6 +851,172 @@ def resolve_direct_link(link):
         print(f"[DEBUG] Error in direct resolution: {e}", file=sys.stderr)
         return None
 
+# ---------------------- INDICE NOMI (MULTI-LIVELLO) ----------------------
+# Stesse regole del vecchio matching a tre passate (esatto, parziale sul nome
+# ripulito, parziale solo alfanumerico; vince il primo canale in ordine di
+# catalogo), ma con mappe precalcolate: nome normalizzato -> indice, nome
+# ripulito/alfanumerico -> indici. Su disco (accanto a vavoo_cache.json,
+# ricostruito quando cambia il timestamp della cache) vanno solo queste mappe;
+# l'indice caricato resta in memoria (nel sidecar tra una richiesta e l'altra)
+# insieme alle strutture derivate per i match parziali, costruite al primo
+# uso: trigrammi -> indici per "wanted contenuto nel nome", primi
+# _NAME_PREFIX_LEN caratteri -> lunghezze dei nomi con quel prefisso, per
+# "nome contenuto in wanted".
+NAME_INDEX_PATH = os.path.join(CACHE_DIR, 'vavoo_name_index.json')
+NAME_INDEX_VERSION = 2
+_name_index_mem: Dict[str, Any] = {'source_ts': None, 'index': None}
+_name_index_lock = threading.Lock()
+_NAME_PREFIX_LEN = 6
+
+def _clean_name(name: str) -> str:
+    clean = re.sub(r'\s+\.[a-zA-Z]$', '', name.strip().upper())
+    return re.sub(r'\s+(HD|FHD|4K)$', '', clean)
+
+def _simple_name(name: str) -> str:
+    return re.sub(r'[^A-Z0-9]', '', name.strip().upper())
+
+def _trigrams(s: str) -> set:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+def build_name_index(channels: List[Dict[str, Any]], source_ts: int = 0) -> Dict[str, Any]:
+    names: List[str] = []
+    urls: List[str] = []
+    exact: Dict[str, int] = {}
+    tiers: Dict[str, Dict[str, List[int]]] = {'clean': {}, 'simple': {}}
+    for ch in channels:
+        name = str(ch.get('name', '') or '')
+        idx = len(names)
+        names.append(name)
+        urls.append(str(ch.get('url') or ''))
+        exact.setdefault(normalize_vavoo_name(name), idx)
+        tiers['clean'].setdefault(_clean_name(name), []).append(idx)
+        tiers['simple'].setdefault(_simple_name(name), []).append(idx)
+    return {'version': NAME_INDEX_VERSION, 'source_ts': source_ts, 'names': names, 'urls': urls,
+            'exact': exact, 'clean': tiers['clean'], 'simple': tiers['simple']}
+
+def _tier_aux(index: Dict[str, Any], tier: str) -> Dict[str, Any]:
+    """Strutture derivate (solo in memoria) per i match parziali di un livello."""
+    aux = index.get('_aux_' + tier)
+    if aux is not None:
+        return aux
+    grams: Dict[str, set] = {}
+    prefix: Dict[str, set] = {}
+    short: set = set()
+    for key, ids in index[tier].items():
+        for g in _trigrams(key):
+            grams.setdefault(g, set()).add(ids[0])
+        if len(key) >= _NAME_PREFIX_LEN:
+            prefix.setdefault(key[:_NAME_PREFIX_LEN], set()).add(len(key))
+        else:
+            short.add(key)
+    aux = {'grams': grams, 'prefix': prefix, 'short': short}
+    index['_aux_' + tier] = aux
+    return aux
+
+def save_name_index(index: Dict[str, Any]):
+    try:
+        ensure_cache_dir()
+        tmp = f"{NAME_INDEX_PATH}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in index.items() if not k.startswith('_')}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, NAME_INDEX_PATH)
+    except Exception as e:
+        print(f"[DEBUG] Errore salvataggio indice nomi: {e}", file=sys.stderr)
+    with _name_index_lock:
+        _name_index_mem['source_ts'], _name_index_mem['index'] = index.get('source_ts'), index
+
+def load_name_index(links: Dict[str, str], source_ts: int) -> Dict[str, Any]:
+    """Indice in memoria se allineato alla cache, poi quello persistito,
+    altrimenti ricostruito e salvato."""
+    with _name_index_lock:
+        index = _name_index_mem['index']
+        if (index is not None and _name_index_mem['source_ts'] == source_ts
+                and len(index['names']) == len(links)):
+            return index
+    index = None
+    try:
+        with open(NAME_INDEX_PATH, encoding='utf-8') as f:
+            index = json.load(f)
+        if not (index.get('version') == NAME_INDEX_VERSION and index.get('source_ts') == source_ts
+                and len(index.get('names') or []) == len(links)):
+            index = None
+    except Exception:
+        index = None
+    if index is None:
+        index = build_name_index([{'name': k, 'url': v} for k, v in links.items()], source_ts)
+        save_name_index(index)
+    with _name_index_lock:
+        _name_index_mem['source_ts'], _name_index_mem['index'] = source_ts, index
+    return index
+
+def _substring_match(index: Dict[str, Any], tier: str, wanted: str) -> Optional[int]:
+    """Primo indice con key in wanted oppure wanted in key."""
+    keys: Dict[str, List[int]] = index[tier]
+    aux = _tier_aux(index, tier)
+    best: Optional[int] = None
+
+    def take(key):
+        nonlocal best
+        ids = keys.get(key)
+        if ids and (best is None or ids[0] < best):
+            best = ids[0]
+    # key contenuta in wanted: per ogni posizione i nomi corti (lookup diretto
+    # delle sottostringhe brevi) e quelli lunghi con lo stesso prefisso, invece
+    # di tutte le O(L^2) sottostringhe di wanted.
+    prefix, short = aux['prefix'], aux['short']
+    for i in range(len(wanted) + 1):
+        for n in range(min(_NAME_PREFIX_LEN, len(wanted) - i + 1)):
+            if wanted[i:i + n] in short:
+                take(wanted[i:i + n])
+        for n in prefix.get(wanted[i:i + _NAME_PREFIX_LEN], ()):
+            if i + n <= len(wanted):
+                take(wanted[i:i + n])
+    # wanted contenuto in key: candidati dall'intersezione dei trigrammi.
+    if len(wanted) >= 3:
+        postings = [aux['grams'].get(g) for g in _trigrams(wanted)]
+        cand: set = set()
+        if all(postings):
+            postings.sort(key=len)
+            cand = set(postings[0])
+            for ids in postings[1:]:
+                cand &= ids
+                if not cand:
+                    break
+        names = index['names']
+        key_fn = _clean_name if tier == 'clean' else _simple_name
+        for idx in sorted(cand or ()):
+            if best is not None and idx >= best:
+                break
+            if wanted in key_fn(names[idx]):
+                best = idx
+                break
+    else:
+        for key, ids in keys.items():
+            if wanted in key and (best is None or ids[0] < best):
+                best = ids[0]
+    return best
+
+def lookup_channel(index: Dict[str, Any], wanted: str) -> Optional[Dict[str, Any]]:
+    """Match nome canale: esatto, poi parziale, poi solo alfanumerico."""
+    names, urls = index['names'], index['urls']
+    idx = index['exact'].get(wanted)
+    if idx is not None:
+        print(f"[DEBUG] Found exact match: {names[idx]}", file=sys.stderr)
+        return {'name': names[idx], 'url': urls[idx]}
+    idx = _substring_match(index, 'clean', wanted)
+    if idx is not None:
+        print(f"[DEBUG] Found partial match: {names[idx]} (cleaned: {_clean_name(names[idx])})", file=sys.stderr)
+        return {'name': names[idx], 'url': urls[idx]}
+    idx = _substring_match(index, 'simple', re.sub(r'[^A-Z0-9]', '', wanted))
+    if idx is not None:
+        print(f"[DEBUG] Found flexible match: {names[idx]} (simplified: {_simple_name(names[idx])})", file=sys.stderr)
+        return {'name': names[idx], 'url': urls[idx]}
+    return None
+
+def find_channel(channels: List[Dict[str, Any]], wanted: str) -> Optional[Dict[str, Any]]:
+    return lookup_channel(build_name_index(channels), wanted)
+
 def build_vavoo_cache(channels: List[Dict[str, Any]]) -> Dict[str, str]:
     cache: Dict[str, str] = {}
     for ch in channels:
@@ -286,6 +1043,95 @@ def mostra_debug_cache():
     except Exception as e:
         return f"Errore nella lettura della cache: {e}"
 
+# ---------------------- PRE-WARM EVENTI ----------------------
+# Live.py scrive gli eventi (DYNAMIC_FILE) con eventStart e i canali
+# vavoo://<alias>. Poco prima del calcio d'inizio i canali vengono risolti
+# e, finche' l'evento e' in corso, rinnovati prima della scadenza: chi apre
+# lo stream trova la cache degli URL risolti gia' calda.
+PREWARM_EVENTS_PATH = os.environ.get('DYNAMIC_FILE') or '/tmp/dynamic_channels.json'
+PREWARM_LEAD = int(os.environ.get('VAVOO_PREWARM_LEAD', '600'))
+PREWARM_LIVE_WINDOW = int(os.environ.get('VAVOO_PREWARM_LIVE_WINDOW', str(3 * 3600)))
+PREWARM_REFRESH_BEFORE = int(os.environ.get('VAVOO_PREWARM_REFRESH_BEFORE', '90'))
+PREWARM_INTERVAL = int(os.environ.get('VAVOO_PREWARM_INTERVAL', '60'))
+PREWARM_WORKERS = int(os.environ.get('VAVOO_PREWARM_WORKERS', '4'))
+
+def _event_start_ts(value: Any) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except Exception:
+        return None
+
+def prewarm_aliases(events: List[Dict[str, Any]], now: Optional[float] = None) -> List[str]:
+    """Alias vavoo:// degli eventi che iniziano entro PREWARM_LEAD o sono in corso."""
+    now = time.time() if now is None else now
+    aliases: List[str] = []
+    for ev in events:
+        if not isinstance(ev, dict):
+            continue
+        start = _event_start_ts(ev.get('eventStart'))
+        if start is None or not (start - PREWARM_LEAD <= now <= start + PREWARM_LIVE_WINDOW):
+            continue
+        for st in ev.get('streams') or []:
+            url = str(st.get('url', '')) if isinstance(st, dict) else ''
+            if url.startswith('vavoo://'):
+                alias = url[len('vavoo://'):].strip()
+                if alias and alias not in aliases:
+                    aliases.append(alias)
+    return aliases
+
+def prewarm_once(events_path: str = PREWARM_EVENTS_PATH) -> Dict[str, Any]:
+    """Un giro di pre-warm; solo cache unificata, niente crawl del catalogo."""
+    try:
+        with open(events_path, encoding='utf-8') as f:
+            events = json.load(f)
+    except Exception as e:
+        return {'ok': False, 'error': f'events: {e}'}
+    aliases = prewarm_aliases(events if isinstance(events, list) else [])
+    if not aliases:
+        return {'ok': True, 'aliases': 0, 'resolved': 0, 'missing': []}
+    links, ts = load_unified_cache_ts()
+    if not links:
+        return {'ok': False, 'error': 'unified cache empty'}
+    index = load_name_index(links, ts)
+    targets: Dict[str, str] = {}
+    missing: List[str] = []
+    for alias in aliases:
+        found = lookup_channel(index, normalize_vavoo_name(alias))
+        if found and found.get('url'):
+            targets[alias] = found['url']
+        else:
+            missing.append(alias)
+
+    def warm(link):
+        try:
+            return bool(resolve_vavoo_link(link, refresh_within=PREWARM_REFRESH_BEFORE))
+        except Exception as e:
+            print(f"[DEBUG] Pre-warm error: {e}", file=sys.stderr)
+            return False
+    resolved = 0
+    if targets:
+        with ThreadPoolExecutor(max_workers=max(1, PREWARM_WORKERS)) as pool:
+            resolved = sum(pool.map(warm, set(targets.values())))
+    return {'ok': True, 'aliases': len(aliases), 'resolved': resolved, 'missing': missing}
+
+def prewarm_loop(events_path: str = PREWARM_EVENTS_PATH, stop: Optional[threading.Event] = None):
+    """Pre-warm ogni PREWARM_INTERVAL secondi (thread del sidecar)."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        out = prewarm_once(events_path)
+        if not out.get('ok') or out.get('resolved'):
+            print(f"[DEBUG] Pre-warm: {json.dumps(out)}", file=sys.stderr, flush=True)
+        stop.wait(PREWARM_INTERVAL)
+
+# Refresh della signature lanciato in background da _spawn_sig_refresh().
+if "--refresh-sig" in sys.argv:
+    getAuthSignature(force=True)
+    try:
+        os.unlink(SIG_CACHE_PATH + '.refreshing')
+    except Exception:
+        pass
+    sys.exit(0)
+
 # Esegui con: python3 vavoo_resolver.py --build-cache
 if "--build-cache" in sys.argv:
     channels = get_channels()
@@ -295,133 +1141,142 @@ if "--build-cache" in sys.argv:
     print("Cache Vavoo generata con successo (unificata)!")
     sys.exit(0)
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python3 vavoo_resolver.py <channel_name_or_vavoo_link> [--original-link] [--dump-channels]", file=sys.stderr)
-        sys.exit(1)
+def dump_entry(ch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Canale nel formato atteso da addon.ts (usa 'links'); None se incompleto."""
+    name = ch.get('name')
+    url = ch.get('url')
+    if not name or not url:
+        return None
+    return {
+        'name': name,
+        'url': url,
+        # addon.ts si aspetta 'links' (string o array) -> forniamo array per estendere futura multi-variante
+        'links': [url],
+        # manteniamo anche eventuali alias generici
+        'aliases': [
+            str(name).replace(' HD', '').replace(' FHD', '').replace(' 4K', ''),
+            re.sub(r'\s+\.[a-zA-Z]$', '', str(name))
+        ]
+    }
+
+def cli_main(argv: List[str], emit=None) -> tuple:
+    """Logica CLI (anche per il sidecar): ritorna (exit_code, stdout, marker_stderr).
+    I log [DEBUG] restano su stderr. Con --ndjson ed emit, --dump-channels
+    passa a emit(riga) un canale per riga appena arriva ogni pagina."""
+    if not argv:
+        return 1, '', "Usage: python3 vavoo_resolver.py <channel_name_or_vavoo_link> [--original-link] [--dump-channels [--ndjson]] [--prewarm [events.json]] [--mirrors]"
+
+    # Stato dei mirror Vavoo (ordine corrente, latenza, errori)
+    if argv[0] == "--mirrors":
+        return 0, json.dumps(mirrors_health()), ''
+
+    # Un giro di pre-warm degli eventi imminenti/in corso (cron o debug)
+    if argv[0] == "--prewarm":
+        out = prewarm_once(argv[1] if len(argv) > 1 else PREWARM_EVENTS_PATH)
+        return (0 if out.get('ok') else 1), json.dumps(out), ''
     
     # Controllo se l'opzione per dump dei canali è presente
-    if "--dump-channels" in sys.argv:
+    if "--dump-channels" in argv:
+        ndjson = "--ndjson" in argv
+        lines: List[str] = []
+        emit_line = emit or lines.append
+
+        def on_page(_group, items):
+            for ch in items:
+                entry = dump_entry(ch)
+                if entry:
+                    emit_line(json.dumps(entry))
         # 1. Tenta di scaricare sempre (mantieni comportamento attuale)
-        channels = get_channels()
+        channels = get_channels(on_page=on_page if ndjson else None)
         # 2. Costruisci cache aggiornata e salvala (unificata)
         cache_map = build_vavoo_cache(channels)
         if cache_map:
             save_unified_cache(cache_map)
+        if ndjson:
+            return 0, '\n'.join(lines), ''
         # 3. Adatta output al formato atteso da addon.ts (usa 'links')
-        out = []
-        for ch in channels:
-            name = ch.get('name')
-            url = ch.get('url')
-            if not name or not url:
-                continue
-            out.append({
-                'name': name,
-                'url': url,
-                # addon.ts si aspetta 'links' (string o array) -> forniamo array per estendere futura multi-variante
-                'links': [url],
-                # manteniamo anche eventuali alias generici
-                'aliases': [
-                    str(name).replace(' HD', '').replace(' FHD', '').replace(' 4K', ''),
-                    re.sub(r'\s+\.[a-zA-Z]$', '', str(name))
-                ]
-            })
-        print(json.dumps(out))
-        sys.exit(0)
+        out = [e for e in (dump_entry(ch) for ch in channels) if e]
+        return 0, json.dumps(out), ''
         
-    input_arg = sys.argv[1]
-    return_original_link = "--original-link" in sys.argv
+    input_arg = argv[0]
+    return_original_link = "--original-link" in argv
     
     # Controlla se l'input è un link Vavoo diretto
     if "vavoo.to" in input_arg and "/play/" in input_arg:
         print(f"[DEBUG] Direct Vavoo link detected: {input_arg}", file=sys.stderr)
         resolved = resolve_direct_link(input_arg)
         if resolved:
-            print(resolved)  # Output per il caller
-            sys.exit(0)
+            return 0, resolved, ''  # Output per il caller
         else:
             print("[DEBUG] Failed to resolve direct link", file=sys.stderr)
-            print("RESOLVE_FAIL", file=sys.stderr)
-            sys.exit(4)
+            return 4, '', "RESOLVE_FAIL"
     
     # Altrimenti tratta come nome di canale
     wanted = normalize_vavoo_name(input_arg)
     print(f"[DEBUG] Looking for channel: {wanted}", file=sys.stderr)
     
     try:
-        channels = get_channels()
-        print(f"[DEBUG] Found {len(channels)} total channels", file=sys.stderr)
-        
+        # Prima la cache unificata (nome -> link) scritta da addon.ts/--build-cache:
+        # un click su un canale costa solo la resolve. Catalogo solo su miss o
+        # cache piu' vecchia di UNIFIED_CACHE_MAX_AGE.
         found = None
-        # Prima prova matching esatto
-        for ch in channels:
-            chname = normalize_vavoo_name(ch.get('name', ''))
-            if chname == wanted:
-                found = ch
-                print(f"[DEBUG] Found exact match: {ch.get('name')}", file=sys.stderr)
-                break
-        
-        # Se non trova matching esatto, prova matching parziale/fuzzy
+        channels: List[Dict[str, Any]] = []
+        cached_links, cache_ts = load_unified_cache_ts()
+        if cached_links and unified_cache_fresh(cache_ts):
+            found = lookup_channel(load_name_index(cached_links, cache_ts), wanted)
+            if found:
+                print(f"[DEBUG] Found in unified cache: {found.get('name')}", file=sys.stderr)
         if not found:
-            for ch in channels:
-                original_name = ch.get('name', '').strip().upper()
-                # Rimuovi suffissi comuni come .a, .b, .c, HD, etc.
-                clean_name = re.sub(r'\s+\.[a-zA-Z]$', '', original_name)
-                clean_name = re.sub(r'\s+(HD|FHD|4K)$', '', clean_name)
-                
-                # Controlla se il nome pulito contiene il nome cercato o viceversa
-                if wanted in clean_name or clean_name in wanted:
-                    found = ch
-                    print(f"[DEBUG] Found partial match: {ch.get('name')} (cleaned: {clean_name})", file=sys.stderr)
-                    break
-        
-        # Se ancora non trova, prova una ricerca ancora più flessibile
-        if not found:
-            for ch in channels:
-                original_name = ch.get('name', '').strip().upper()
-                # Rimuovi spazi e caratteri speciali per matching più flessibile
-                name_simple = re.sub(r'[^A-Z0-9]', '', original_name)
-                wanted_simple = re.sub(r'[^A-Z0-9]', '', wanted)
-                
-                if wanted_simple in name_simple or name_simple in wanted_simple:
-                    found = ch
-                    print(f"[DEBUG] Found flexible match: {ch.get('name')} (simplified: {name_simple})", file=sys.stderr)
-                    break
+            channels = get_channels()
+            print(f"[DEBUG] Found {len(channels)} total channels", file=sys.stderr)
+            if channels:
+                cache_map = build_vavoo_cache(channels)
+                if cache_map:
+                    save_unified_cache(cache_map)
+            found = find_channel(channels, wanted)
         
         if not found:
             print(f"[DEBUG] Channel '{wanted}' not found in {len(channels)} channels", file=sys.stderr)
             # Debug: mostra alcuni nomi di canali per aiutare
             sample_names = [normalize_vavoo_name(ch.get('name', '')) for ch in channels[:10]]
             print(f"[DEBUG] Sample channel names: {sample_names}", file=sys.stderr)
-            print("NOT_FOUND", file=sys.stderr)
-            sys.exit(2)
+            return 2, '', "NOT_FOUND"
             
         url = found.get('url')
         if not url:
             print("[DEBUG] No URL found for channel", file=sys.stderr)
-            print("NO_URL", file=sys.stderr)
-            sys.exit(3)
+            return 3, '', "NO_URL"
             
         print(f"[DEBUG] Found Vavoo URL: {url}", file=sys.stderr)
         
         # Se richiesto, restituisci solo il link originale Vavoo
         if return_original_link:
-            print(url)  # Restituisce il link Vavoo originale non risolto
-            sys.exit(0)
+            return 0, url, ''  # Restituisce il link Vavoo originale non risolto
         
         # Altrimenti risolvi il link
         print(f"[DEBUG] Resolving URL: {url}", file=sys.stderr)
         resolved = resolve_vavoo_link(url)
         if resolved:
-            print(resolved)  # Questo è l'output che viene letto
-            sys.exit(0)
+            return 0, resolved, ''  # Questo è l'output che viene letto
         else:
             print("[DEBUG] Failed to resolve URL", file=sys.stderr)
-            print("RESOLVE_FAIL", file=sys.stderr)
-            sys.exit(4)
+            return 4, '', "RESOLVE_FAIL"
             
     except Exception as e:
         print(f"[DEBUG] Exception: {str(e)}", file=sys.stderr)
-        print("ERROR", file=sys.stderr)
-        sys.exit(5) 
+        return 5, '', "ERROR"
+
+
+if __name__ == "__main__":
+    code, out, err = cli_main(sys.argv[1:], emit=lambda line: print(line, flush=True))
+    if out:
+        print(out)
+    if err:
+        print(err, file=sys.stderr)
+    # Uscita immediata: i worker del pool di racing non sono daemon e
+    # sys.exit aspetterebbe le gambe perdenti ancora in volo (fino al
+    # timeout), restituendo al caller la latenza risparmiata dal racing.
+    _mirror_health_flush()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)